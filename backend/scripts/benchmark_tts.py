@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the March 7th TTS engines
+Runs short, medium and long texts at several concurrency levels against
+offline stand-ins for Edge-TTS and SAPI (fed with the checked-in WAVs) and
+reports latency percentiles, real-time factor, throughput and peak memory
+per engine and per pipeline stage as JSON, so runs can be compared
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tts_profiling import peak_rss_mb
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Each text class is paired with a checked-in clip of similar length, which
+# the stand-ins return as the "synthesized" base speech
+TEXT_CASES = {
+    'short': (
+        "Hey there! It's me, March 7th!",
+        BACKEND_DIR / 'test_march7th.wav'
+    ),
+    'medium': (
+        "Oh, you're back! I was just taking some photos of the Astral Express. "
+        "Want to see? I think this one came out really well.",
+        BACKEND_DIR / 'test_march7th_rvc.wav'
+    ),
+    'long': (
+        "You won't believe what happened today! We stopped at this frozen little town, "
+        "and everything was covered in ice crystals that sparkled like stars. I took about "
+        "a hundred photos, but none of them really captured how pretty it was. Then Welt "
+        "started lecturing everyone about the history of the place, and Dan Heng just stood "
+        "there with his arms crossed like always. Anyway, I bought you a souvenir! It's a "
+        "tiny snow globe with the Express inside. Shake it and see what happens!",
+        BACKEND_DIR / 'test_march7th_enhanced.wav'
+    )
+}
+
+ENGINES = ('sapi', 'edge_enhanced', 'rvc')
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile of a non-empty list, q in [0, 100]."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def make_engine(name, audio_path, base_latency, work_dir, sessions, resources):
+    """
+    Build an engine whose base-speech step is replaced by an offline stand-in
+
+    Args:
+        sessions: Speech sessions kept warm for the SAPI engine
+        resources: ExitStack that closes the engine's sessions after the run
+
+    Returns:
+        (synthesize, is_async) where synthesize(text, output_path) runs one request
+    """
+    if name == 'sapi':
+        from march7th_tts import March7thTTS
+        from tts_speech import STUB_SCRIPT, SpeechSessionPool
+
+        # The SAPI session protocol, served from the checked-in WAV
+        speech = SpeechSessionPool([sys.executable, str(STUB_SCRIPT), '--audio', str(audio_path),
+                                    '--startup', '0', '--latency', str(base_latency)], size=sessions)
+        engine = March7thTTS('stand-in.pth', 'stand-in.index', speech=speech)
+        resources.callback(engine.close)
+        return (lambda text, output_path: engine.synthesize(text, output_path)), False
+
+    if name == 'edge_enhanced':
+        from edge_tts_stub import StubEdgeService
+        from march7th_enhanced_tts import March7thEnhancedTTS
+        from tts_edge import EdgeSpeechFetcher
+
+        service = StubEdgeService(audio_path=audio_path, latency=base_latency)
+        fetcher = EdgeSpeechFetcher(service.communicate, max_concurrency=64)
+        engine = March7thEnhancedTTS(fetcher=fetcher)
+
+        async def synthesize(text, output_path):
+            # Identical benchmark texts would be coalesced into one fetch; a
+            # per-request suffix keeps every request a real upstream call
+            return await engine.synthesize(f"{text} [{Path(output_path).stem}]", output_path)
+
+        return synthesize, True
+
+    if name == 'rvc':
+        from march7th_rvc_tts import March7thRVCTTS
+
+        try:
+            # A tiny random model exercises the real inference path
+            from make_test_rvc_model import write_test_model
+            model_path, index_path, _ = write_test_model(work_dir, 'stand-in')
+        except ImportError:
+            # Without torch the engine runs its DSP-only conversion
+            model_path = Path(work_dir) / 'stand-in.pth'
+            index_path = Path(work_dir) / 'stand-in.index'
+            model_path.touch()
+            index_path.touch()
+
+        class StandInRVC(March7thRVCTTS):
+            def text_to_speech_base(self, text):
+                time.sleep(base_latency)
+                with open(audio_path, 'rb') as f:
+                    return f.read()
+
+        engine = StandInRVC(model_path, index_path)
+        return (lambda text, output_path: engine.synthesize(text, output_path)), False
+
+    raise ValueError(f"Unknown engine: {name}")
+
+
+def run_requests(synthesize, is_async, text, concurrency, requests, out_dir):
+    """Issue `requests` calls with at most `concurrency` in flight; return per-request records."""
+    def timed_sync(index):
+        output_path = str(Path(out_dir) / f"req_{index:04d}.wav")
+        start = time.perf_counter()
+        result = synthesize(text, output_path)
+        return time.perf_counter() - start, result
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(index):
+            async with semaphore:
+                output_path = str(Path(out_dir) / f"req_{index:04d}.wav")
+                start = time.perf_counter()
+                result = await synthesize(text, output_path)
+                return time.perf_counter() - start, result
+
+        return await asyncio.gather(*(timed(index) for index in range(requests)))
+
+    start = time.perf_counter()
+    if is_async:
+        records = asyncio.run(run_async())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            records = list(pool.map(timed_sync, range(requests)))
+    return records, time.perf_counter() - start
+
+
+def summarize(engine, text_case, concurrency, records, wall):
+    ok = [(latency, result) for latency, result in records if result.get('success')]
+    summary = {
+        "engine": engine,
+        "text": text_case,
+        "concurrency": concurrency,
+        "requests": len(records),
+        "failures": len(records) - len(ok),
+        "wall": round(wall, 4)
+    }
+    if not ok:
+        summary["errors"] = sorted({result.get('error', '') for _, result in records})
+        return summary
+
+    latencies = [latency for latency, _ in ok]
+    durations = [result['duration'] for _, result in ok]
+    summary.update({
+        "latency_p50": round(percentile(latencies, 50), 4),
+        "latency_p95": round(percentile(latencies, 95), 4),
+        "latency_mean": round(sum(latencies) / len(latencies), 4),
+        "audio_duration": round(sum(durations) / len(durations), 3),
+        # Processing seconds per second of audio; below 1.0 is faster than real time
+        "rtf_mean": round(sum(l / d for l, d in zip(latencies, durations) if d) / len(ok), 4),
+        "throughput_rps": round(len(ok) / wall, 3),
+        "audio_seconds_per_second": round(sum(durations) / wall, 3)
+    })
+
+    stages = {}
+    for _, result in ok:
+        for stage, record in result.get('timings', {}).items():
+            if stage != 'total':
+                stages.setdefault(stage, {"wall": [], "cpu": []})
+                stages[stage]["wall"].append(record["wall"])
+                stages[stage]["cpu"].append(record["cpu"])
+    summary["stages"] = {
+        stage: {
+            "wall_p50": round(percentile(values["wall"], 50), 4),
+            "wall_p95": round(percentile(values["wall"], 95), 4),
+            "cpu_mean": round(sum(values["cpu"]) / len(values["cpu"]), 4)
+        }
+        for stage, values in stages.items()
+    }
+    return summary
+
+
+def run_engine(args):
+    """Benchmark one engine in this process (so peak RSS is per engine)."""
+    cases = []
+    with tempfile.TemporaryDirectory(prefix=f"bench_{args.worker_engine}_") as work_dir, \
+            contextlib.redirect_stdout(sys.stderr), contextlib.ExitStack() as resources:
+        try:
+            for text_case in args.texts:
+                text, audio_path = TEXT_CASES[text_case]
+                synthesize, is_async = make_engine(args.worker_engine, audio_path, args.base_latency, work_dir,
+                                                  max(args.concurrency), resources)
+                # Warm up imports, FFT plans and resamplers outside the measurement
+                run_requests(synthesize, is_async, text, 1, 1, work_dir)
+                for concurrency in args.concurrency:
+                    records, wall = run_requests(synthesize, is_async, text, concurrency,
+                                                 concurrency * args.iterations, work_dir)
+                    cases.append(summarize(args.worker_engine, text_case, concurrency, records, wall))
+        except ImportError as e:
+            return {"engine": args.worker_engine, "skipped": f"missing dependency: {e}"}
+
+    return {"engine": args.worker_engine, "peak_rss_mb": peak_rss_mb(), "cases": cases}
+
+
+def compare(current, previous, threshold):
+    """Ratio of current to previous p50/p95 latency for every matching case."""
+    def index(report):
+        return {
+            (case["engine"], case["text"], case["concurrency"]): case
+            for engine in report["engines"] for case in engine.get("cases", [])
+            if "latency_p50" in case
+        }
+
+    old_cases = index(previous)
+    rows = []
+    for key, case in index(current).items():
+        old = old_cases.get(key)
+        if not old:
+            continue
+        p50_ratio = case["latency_p50"] / old["latency_p50"]
+        p95_ratio = case["latency_p95"] / old["latency_p95"]
+        rows.append({
+            "engine": key[0],
+            "text": key[1],
+            "concurrency": key[2],
+            "p50_ratio": round(p50_ratio, 3),
+            "p95_ratio": round(p95_ratio, 3),
+            "regression": p50_ratio > 1 + threshold or p95_ratio > 1 + threshold
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the March 7th TTS engines offline')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=ENGINES)
+    parser.add_argument('--texts', nargs='+', default=list(TEXT_CASES), choices=list(TEXT_CASES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--iterations', type=int, default=3,
+                        help='Requests per concurrency slot for each case')
+    parser.add_argument('--base-latency', type=float, default=0.2,
+                        help='Simulated Edge-TTS / SAPI latency in seconds')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    parser.add_argument('--compare', help='Previous report to compare latencies against')
+    parser.add_argument('--regression-threshold', type=float, default=0.1,
+                        help='Relative latency increase flagged as a regression')
+    parser.add_argument('--worker-engine', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_engine:
+        print(json.dumps(run_engine(args)))
+        return 0
+
+    # One subprocess per engine keeps imports and peak RSS from bleeding across engines
+    engines = []
+    for engine in args.engines:
+        command = [
+            sys.executable, str(Path(__file__).resolve()), '--worker-engine', engine,
+            '--texts', *args.texts,
+            '--concurrency', *map(str, args.concurrency),
+            '--iterations', str(args.iterations),
+            '--base-latency', str(args.base_latency)
+        ]
+        print(f"Benchmarking {engine}...", file=sys.stderr)
+        proc = subprocess.run(command, capture_output=True, text=True, cwd=str(Path(__file__).parent))
+        try:
+            engines.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        except (IndexError, ValueError):
+            engines.append({"engine": engine, "error": proc.stderr.strip()[-2000:]})
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "texts": args.texts,
+            "concurrency": args.concurrency,
+            "iterations": args.iterations,
+            "base_latency": args.base_latency
+        },
+        "engines": engines
+    }
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report["comparison"] = compare(report, json.load(f), args.regression_threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
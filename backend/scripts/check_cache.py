@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Offline check for the on-disk audio cache
+Stores fake renders in a scratch AudioCache and checks that files are named
+after their stored format, that eviction drops expired and then
+least-recently-used entries, that entries stored by another process on the
+same directory are indexed when hit, that the hit/miss counters add up
+under concurrent lookups, and that a store costs about the same with
+thousands of entries as with a few (eviction works from the in-memory index
+instead of listing the directory)
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tts_cache import AudioCache
+
+ENTRY_BYTES = 1000
+MAX_STORE_SLOWDOWN = 3.0
+
+
+def key_for(i):
+    return AudioCache.make_key(f"line {i}", "voice", "check", {})
+
+
+def store(cache, i, fmt='wav', created=None):
+    meta = {"format": fmt, "duration": 1.0}
+    if created is not None:
+        meta["created"] = created
+    cache.store_bytes(key_for(i), bytes(ENTRY_BYTES), meta)
+
+
+def check_formats(directory):
+    """An mp3 render is kept as <key>.mp3, and replaced when re-rendered as wav."""
+    cache = AudioCache(directory)
+    key = key_for(0)
+    store(cache, 0, 'mp3')
+    stored_as_mp3 = sorted(path.name for path in Path(directory).iterdir())
+    fetched = cache.fetch(key, Path(directory) / 'out.mp3')
+    (Path(directory) / 'out.mp3').unlink()
+    store(cache, 0, 'wav')
+    stored_as_wav = sorted(path.name for path in Path(directory).iterdir())
+    ok = (stored_as_mp3 == [f"{key}.json", f"{key}.mp3"] and fetched is not None
+          and stored_as_wav == [f"{key}.json", f"{key}.wav"] and cache.usage() == (1, ENTRY_BYTES))
+    return ok, {"mp3": stored_as_mp3, "wav": stored_as_wav}
+
+
+def check_eviction(directory, max_age=3600):
+    """Over max_bytes the least recently used entry goes; expired entries go first."""
+    cache = AudioCache(directory, max_bytes=3 * ENTRY_BYTES, max_age=max_age)
+    for i in range(3):
+        store(cache, i)
+    cache.read(key_for(0))
+    store(cache, 3)
+    lru = {i: cache.read(key_for(i)) is not None for i in range(4)}
+
+    # The expired entry is dropped although it was stored last; the next store then evicts 0
+    store(cache, 4, created=time.time() - 2 * max_age)
+    store(cache, 5)
+    expired = {i: cache.read(key_for(i)) is not None for i in (0, 2, 3, 4, 5)}
+    files = len(list(Path(directory).iterdir()))
+    ok = (lru == {0: True, 1: False, 2: True, 3: True}
+          and expired == {0: False, 2: True, 3: True, 4: False, 5: True}
+          and cache.usage() == (3, 3 * ENTRY_BYTES) and files == 6)
+    return ok, {"after_lru": lru, "after_expiry": expired, "files": files}
+
+
+def check_shared(directory):
+    """A hit on an entry another process stored puts it in this process's index."""
+    first = AudioCache(directory)
+    second = AudioCache(directory)
+    store(second, 0)
+    before = first.usage()
+    hit = first.read(key_for(0)) is not None
+    after = first.usage()
+    return hit and before == (0, 0) and after == (1, ENTRY_BYTES), {"before": before, "after": after}
+
+
+def check_counters(directory, threads=8, lookups=500):
+    """Concurrent hits and misses are all counted."""
+    cache = AudioCache(directory)
+    store(cache, 0)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: cache.read(key_for(i % 2)), range(threads * lookups)))
+    stats = cache.stats(hit=False)
+    expected = threads * lookups // 2
+    return stats["hits"] == expected and stats["misses"] == expected, stats
+
+
+def store_time(directory, entries, stores):
+    """Mean seconds per store into a cache already holding entries."""
+    cache = AudioCache(directory, max_bytes=(entries + stores) * ENTRY_BYTES)
+    for i in range(entries):
+        store(cache, i)
+    start = time.perf_counter()
+    for i in range(entries, entries + stores):
+        store(cache, i)
+    return (time.perf_counter() - start) / stores
+
+
+def check_scaling(small, large, stores=200):
+    with tempfile.TemporaryDirectory() as few, tempfile.TemporaryDirectory() as many:
+        few_s = store_time(few, small, stores)
+        many_s = store_time(many, large, stores)
+    slowdown = many_s / few_s
+    return slowdown <= MAX_STORE_SLOWDOWN, {
+        f"store_ms_with_{small}": round(few_s * 1000, 3),
+        f"store_ms_with_{large}": round(many_s * 1000, 3),
+        "slowdown": round(slowdown, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the on-disk audio cache')
+    parser.add_argument('--small', type=int, default=100, help='Entries in the small cache timed')
+    parser.add_argument('--large', type=int, default=4000, help='Entries in the large cache timed')
+    args = parser.parse_args()
+
+    results = {}
+    checks = {}
+    for name, check in (("formats", check_formats), ("eviction", check_eviction),
+                        ("shared_directory", check_shared), ("counters", check_counters)):
+        with tempfile.TemporaryDirectory() as directory:
+            checks[name], results[name] = check(directory)
+    checks["store_scaling"], results["store_scaling"] = check_scaling(args.small, args.large)
+
+    result = {
+        "success": all(checks.values()),
+        "checks": checks,
+        "max_store_slowdown": MAX_STORE_SLOWDOWN,
+        **results
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Offline check for the shared audio cache
+Starts one cache node per simulated host and several resident enhanced
+workers per host (with the Edge-TTS stand-in), sends every worker the same
+greetings in its own order and compares how many were rendered against
+per-worker caches. Also checks how evenly the hash ring spreads keys, that
+removing a node only moves its own keys, and that a dead node degrades to
+misses instead of failures
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from tts_cache import AudioCache
+from tts_cache_cluster import FRONT_DIR, HashRing
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+LINES = [
+    "Good morning, trailblazer!",
+    "Did you sleep well?",
+    "Let's take a picture together!",
+    "Pom-Pom says dinner is ready.",
+    "Welcome back to the Express.",
+    "Where are we off to today?",
+    "Hehe, that was fun!",
+    "Don't forget your camera.",
+    "See you tomorrow!",
+    "Good night, sleep tight."
+]
+
+
+def start_node(directory):
+    process = subprocess.Popen([sys.executable, str(SCRIPT_DIR / 'tts_cache_cluster.py'), '--port', '0',
+                                '--cache-dir', str(directory)],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    ready = json.loads(process.stdout.readline())
+    return process, ready["url"]
+
+
+class Worker:
+    def __init__(self, name, *options):
+        self.name = name
+        self.process = subprocess.Popen(
+            [sys.executable, str(SCRIPT_DIR / 'march7th_enhanced_tts.py'), '--serve', '--edge-stub',
+             '--dsp-workers', '0', *options],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', bufsize=1)
+        self.results = []
+
+    def request(self, message):
+        self.process.stdin.write(json.dumps(message) + '\n')
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def speak(self, lines, output_dir, seed):
+        order = list(lines)
+        random.Random(seed).shuffle(order)
+        for index, text in enumerate(order):
+            output = str(Path(output_dir) / f"{self.name}_{seed}_{index}.wav")
+            self.results.append(self.request({"text": text, "output": output}))
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait(timeout=60)
+
+
+def run_workers(workers, output_dir, seed=0):
+    threads = [threading.Thread(target=worker.speak, args=(LINES, output_dir, seed + index))
+               for index, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def summarize(workers, before=None):
+    """Hits and renders of the workers' results; tier counters since the before report."""
+    results = [result for worker in workers for result in worker.results]
+    hits = sum(result["cache"]["hit"] for result in results if result.get("success"))
+    report = {
+        "requests": len(results),
+        "failed": sum(not result.get("success") for result in results),
+        "rendered": len(results) - hits,
+        "hit_rate": round(hits / len(results), 4)
+    }
+    # Each worker's last result carries its running tier counters
+    last = [worker.results[-1]["cache"] for worker in workers if worker.results]
+    if last and "front_hits" in last[0]:
+        totals = {
+            "front_hits": sum(stats["front_hits"] for stats in last),
+            "node_hits": sum(stats["hits"] - stats["front_hits"] for stats in last),
+            "cross_node_hits": sum(stats["cross_node_hits"] for stats in last),
+            "node_errors": sum(stats["node_errors"] for stats in last)
+        }
+        report["totals"] = totals
+        report.update({name: value - (before or {}).get("totals", {}).get(name, 0)
+                       for name, value in totals.items()})
+        report["cross_node_hit_rate"] = round(report["cross_node_hits"] / len(results), 4)
+    return report
+
+
+def check_ring(nodes, keys=20000):
+    """Key share per node, and how many keys move when one node leaves."""
+    names = [f"host{index}" for index in range(nodes)]
+    sample = [AudioCache.make_key(f"line {index}", "voice", "engine", {}) for index in range(keys)]
+    ring = HashRing(names)
+    owners = {key: ring.node_for(key) for key in sample}
+    shares = {name: round(sum(owner == name for owner in owners.values()) / keys, 3) for name in names}
+    smaller = HashRing(names[1:])
+    moved_elsewhere = sum(owner != names[0] and smaller.node_for(key) != owner for key, owner in owners.items())
+    return {"shares": shares, "keys_moved_from_surviving_nodes": moved_elsewhere,
+            "ok": moved_elsewhere == 0 and max(shares.values()) - min(shares.values()) < 0.1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the shared audio cache with local processes as hosts')
+    parser.add_argument('--hosts', type=int, default=3)
+    parser.add_argument('--workers-per-host', type=int, default=2)
+    args = parser.parse_args()
+
+    ring = check_ring(args.hosts)
+    shm_root = FRONT_DIR.parent
+    with tempfile.TemporaryDirectory() as directory, \
+            tempfile.TemporaryDirectory(dir=shm_root, prefix='march7th-check-') as fronts:
+        directory = Path(directory)
+        output_dir = directory / "out"
+        output_dir.mkdir()
+
+        # Today: every worker process keeps its own cache
+        private = [Worker(f"p{index}", '--cache-dir', str(directory / f"private{index}"))
+                   for index in range(args.hosts * args.workers_per_host)]
+        try:
+            run_workers(private, output_dir)
+        finally:
+            for worker in private:
+                worker.close()
+        private_report = summarize(private)
+
+        nodes = [start_node(directory / f"node{index}") for index in range(args.hosts)]
+        spec = ",".join(f"host{index}={url}" for index, (_, url) in enumerate(nodes))
+        shared = [Worker(f"h{host}w{index}",
+                         '--cache-dir', str(Path(fronts) / f"host{host}"),
+                         '--cache-nodes', spec, '--cache-node', f"host{host}")
+                  for host in range(args.hosts) for index in range(args.workers_per_host)]
+        try:
+            run_workers(shared, output_dir)
+            shared_report = summarize(shared)
+
+            # A host's node goes away (and the front tiers are cold, as after a
+            # restart): its keys become misses, nothing fails
+            nodes[0][0].terminate()
+            nodes[0][0].wait()
+            for path in Path(fronts).glob('*/*'):
+                path.unlink()
+            for worker in shared:
+                worker.results = []
+            run_workers(shared, output_dir, seed=100)
+            failover = summarize(shared, shared_report)
+        finally:
+            for worker in shared:
+                worker.close()
+            for process, _ in nodes:
+                process.terminate()
+                process.wait()
+
+    checks = {
+        "ring_balanced_and_stable": ring["ok"],
+        # Workers starting on the same line at once may each render it
+        "shared_renders_fewer": shared_report["rendered"] <= private_report["rendered"] / 2,
+        "cross_node_hits": shared_report["cross_node_hits"] > 0,
+        "dead_node_is_a_miss": failover["failed"] == 0 and failover["node_errors"] > 0
+    }
+    result = {
+        "success": all(checks.values()),
+        "checks": checks,
+        "lines": len(LINES),
+        "workers": len(shared),
+        "per_worker_cache": private_report,
+        "shared_cache": shared_report,
+        "after_node_failure": failover,
+        "ring": ring
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Offline check for the pipelined DSP offload
+Sends a burst of concurrent requests (with the Edge-TTS stand-in) through
+the enhanced engine with a one- and a two-worker DSP pipeline, and checks
+that every output matches the in-process render, that no more requests
+than allowed sat between fetching and DSP, and that no shared memory
+segment is left behind, neither after a normal burst nor after one whose
+requests are cancelled mid-flight
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import soundfile as sf
+
+from edge_tts_stub import StubEdgeService
+from march7th_enhanced_tts import March7thEnhancedTTS, init_enhance_worker
+from tts_edge import EdgeSpeechFetcher
+from tts_pipeline import DSPPipeline
+from voice_profiles import PROFILES_PATH
+
+SHM_DIR = Path('/dev/shm')
+
+LINES = [
+    "Good morning, trailblazer!",
+    "Did you sleep well?",
+    "Let's take a picture together!",
+    "Pom-Pom says dinner is ready.",
+    "Welcome back to the Express.",
+    "Where are we off to today?",
+    "Hehe, that was fun!",
+    "See you tomorrow!"
+]
+
+
+def shm_segments():
+    """Names of the shared memory segments that exist right now (POSIX only)."""
+    return set(os.listdir(SHM_DIR)) if SHM_DIR.is_dir() else set()
+
+
+def make_engine(latency, pipeline=None):
+    fetcher = EdgeSpeechFetcher(StubEdgeService(latency=latency).communicate)
+    return March7thEnhancedTTS(fetcher=fetcher, pipeline=pipeline)
+
+
+async def render_all(tts, output_dir, prefix):
+    """Synthesize every line at once; returns the results in LINES order."""
+    return await asyncio.gather(*(tts.synthesize(text, str(Path(output_dir) / f"{prefix}_{index}.wav"))
+                                  for index, text in enumerate(LINES)))
+
+
+async def cancelled_burst(tts, output_dir, delay):
+    """Cancel half the requests through their flag and the rest as tasks, part way through."""
+    flags = [threading.Event() for _ in LINES]
+    tasks = [asyncio.ensure_future(tts.synthesize(text, str(Path(output_dir) / f"cancel_{index}.wav"),
+                                                  cancel=flag))
+             for index, (text, flag) in enumerate(zip(LINES, flags))]
+    await asyncio.sleep(delay)
+    for index, (task, flag) in enumerate(zip(tasks, flags)):
+        if index % 2:
+            task.cancel()
+        else:
+            flag.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return sum(isinstance(result, asyncio.CancelledError) or not result.get("success") for result in results)
+
+
+async def check_workers(workers, latency, output_dir, reference):
+    pipeline = DSPPipeline(workers, initializer=init_enhance_worker,
+                           initargs=(30.0, None, None, str(PROFILES_PATH), 'WARNING'))
+    try:
+        tts = make_engine(latency, pipeline)
+        before = shm_segments()
+        results = await render_all(tts, output_dir, f"pipeline{workers}")
+        left_after_burst = sorted(shm_segments() - before)
+        stats = pipeline.stats()
+        matches = all(result["success"] and (sf.read(result["output_path"])[0] == expected).all()
+                      for result, expected in zip(results, reference))
+
+        # Cancel while the first requests are being enhanced and later ones still fetched
+        cancelled = await cancelled_burst(tts, output_dir, latency * 1.5)
+        # Workers finish their current block before they see the flag; let them
+        await asyncio.sleep(0.5)
+        left_after_cancel = sorted(shm_segments() - before)
+    finally:
+        pipeline.shutdown()
+
+    return {
+        "workers": workers,
+        "max_pending": stats["max_pending"],
+        "peak_pending": stats["peak_pending"],
+        "throttled": stats["throttled"],
+        "jobs": stats["jobs"],
+        "cancelled": cancelled,
+        "left_after_burst": left_after_burst,
+        "left_after_cancel": left_after_cancel,
+        "checks": {
+            "outputs_match_in_process": matches,
+            "pending_bounded": stats["peak_pending"] <= stats["max_pending"],
+            "no_segments_after_burst": not left_after_burst,
+            "requests_cancelled": cancelled > 0,
+            "no_segments_after_cancel": not left_after_cancel
+        }
+    }
+
+
+async def run_check(worker_counts, latency):
+    with tempfile.TemporaryDirectory() as directory:
+        tts = make_engine(latency)
+        reference = [sf.read(result["output_path"])[0] for result in await render_all(tts, directory, "inline")]
+        reports = [await check_workers(workers, latency, directory, reference) for workers in worker_counts]
+    return {
+        "success": all(all(report["checks"].values()) for report in reports),
+        "requests": len(LINES),
+        "latency": latency,
+        "pipelines": reports
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the DSP pipeline offline against the in-process path')
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2], help='Pipeline sizes to check')
+    parser.add_argument('--latency', type=float, default=0.2, help='Simulated upstream latency (s)')
+    args = parser.parse_args()
+
+    result = asyncio.run(run_check(args.workers, args.latency))
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Offline check for concurrent Edge-TTS fetching
+Runs a burst of requests (with duplicates) against the Edge-TTS stand-in and
+verifies the concurrency cap and request coalescing, then reports throughput.
+Also checks that every configured voice profile's prosody is accepted by
+edge_tts.Communicate and reaches it as options next to the plain text
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from edge_tts_stub import StubEdgeService
+from tts_edge import EdgeSpeechFetcher
+from voice_profiles import PROFILES_PATH, VoiceProfileRegistry
+
+
+async def check_prosody(profiles_path):
+    """Profiles' prosody reaches Communicate as options, and is part of the coalescing key."""
+    registry = VoiceProfileRegistry(profiles_path)
+    profiles = [registry.get(name) for name in registry.names()]
+    service = StubEdgeService(latency=0.01)
+    fetcher = EdgeSpeechFetcher(service.communicate)
+    text = "Same words, different voices."
+    await asyncio.gather(*(fetcher.fetch(text, profile.voice, **profile.prosody)
+                           for profile in profiles for _ in range(2)))
+    sent = {(voice, tuple(sorted(options.items()))) for _, voice, options in service.requests}
+
+    try:
+        import edge_tts
+    except ImportError:
+        accepted = None
+    else:
+        # Constructing a Communicate validates its options without any network traffic
+        try:
+            for profile in profiles:
+                edge_tts.Communicate(text, profile.voice, **profile.prosody)
+            accepted = True
+        except ValueError:
+            accepted = False
+    return {
+        "plain_text_sent": all(sent_text == text for sent_text, _, _ in service.requests),
+        "one_call_per_prosody": service.calls == len(sent) == len(
+            {(profile.voice, tuple(sorted(profile.prosody.items()))) for profile in profiles}),
+        "edge_tts_accepts_prosody": accepted
+    }, {profile.name: profile.prosody for profile in profiles}
+
+
+async def run_check(requests, unique, max_concurrency, latency, profiles_path):
+    service = StubEdgeService(latency=latency)
+    fetcher = EdgeSpeechFetcher(service.communicate, max_concurrency=max_concurrency)
+    texts = [f"Line number {i % unique}" for i in range(requests)]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(fetcher.fetch(text, "en-US-JennyNeural") for text in texts))
+    elapsed = time.perf_counter() - start
+
+    checks = {
+        "all_audio_returned": all(result == service.audio for result in results),
+        "one_upstream_call_per_unique_text": service.calls == unique,
+        "concurrency_capped": service.max_active <= max_concurrency
+    }
+    prosody_checks, prosody = await check_prosody(profiles_path)
+    checks.update(prosody_checks)
+    return {
+        # None when edge_tts is not installed
+        "success": all(value is not False for value in checks.values()),
+        "checks": checks,
+        "requests": requests,
+        "unique_texts": unique,
+        "upstream_calls": service.calls,
+        "coalesced": fetcher.coalesced,
+        "max_in_flight": service.max_active,
+        "elapsed": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        # What the same burst costs when every request goes upstream one at a time
+        "serial_estimate": round(requests * latency, 3),
+        "prosody": prosody
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check Edge-TTS fetch concurrency and coalescing offline')
+    parser.add_argument('--requests', type=int, default=40, help='Total requests in the burst')
+    parser.add_argument('--unique', type=int, default=10, help='Number of distinct texts')
+    parser.add_argument('--max-fetches', type=int, default=4, help='Concurrency cap')
+    parser.add_argument('--latency', type=float, default=0.2, help='Simulated upstream latency (s)')
+    parser.add_argument('--voice-profiles', default=str(PROFILES_PATH), help='Voice profiles JSON')
+    args = parser.parse_args()
+
+    result = asyncio.run(run_check(args.requests, args.unique, args.max_fetches, args.latency,
+                                   args.voice_profiles))
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Offline check for incremental text input
+Verifies that SentenceBuffer cuts randomly split replies exactly like
+split_sentences, then streams a reply typed out at LLM speed into the
+enhanced engine (with the Edge-TTS stand-in) and compares when audio starts
+and finishes against waiting for the whole reply before synthesizing
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from edge_tts_stub import StubEdgeService
+from march7th_enhanced_tts import March7thEnhancedTTS
+from tts_edge import EdgeSpeechFetcher
+from tts_text import SentenceBuffer, split_sentences
+
+REPLY = (
+    "Hey, trailblazer! You're finally awake. Pom-Pom says the Express leaves for the next world "
+    "soon, so grab your things. Oh, and before I forget: I took a picture of you sleeping, "
+    "it's adorable! Want to see it? I'll keep it in my album with all the others, next to "
+    "Himeko's coffee and that weird trash can you keep talking to. Anyway, let's go!"
+)
+
+
+def check_boundaries(text, trials, seed=7):
+    """Feed text in random pieces; every split must match split_sentences."""
+    rng = random.Random(seed)
+    for trial in range(trials):
+        max_chars = rng.choice([40, 80, 200])
+        sentences = SentenceBuffer(max_chars)
+        segments = []
+        start = 0
+        while start < len(text):
+            size = rng.randint(1, 16)
+            segments += sentences.feed(text[start:start + size])
+            start += size
+        segments += sentences.flush()
+        if segments != split_sentences(text, max_chars):
+            return False
+    return True
+
+
+async def typed(text, chars_per_second, started):
+    """Yield text a few characters at a time, like tokens from a streamed completion."""
+    for start in range(0, len(text), 4):
+        delay = started + (start + 4) / chars_per_second - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield text[start:start + 4]
+
+
+async def run_check(chars_per_second, latency):
+    tts = March7thEnhancedTTS(fetcher=EdgeSpeechFetcher(StubEdgeService(latency=latency).communicate))
+    text_seconds = len(REPLY) / chars_per_second
+    with tempfile.TemporaryDirectory() as directory:
+        # Warm up imports and the compiled effects so neither run pays for them
+        await tts.synthesize_stream("Warm up.", str(Path(directory) / "warm.wav"))
+
+        # Today: the reply is synthesized once the completion has finished
+        started = time.perf_counter()
+        async for _ in typed(REPLY, chars_per_second, started):
+            pass
+        waited = await tts.synthesize_stream(REPLY, str(Path(directory) / "waited.wav"))
+        waited_first = time.perf_counter() - started - waited["synthesis_time"] + waited["time_to_first_audio"]
+        waited_done = time.perf_counter() - started
+
+        started = time.perf_counter()
+        incremental = await tts.synthesize_incremental(typed(REPLY, chars_per_second, started),
+                                                       str(Path(directory) / "incremental.wav"))
+        incremental_done = time.perf_counter() - started
+
+    same_segments = ([segment["text"] for segment in incremental["segments"]]
+                     == [segment["text"] for segment in waited["segments"]])
+    return {
+        "segments": len(incremental["segments"]),
+        "text_seconds": round(text_seconds, 3),
+        "same_segments": same_segments,
+        "wait_for_text": {
+            "first_audio": round(waited_first, 3),
+            "last_audio": round(waited_done, 3)
+        },
+        "incremental": {
+            "first_audio": incremental["time_to_first_audio"],
+            "last_audio": round(incremental_done, 3),
+            "after_text_complete": round(incremental["synthesis_time"] - incremental["text_complete"], 3)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check incremental text input offline')
+    parser.add_argument('--chars-per-second', type=float, default=250.0,
+                        help='Simulated LLM output speed (about 60 tokens/s)')
+    parser.add_argument('--latency', type=float, default=0.2, help='Simulated Edge-TTS latency (s)')
+    parser.add_argument('--trials', type=int, default=500, help='Random splits checked per text')
+    args = parser.parse_args()
+
+    texts = [REPLY, " ".join(f"word{i}" for i in range(150)) + ". Done? Yes!"]
+    boundaries_stable = all(check_boundaries(text, args.trials) for text in texts)
+    latency = asyncio.run(run_check(args.chars_per_second, args.latency))
+    result = {
+        "success": boundaries_stable and latency["same_segments"],
+        "boundaries_match_split_sentences": boundaries_stable,
+        **latency
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
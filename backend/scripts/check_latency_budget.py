@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Offline check for latency-budget scheduling
+Drives LatencyScheduler.run and BudgetTimer with a fake clock and stages of
+fixed cost, and checks the tier chosen for each budget, that a block-wise
+stage running slower than predicted is aborted down to the reduced or
+base_only tier, and that the first run of each stage stays out of the
+moving-average cost estimates
+"""
+
+import argparse
+import json
+import sys
+
+import tts_budget
+import tts_profiling
+from tts_budget import BudgetTimer, LatencyScheduler
+
+AUDIO_SECONDS = 10.0
+
+# Seconds per second of audio, both the scheduler's estimates and the fake stages' cost
+COSTS = {
+    'pitch_shift_eq': 0.05,
+    'tremolo_echo': 0.01,
+    'normalize': 0.001,
+    'block_effects': 0.015,
+    'encode_wav': 0.001
+}
+
+PLANS = [
+    ('full', ['pitch_shift_eq', 'tremolo_echo', 'normalize']),
+    ('reduced', ['tremolo_echo', 'normalize']),
+    ('base_only', ['normalize'])
+]
+
+BLOCK_PLANS = [('full', ['block_effects'])] + PLANS[1:]
+
+
+class FakeClock:
+    """Stands in for the time module: time only moves when a fake stage runs."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def perf_counter(self):
+        return self.now
+
+    def process_time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeStages:
+    def __init__(self, clock, costs, slowdown=None, blocks=10):
+        """
+        Render callback for LatencyScheduler.run with fixed stage costs
+
+        Args:
+            costs: Seconds per audio second of each stage
+            slowdown: Optional {stage: factor} making a stage slower than its cost
+            blocks: Blocks a block-wise stage reports progress for
+        """
+        self.clock = clock
+        self.costs = costs
+        self.slowdown = slowdown or {}
+        self.blocks = blocks
+        self.timer = None
+        self.plans = None
+
+    def __call__(self, tier):
+        stages = dict(self.plans)[tier]
+        for stage in stages + ['encode']:
+            key = self.timer.cost_keys.get(stage, stage)
+            cost = self.costs.get(key, 0.0) * self.slowdown.get(key, 1.0) * AUDIO_SECONDS
+            with self.timer.stage(stage):
+                if stage != 'block_effects':
+                    self.clock.advance(cost)
+                    continue
+                for block in range(self.blocks):
+                    self.clock.advance(cost / self.blocks)
+                    self.timer.progress(stage, (block + 1) / self.blocks)
+        return tier
+
+    def run(self, scheduler, plans, budget_ms):
+        self.plans = plans
+        self.timer = BudgetTimer(scheduler, budget_ms)
+        tier, _ = scheduler.run(plans, self.timer, AUDIO_SECONDS, self)
+        return tier, self.timer.schedule_report()
+
+
+def warm_scheduler(costs=COSTS):
+    """Scheduler whose stages all count as warm, so estimates move from the first observation."""
+    scheduler = LatencyScheduler(costs=costs)
+    scheduler._warm.update(costs)
+    return scheduler
+
+
+def check_tiers(clock):
+    """Best tier predicted to fit each budget; nothing fits -> the floor."""
+    # Predicted: full 0.62 s, reduced 0.12 s, base_only 0.02 s
+    expected = {None: 'full', 1000: 'full', 650: 'full', 600: 'reduced', 130: 'reduced',
+                100: 'base_only', 5: 'base_only'}
+    stages = FakeStages(clock, COSTS)
+    results = {}
+    for budget, tier in expected.items():
+        chosen, report = stages.run(warm_scheduler(), PLANS, budget)
+        results[str(budget)] = {"tier": chosen, "expected": tier, "skipped": report["skipped"],
+                                "aborted": report["aborted"], "deadline_met": report["deadline_met"]}
+    ok = all(result["tier"] == result["expected"] and not result["aborted"] for result in results.values())
+    # Budgets the floor cannot meet either are reported as missed
+    ok = ok and results["5"]["deadline_met"] is False and results["130"]["deadline_met"] is True
+    return ok, results
+
+
+def check_overrun(clock):
+    """A block stage running 5x its estimate is aborted part way and the request degrades."""
+    # Predicted: full 0.16 s, reduced 0.12 s; block_effects actually takes 0.75 s
+    expected = {300: ('reduced', ['full']), 180: ('base_only', ['full', 'reduced'])}
+    results = {}
+    for budget, (tier, aborted) in expected.items():
+        stages = FakeStages(clock, COSTS, slowdown={'block_effects': 5.0})
+        chosen, report = stages.run(warm_scheduler(), BLOCK_PLANS, budget)
+        results[str(budget)] = {"tier": chosen, "expected": tier, "aborted": report["aborted"],
+                                "elapsed_ms": report["elapsed_ms"]}
+        # Aborted after its first block, well before the slow stage would have finished
+        results[str(budget)]["ok"] = (chosen == tier and [entry["tier"] for entry in report["aborted"]] == aborted
+                                      and report["aborted"][0]["stage"] == 'block_effects'
+                                      and report["elapsed_ms"] < 0.75 * 1000)
+    return all(result["ok"] for result in results.values()), results
+
+
+def check_warmup(clock, alpha=0.3):
+    """The first run of each stage (imports, JIT) leaves the estimates alone; later runs move them."""
+    scheduler = LatencyScheduler(alpha=alpha, costs=COSTS)
+    # Cold runs are 20x slower, then every stage settles at twice its starting estimate
+    measured = {stage: cost * 2 for stage, cost in COSTS.items()}
+    FakeStages(clock, measured, slowdown=dict.fromkeys(COSTS, 10.0)).run(scheduler, PLANS, None)
+    after_first = dict(scheduler.costs)
+    FakeStages(clock, measured).run(scheduler, PLANS, None)
+    after_second = dict(scheduler.costs)
+
+    ran = {stage for _, stages in PLANS[:1] for stage in stages} | {'encode_wav'}
+    expected = {stage: COSTS[stage] + alpha * (measured[stage] - COSTS[stage]) for stage in ran}
+    ok = (after_first == COSTS
+          and all(abs(after_second[stage] - expected[stage]) < 1e-9 for stage in ran)
+          and all(after_second[stage] == COSTS[stage] for stage in set(COSTS) - ran))
+    return ok, {"after_first": after_first, "after_second": after_second, "expected": expected}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check latency-budget scheduling with a fake clock')
+    parser.parse_args()
+
+    clock = FakeClock()
+    real_time = tts_budget.time, tts_profiling.time
+    tts_budget.time = tts_profiling.time = clock
+    try:
+        tiers_ok, tiers = check_tiers(clock)
+        overrun_ok, overrun = check_overrun(clock)
+        warmup_ok, warmup = check_warmup(clock)
+    finally:
+        tts_budget.time, tts_profiling.time = real_time
+
+    checks = {
+        "tier_per_budget": tiers_ok,
+        "overrun_aborts_and_degrades": overrun_ok,
+        "first_run_not_averaged": warmup_ok
+    }
+    result = {
+        "success": all(checks.values()),
+        "checks": checks,
+        "audio_seconds": AUDIO_SECONDS,
+        "tiers": tiers,
+        "overrun": overrun,
+        "warmup": warmup
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
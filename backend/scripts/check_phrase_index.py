@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Offline check for the precomputed phrase index
+Builds a phrase store with the Edge-TTS stand-in, then synthesizes a reply
+mixing stock and new sentences (whole and streamed) and checks that only
+the new sentences reach Edge-TTS, that the reported indexed fraction
+matches the audio actually taken from the store, that the composed reply
+is normalized once as a whole rather than piece by piece, and that
+editing the voice profile retires the old renders
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from edge_tts_stub import StubEdgeService
+from march7th_enhanced_tts import March7thEnhancedTTS
+from tts_edge import EdgeSpeechFetcher
+from tts_audio import decode_audio
+from tts_phrases import CROSSFADE_SECONDS, PhraseIndex, crossfade_concat, match_rate
+from tts_text import split_sentences
+from voice_profiles import PROFILES_PATH, VoiceProfileRegistry
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROFILE = 'march7th'
+
+# New sentences are served from a longer clip than the store was built from,
+# so the indexed fraction by audio differs from the fraction by sentences
+NOVEL_AUDIO = SCRIPT_DIR.parent / 'test_march7th_rvc.wav'
+
+CORPUS = [
+    "Hey there! Want to take a picture?",
+    "Want to take a picture? Pom-Pom is waiting.",
+    "Want to take a picture?"
+]
+
+# Catchphrase, new sentence, corpus sentence, new sentence
+REPLY = "Hey there! The Express leaves at noon. Want to take a picture? Don't be late."
+
+# Written file against the reply normalized as a whole: int16 rounding, far
+# below the level steps of pieces normalized on their own
+MAX_LEVEL_ERROR = 1e-3
+
+
+def check_crossfade(sr=24000):
+    """Seams overlap by the fade length and keep both pieces' outer samples."""
+    fade = int(CROSSFADE_SECONDS * sr)
+    first = np.full(sr, 0.5, dtype=np.float32)
+    second = np.full(sr // 2, -0.5, dtype=np.float32)
+    joined = crossfade_concat([first, np.zeros(0, dtype=np.float32), second], sr)
+    return (len(joined) == len(first) + len(second) - fade
+            and joined[len(first) - fade - 1] == first[-1] and joined[-1] == second[-1]
+            and len(crossfade_concat([], sr)) == 0)
+
+
+def build_store(directory, profiles_path, corpus_path):
+    """Run the offline build the way an operator would."""
+    output = subprocess.run(
+        [sys.executable, str(SCRIPT_DIR / 'tts_phrases.py'), '--phrase-index', str(directory),
+         '--corpus', str(corpus_path), '--profiles', PROFILE, '--edge-stub',
+         '--voice-profiles', str(profiles_path), '--log-level', 'WARNING'],
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def expected_fraction(phrases, profile, output_path, pieces):
+    """Indexed share recomputed from the store and the written file, undoing the crossfades."""
+    indexed = sum(len(phrases.lookup(sentence, profile)[0]) for sentence in split_sentences(REPLY)
+                  if phrases.lookup(sentence, profile))
+    info = sf.info(output_path)
+    total = info.frames + int(CROSSFADE_SECONDS * info.samplerate) * (pieces - 1)
+    return round(indexed / total, 3)
+
+
+def level_error(phrases, profile, output_path):
+    """Largest difference between the written reply and its pieces crossfaded and normalized once."""
+    novel, sr = decode_audio(NOVEL_AUDIO.read_bytes())
+    novel = profile.effects.process(novel, sr, normalize=False)
+    pieces = [novel if hit is None else match_rate(hit[0], hit[1], sr) for _, hit in phrases.plan(REPLY, profile)]
+    expected = profile.effects.normalize(crossfade_concat(pieces, sr))
+    written, _ = sf.read(output_path, dtype='float32')
+    if len(written) != len(expected):
+        return float('inf')
+    return float(np.max(np.abs(written - expected)))
+
+
+async def run_check(latency):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        profiles_path = directory / 'voice_profiles.json'
+        config = json.loads(Path(PROFILES_PATH).read_text(encoding='utf-8'))
+        profiles_path.write_text(json.dumps(config, indent=2), encoding='utf-8')
+        corpus_path = directory / 'corpus.txt'
+        corpus_path.write_text('\n'.join(CORPUS), encoding='utf-8')
+        build = build_store(directory / 'phrases', profiles_path, corpus_path)
+
+        service = StubEdgeService(NOVEL_AUDIO, latency=latency)
+        phrases = PhraseIndex(directory / 'phrases')
+        tts = March7thEnhancedTTS(fetcher=EdgeSpeechFetcher(service.communicate),
+                                  profiles=VoiceProfileRegistry(profiles_path), phrases=phrases)
+        profile = tts.profile(PROFILE)
+        stock = [sentence for sentence in split_sentences(REPLY) if phrases.lookup(sentence, profile)]
+        novel = [sentence for sentence in split_sentences(REPLY) if sentence not in stock]
+
+        whole = await tts.synthesize(REPLY, str(directory / 'whole.wav'), voice_profile=PROFILE)
+        whole_sent = [text for text, _, _ in service.requests]
+        whole_error = level_error(phrases, profile, whole["output_path"])
+        service.requests.clear()
+
+        streamed = await tts.synthesize_stream(REPLY, str(directory / 'streamed.wav'), voice_profile=PROFILE)
+        stream_sent = [text for text, _, _ in service.requests]
+        stream_indexed = sum(segment["frames"] for segment in streamed["segments"] if segment["indexed"])
+        stream_total = sum(segment["frames"] for segment in streamed["segments"])
+        service.requests.clear()
+
+        # An edited voice changes the fingerprint; the old renders must not be used
+        config["profiles"][PROFILE]["effects"]["tremolo_depth"] += 0.01
+        profiles_path.write_text(json.dumps(config, indent=2), encoding='utf-8')
+        stat = profiles_path.stat()
+        os.utime(profiles_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        edited = tts.profile(PROFILE)
+        edited_result = await tts.synthesize(REPLY, str(directory / 'edited.wav'), voice_profile=PROFILE)
+        edited_sent = [text for text, _, _ in service.requests]
+
+        checks = {
+            "crossfade_concat": check_crossfade(),
+            "store_built": build["phrases"] >= len(config["profiles"][PROFILE]["phrases"]) + 1,
+            "stock_sentences_indexed": stock == ["Hey there!", "Want to take a picture?"],
+            "whole_skips_edge_for_stock": (whole["success"] and whole_sent == novel
+                                           and not any(sentence in text for text in whole_sent for sentence in stock)),
+            "whole_fraction_correct": whole["phrase_index"]["fraction"] == expected_fraction(
+                phrases, profile, whole["output_path"], len(split_sentences(REPLY))),
+            "reply_normalized_once": whole_error <= MAX_LEVEL_ERROR,
+            "stream_skips_edge_for_stock": streamed["success"] and stream_sent == novel,
+            "stream_fraction_correct": streamed["phrase_index"]["fraction"] == round(stream_indexed / stream_total, 3),
+            "edit_changes_fingerprint": edited.fingerprint != profile.fingerprint,
+            "edit_retires_old_renders": (edited_result["success"] and "phrase_index" not in edited_result
+                                         and all(phrases.lookup(sentence, edited) is None for sentence in stock)
+                                         and edited_sent == [REPLY])
+        }
+        return {
+            "success": all(checks.values()),
+            "checks": checks,
+            "build": {name: build[name] for name in ("phrases", "profiles", "pcm_bytes")},
+            "stock": stock,
+            "level_error": whole_error,
+            "edge_requests": {"whole": whole_sent, "streamed": stream_sent, "after_edit": edited_sent},
+            "phrase_index": {"whole": whole["phrase_index"], "streamed": streamed["phrase_index"]}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the phrase index offline with the Edge-TTS stand-in')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated upstream latency (s)')
+    args = parser.parse_args()
+
+    result = asyncio.run(run_check(args.latency))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
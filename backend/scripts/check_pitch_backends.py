@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Check the pitch shift backends against librosa.effects.pitch_shift
+Quality is measured on synthetic input whose correctly shifted version is
+known: a harmonic tone and a rising chirp, shifted by the semitone steps
+the engines use, are compared with the same signals generated at the
+shifted pitch (log-spectral distance, and the pitch error in cents for the
+tone). Speed is measured on the checked-in test clips. Every backend must
+hit the reference pitch within MAX_PITCH_ERROR_CENTS and stay within
+MAX_EXTRA_DISTANCE_DB of librosa's distance, and WSOLA (which block
+rendering uses) must take at most 1 / MIN_WSOLA_SPEEDUP of librosa's CPU
+time, whole and fed in small blocks
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+from check_voice_effects import cpu_times
+from voice_effects import PITCH_BACKENDS, VoiceEffectsChain
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# enhance_voice_for_march7th, enhance_voice_characteristics, apply_rvc_conversion, fused RVC preset
+ENGINE_STEPS = [2, 3, 4, 7]
+
+TONE_F0 = 220.0
+TONE_HARMONICS = 5
+CHIRP_RANGE = (150.0, 400.0)
+REFERENCE_SECONDS = 2.0
+# Spectral floor relative to the reference's peak, so silent bins do not dominate
+FLOOR_DB = -80.0
+
+MAX_PITCH_ERROR_CENTS = 5.0
+MAX_EXTRA_DISTANCE_DB = 0.5
+MIN_WSOLA_SPEEDUP = 1.5
+
+
+def harmonic_tone(f0, sr, seconds=REFERENCE_SECONDS):
+    t = np.arange(int(seconds * sr)) / sr
+    tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, TONE_HARMONICS + 1))
+    return (0.3 * tone).astype(np.float32)
+
+
+def chirp(f_start, f_end, sr, seconds=REFERENCE_SECONDS):
+    """Exponential sweep, so a pitch shift is the same sweep at scaled frequencies."""
+    t = np.arange(int(seconds * sr)) / sr
+    growth = np.log(f_end / f_start) / seconds
+    return (0.3 * np.sin(2 * np.pi * f_start * np.expm1(growth * t) / growth)).astype(np.float32)
+
+
+def floored_distance(reference, candidate, edge_frames=4):
+    """Log-spectral distance in dB with a floor under both spectra, leaving out the edge frames."""
+    ref = np.abs(librosa.stft(reference))
+    cand = np.abs(librosa.stft(candidate))
+    floor = ref.max() * 10 ** (FLOOR_DB / 20)
+    frames = min(ref.shape[1], cand.shape[1]) - edge_frames
+    diff = 20 * np.log10(np.maximum(ref[:, edge_frames:frames], floor) / np.maximum(cand[:, edge_frames:frames], floor))
+    return float(np.mean(np.sqrt(np.mean(diff ** 2, axis=0))))
+
+
+def pitch_error_cents(reference, candidate, sr):
+    """Median pitch difference in cents over the middle of two steady tones."""
+    middle = slice(len(reference) // 4, 3 * len(reference) // 4)
+    ref_f0 = librosa.yin(reference[middle], fmin=60, fmax=2000, sr=sr)
+    cand_f0 = librosa.yin(candidate[middle], fmin=60, fmax=2000, sr=sr)
+    return float(np.median(np.abs(1200 * np.log2(cand_f0 / ref_f0))))
+
+
+def shift_in_blocks(chain, audio, sr, block_size):
+    """Feed audio through the chain's incremental shifter block by block."""
+    shifter = chain.pitch_shifter(sr)
+    out = [shifter.process(audio[start:start + block_size]) for start in range(0, len(audio), block_size)]
+    out.append(shifter.flush())
+    return np.concatenate(out)
+
+
+def shifters(n_steps, sr, block_size):
+    """Every way the engines can shift pitch, librosa first."""
+    chains = {backend: VoiceEffectsChain(n_steps=n_steps, pitch_backend=backend) for backend in PITCH_BACKENDS}
+    runs = {"librosa": lambda audio: librosa.effects.pitch_shift(audio, sr=sr, n_steps=n_steps)}
+    for backend, chain in chains.items():
+        runs[backend] = lambda audio, chain=chain: chain.spectral_pass(audio, sr)
+    # Block rendering uses the same shifter whatever the backend
+    runs["blocks"] = lambda audio: shift_in_blocks(chains['wsola'], audio, sr, block_size)
+    return runs
+
+
+def check_quality(n_steps, sr, block_size):
+    ratio = 2.0 ** (n_steps / 12.0)
+    references = {
+        "tone": (harmonic_tone(TONE_F0, sr), harmonic_tone(TONE_F0 * ratio, sr)),
+        "chirp": (chirp(*CHIRP_RANGE, sr), chirp(CHIRP_RANGE[0] * ratio, CHIRP_RANGE[1] * ratio, sr))
+    }
+    row = {"n_steps": n_steps}
+    for name, run in shifters(n_steps, sr, block_size).items():
+        shifted = {signal: run(source) for signal, (source, _) in references.items()}
+        row[name] = {
+            f"{signal}_distance_db": round(floored_distance(target, shifted[signal]), 3)
+            for signal, (_, target) in references.items()
+        }
+        row[name]["tone_pitch_error_cents"] = round(pitch_error_cents(references["tone"][1], shifted["tone"], sr), 2)
+
+    limits = {signal: row["librosa"][f"{signal}_distance_db"] + MAX_EXTRA_DISTANCE_DB for signal in references}
+    row["ok"] = all(
+        result["tone_pitch_error_cents"] <= MAX_PITCH_ERROR_CENTS
+        and all(result[f"{signal}_distance_db"] <= limit for signal, limit in limits.items())
+        for name, result in row.items() if isinstance(result, dict)
+    )
+    return row
+
+
+def check_speed(clip, n_steps, sr, block_size, repeat):
+    audio, _ = librosa.load(clip, sr=sr)
+    runs = shifters(n_steps, sr, block_size)
+    # Warm up FFT plans and resamplers so no side pays first-call costs
+    for run in runs.values():
+        run(audio[:sr])
+    _, times = cpu_times([lambda run=run: run(audio) for run in runs.values()], repeat=repeat)
+    row = {"clip": Path(clip).name, "n_steps": n_steps, "duration": round(len(audio) / sr, 2)}
+    row.update({f"{name}_cpu_s": round(elapsed, 4) for name, elapsed in zip(runs, times)})
+    speedups = {name: times[0] / elapsed for name, elapsed in zip(runs, times) if elapsed}
+    row["speedup"] = {name: round(speedup, 2) for name, speedup in speedups.items() if name != "librosa"}
+    row["ok"] = all(speedups[name] >= MIN_WSOLA_SPEEDUP for name in ("wsola", "blocks"))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check pitch shift backends against librosa')
+    parser.add_argument('--clips', nargs='*',
+                        default=sorted(str(p) for p in BACKEND_DIR.glob('test_march7th*.wav')),
+                        help='Input WAV files timed (default: backend/test_march7th*.wav)')
+    parser.add_argument('--sample-rate', type=int, default=24000)
+    parser.add_argument('--steps', nargs='+', type=float, default=ENGINE_STEPS)
+    parser.add_argument('--block-size', type=int, default=1024,
+                        help='Block size for the incremental runs')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions (best is kept)')
+    args = parser.parse_args()
+
+    quality = [check_quality(n_steps, args.sample_rate, args.block_size) for n_steps in args.steps]
+    speed = [check_speed(clip, n_steps, args.sample_rate, args.block_size, args.repeat)
+             for clip in args.clips for n_steps in args.steps]
+    result = {
+        "success": all(row["ok"] for row in quality + speed),
+        "max_pitch_error_cents": MAX_PITCH_ERROR_CENTS,
+        "max_extra_distance_db": MAX_EXTRA_DISTANCE_DB,
+        "min_wsola_speedup": MIN_WSOLA_SPEEDUP,
+        "quality": quality,
+        "speed": speed
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Offline check for the serve-mode request queue
+Drives a resident enhanced worker (with the Edge-TTS stand-in) through its
+JSON-line protocol: interactive requests overtaking queued batch work,
+cancelling queued and running requests, shedding and rejecting under
+overload, and waits dropped past their deadline, then prints the queue stats
+"""
+
+import argparse
+import json
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent / 'march7th_enhanced_tts.py'
+
+
+class WorkerClient:
+    def __init__(self, *options):
+        self.process = subprocess.Popen(
+            [sys.executable, str(SCRIPT), '--serve', '--edge-stub', *options],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', bufsize=1)
+        self.lines = queue.Queue()
+        # Final messages by id as (arrival, message); cancel acknowledgements apart
+        self.answers = {}
+        self.acks = {}
+        threading.Thread(target=self._read, daemon=True).start()
+        # Wait for the engine (and its DSP worker) before timing anything
+        self.send({"op": "ping", "id": "ping"})
+        self.wait_for("ping")
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.lines.put((time.perf_counter(), json.loads(line)))
+        self.lines.put(None)
+
+    def send(self, request):
+        self.process.stdin.write(json.dumps(request) + '\n')
+        self.process.stdin.flush()
+
+    def _collect(self, done, timeout):
+        deadline = time.perf_counter() + timeout
+        while not done():
+            entry = self.lines.get(timeout=max(deadline - time.perf_counter(), 0.01))
+            if entry is None:
+                raise RuntimeError("Worker exited")
+            arrival, message = entry
+            if message.get("event") == "segment" or "id" not in message:
+                continue
+            if message.get("op") == "cancel":
+                self.acks[message["id"]] = message
+            else:
+                self.answers[message["id"]] = (arrival, message)
+
+    def wait_for(self, *ids, timeout=60):
+        """Final messages (not segment events) for ids, as {id: (arrival, message)}."""
+        self._collect(lambda: not set(ids) - set(self.answers), timeout)
+        return {request_id: self.answers.pop(request_id) for request_id in ids}
+
+    def wait_for_acks(self, *ids, timeout=60):
+        """Cancel acknowledgements for ids, as {id: message}."""
+        self._collect(lambda: not set(ids) - set(self.acks), timeout)
+        return {request_id: self.acks.pop(request_id) for request_id in ids}
+
+    def close(self):
+        self.process.stdin.close()
+        return self.process.wait(timeout=60)
+
+
+def synthesize(directory, request_id, text, **fields):
+    return {"id": request_id, "text": text, "output": str(Path(directory) / f"{request_id}.wav"), **fields}
+
+
+def check_priority(client, directory):
+    """Batch work queued first; interactive requests sent later must be served before it."""
+    # Occupy the worker so everything below has to queue
+    client.send(synthesize(directory, "first", "Good morning, everyone."))
+    for index in range(4):
+        client.send(synthesize(directory, f"b{index}", f"Pre-rendered line number {index}.", priority="batch"))
+    client.send(synthesize(directory, "i0", "Hey, over here!"))
+    client.send(synthesize(directory, "i1", "Want to see my photos?"))
+    answers = client.wait_for("first", "b0", "b1", "b2", "b3", "i0", "i1")
+    order = [request_id for request_id, _ in sorted(answers.items(), key=lambda item: item[1][0])]
+    return {
+        "order": order,
+        "all_succeeded": all(message["success"] for _, message in answers.values()),
+        "interactive_first": order == ["first", "i0", "i1", "b0", "b1", "b2", "b3"],
+        "wait_ms": {request_id: message["queue"]["wait_ms"] for request_id, (_, message) in answers.items()}
+    }
+
+
+def check_cancel(client, directory):
+    """Cancel one request while it is queued and one while it runs."""
+    client.send(synthesize(directory, "run", "This line is cancelled while it is being synthesized."))
+    client.send(synthesize(directory, "wait", "This line is cancelled before it starts."))
+    time.sleep(0.1)
+    sent = time.perf_counter()
+    client.send({"op": "cancel", "id": "wait"})
+    client.send({"op": "cancel", "id": "run"})
+    answers = client.wait_for("wait", "run")
+    acks = client.wait_for_acks("wait", "run")
+    _, queued = answers["wait"]
+    arrival, running = answers["run"]
+    return {
+        "queued": {"dropped": queued.get("dropped"), "ack": acks["wait"].get("state")},
+        "running": {"dropped": running.get("dropped"), "ack": acks["run"].get("state"),
+                    "error": running.get("error"),
+                    "answered_after_ms": round((arrival - sent) * 1000, 1)},
+        "ok": (queued.get("dropped") == "cancelled" and running.get("dropped") == "cancelled"
+               and acks["wait"].get("state") == "queued" and acks["run"].get("state") == "running")
+    }
+
+
+def check_overload(client, directory, max_queue):
+    """Fill the queue with batch work, then flood it with interactive requests."""
+    batch = [f"o{index}" for index in range(max_queue + 1)]
+    interactive = [f"u{index}" for index in range(max_queue + 1)]
+    for request_id in batch:
+        client.send(synthesize(directory, request_id, f"Background line {request_id}.", priority="batch"))
+    for request_id in interactive:
+        client.send(synthesize(directory, request_id, f"Urgent line {request_id}."))
+    answers = client.wait_for(*batch, *interactive)
+    outcomes = {}
+    for request_id, (_, message) in answers.items():
+        outcome = message.get("dropped") or ("ok" if message["success"] else "error")
+        outcomes.setdefault(outcome, []).append(request_id)
+    return {
+        "outcomes": {outcome: sorted(ids) for outcome, ids in outcomes.items()},
+        # Batch work beyond the queue is turned away, the queued batch work makes way for
+        # interactive requests, and interactive requests beyond the queue are turned away
+        "ok": (sorted(outcomes.get("shed", [])) == batch[:max_queue]
+               and sorted(outcomes.get("rejected", [])) == [batch[-1], interactive[-1]]
+               and sorted(outcomes.get("ok", [])) == interactive[:max_queue])
+    }
+
+
+def check_expiry(directory, max_wait_ms):
+    """With a wait limit, requests stuck behind slow work are dropped instead of synthesized late."""
+    client = WorkerClient('--max-queue-wait-ms', str(max_wait_ms))
+    try:
+        ids = [f"e{index}" for index in range(6)]
+        for request_id in ids:
+            client.send(synthesize(directory, request_id, f"Queued line {request_id}, a bit longer than usual."))
+        answers = client.wait_for(*ids)
+        outcomes = {request_id: message.get("dropped") or ("ok" if message["success"] else "error")
+                    for request_id, (_, message) in answers.items()}
+        client.send({"op": "stats", "id": "stats"})
+        stats = client.wait_for("stats")["stats"][1]["queue"]
+    finally:
+        client.close()
+    dropped = [outcome for outcome in outcomes.values() if outcome in ("expired", "rejected")]
+    return {"outcomes": outcomes, "stats_dropped": stats["dropped"], "ok": bool(dropped) and "ok" in outcomes.values()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the serve-mode request queue offline')
+    parser.add_argument('--max-queue', type=int, default=3, help='Queue depth for the overload run')
+    parser.add_argument('--max-wait-ms', type=float, default=600.0, help='Wait limit for the expiry run')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = WorkerClient('--max-queue', str(args.max_queue + 4))
+        try:
+            priority = check_priority(client, directory)
+            cancel = check_cancel(client, directory)
+        finally:
+            client.close()
+
+        client = WorkerClient('--max-queue', str(args.max_queue))
+        try:
+            # Keep the worker busy so the queue fills up behind it
+            client.send(synthesize(directory, "busy", "A long line that keeps the worker busy for a while. " * 3))
+            time.sleep(0.1)
+            overload = check_overload(client, directory, args.max_queue)
+            client.wait_for("busy")
+            client.send({"op": "stats", "id": "stats"})
+            stats = client.wait_for("stats")["stats"][1]["queue"]
+        finally:
+            client.close()
+
+        expiry = check_expiry(directory, args.max_wait_ms)
+
+    checks = {
+        "interactive_first": priority["interactive_first"] and priority["all_succeeded"],
+        "cancel": cancel["ok"],
+        "overload": overload["ok"],
+        "expiry": expiry["ok"]
+    }
+    result = {
+        "success": all(checks.values()),
+        "checks": checks,
+        "priority": priority,
+        "cancel": cancel,
+        "overload": overload,
+        "expiry": expiry,
+        "stats": stats
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
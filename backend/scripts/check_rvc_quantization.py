@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Check reduced-precision RVC inference against fp32
+Converts the same clips with an fp32 converter and a quantized one (int8
+HuBERT, bfloat16 decoder blocks where the CPU has native kernels) and reports
+load time, conversion CPU/wall time and real-time factor. The quantization
+error is set against the change a content edit makes: the fp32 converter
+is also run with its content features reversed in time, and the quantized
+output must stay at least MIN_MARGIN_DB closer to fp32 than that, and
+within MAX_DISTANCE_SHARE of its log-spectral distance. The
+check fails on a model whose output does not follow its content features,
+on a larger error, or on a speedup below MIN_SPEEDUP
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from check_voice_effects import log_spectral_distance
+from rvc_inference import RVCConverter, configure_threads
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# The 39 s clip takes minutes per conversion at RVC v2 width; pass it with --clips
+DEFAULT_CLIPS = ['test_march7th.wav', 'test_march7th_rvc.wav']
+
+
+def timed(func, *args, repeat=3):
+    """Best wall and CPU time over repeat runs, plus the last result."""
+    best_wall = best_cpu = None
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = func(*args)
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    return result, best_wall, best_cpu
+
+
+# A content edit must move the output by at least this much (SNR at most)
+MAX_CONTENT_SNR_DB = 40.0
+# Quantization must move it at least this much less than a content edit
+MIN_MARGIN_DB = 6.0
+# ... and keep the log-spectral distance under this share of a content edit's
+MAX_DISTANCE_SHARE = 0.5
+# With bfloat16 decoder blocks; an int8 HuBERT alone only has to keep up with fp32
+MIN_SPEEDUP = 1.3
+
+
+class ReversedContent(RVCConverter):
+    """fp32 converter fed its content features back to front: same pitch and noise, other content."""
+
+    def content_features(self, audio):
+        return np.ascontiguousarray(super().content_features(audio)[::-1])
+
+
+def snr_db(reference, candidate):
+    noise = np.sum((reference - candidate) ** 2)
+    return float(10 * np.log10(np.sum(reference ** 2) / noise)) if noise else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fp32 and int8 RVC inference')
+    parser.add_argument('--model', help='RVC checkpoint (default: generate a random test model)')
+    parser.add_argument('--index', help='Feature index (required with --model)')
+    parser.add_argument('--hubert', help='hubert_base.pt (default: next to the model)')
+    parser.add_argument('--hidden', type=int, default=192,
+                        help='Synthesizer width of the generated test model (192 is RVC v2)')
+    parser.add_argument('--hubert-dims', type=int, default=768,
+                        help='HuBERT width of the generated test model (768 is HuBERT base)')
+    parser.add_argument('--hubert-layers', type=int, default=12,
+                        help='HuBERT layers of the generated test model')
+    parser.add_argument('--clips', nargs='*',
+                        default=[str(BACKEND_DIR / name) for name in DEFAULT_CLIPS],
+                        help='Input WAV files (default: the two short backend/test_march7th*.wav clips)')
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    parser.add_argument('--interop-threads', type=int, default=1, help='torch inter-op threads')
+    parser.add_argument('--repeat', type=int, default=1, help='Timing repetitions (best is kept)')
+    args = parser.parse_args()
+    configure_threads(args.threads, args.interop_threads)
+
+    # Keep the converters' progress messages out of the JSON report
+    with tempfile.TemporaryDirectory(prefix='rvc_int8_') as work_dir, \
+            contextlib.redirect_stdout(sys.stderr):
+        if args.model:
+            model_path, index_path = args.model, args.index
+        else:
+            from make_test_rvc_model import write_test_model
+            model_path, index_path, _ = write_test_model(work_dir, hidden=args.hidden, hubert_dims=args.hubert_dims,
+                                                         hubert_layers=args.hubert_layers)
+
+        converters = {}
+        load_times = {}
+        for name, quantized in (('fp32', False), ('int8', True)):
+            start = time.perf_counter()
+            converters[name] = RVCConverter(model_path, index_path, hubert_path=args.hubert,
+                                            quantized=quantized, quantized_cache_dir=work_dir)
+            load_times[name] = round(time.perf_counter() - start, 4)
+
+        # A second int8 load comes from the on-disk cache
+        start = time.perf_counter()
+        RVCConverter(model_path, index_path, hubert_path=args.hubert, quantized=True,
+                     quantized_cache_dir=work_dir)
+        load_times['int8_cached'] = round(time.perf_counter() - start, 4)
+        reversed_content = ReversedContent(model_path, index_path, hubert_path=args.hubert)
+        bf16 = converters['int8'].bf16
+        min_speedup = MIN_SPEEDUP if bf16 else 1.0
+
+        clips = []
+        for clip in args.clips:
+            audio, sr = sf.read(clip, dtype='float32')
+            if audio.ndim > 1:
+                audio = audio.mean(axis=1)
+            duration = len(audio) / sr
+            outputs = {}
+            row = {"clip": Path(clip).name, "duration": round(duration, 2)}
+            for name, converter in converters.items():
+                # Warm up the kernels for this clip's segment lengths outside the measurement
+                converter.convert(audio, sr)
+                outputs[name], wall, cpu = timed(converter.convert, audio, sr, repeat=args.repeat)
+                row[f"{name}_wall_s"] = round(wall, 4)
+                row[f"{name}_cpu_s"] = round(cpu, 4)
+                row[f"{name}_rtf"] = round(wall / duration, 4)
+            speedup = row["fp32_wall_s"] / row["int8_wall_s"]
+            distance = log_spectral_distance(outputs['fp32'], outputs['int8'])
+            quantized_snr = snr_db(outputs['fp32'], outputs['int8'])
+            edited = reversed_content.convert(audio, sr)
+            content_snr = snr_db(outputs['fp32'], edited)
+            content_distance = log_spectral_distance(outputs['fp32'], edited)
+            row.update({
+                "speedup": round(speedup, 2),
+                "log_spectral_distance_db": round(distance, 3),
+                "snr_db": round(quantized_snr, 2),
+                "content_edit_snr_db": round(content_snr, 2),
+                "content_edit_distance_db": round(content_distance, 3),
+                "checks": {
+                    "output_follows_content": content_snr <= MAX_CONTENT_SNR_DB,
+                    "error_below_content_edit": quantized_snr - content_snr >= MIN_MARGIN_DB,
+                    "spectrum_preserved": distance <= MAX_DISTANCE_SHARE * content_distance,
+                    "faster": speedup >= min_speedup
+                }
+            })
+            clips.append(row)
+
+    result = {
+        "success": bool(clips) and all(all(row["checks"].values()) for row in clips)
+                   and load_times['int8_cached'] < load_times['int8'],
+        "threads": args.threads,
+        "interop_threads": args.interop_threads,
+        "bf16_decoder": bf16,
+        "min_speedup": min_speedup,
+        "load_s": load_times,
+        "clips": clips
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
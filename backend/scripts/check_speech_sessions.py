@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Offline check for persistent base speech sessions
+Runs utterances against the SAPI stand-in with a fresh process per utterance
+(as the engines used to launch PowerShell) and through resident sessions,
+concurrently through a pool, and across a session crash, and reports the
+latency of each
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from speech_session_stub import DEFAULT_AUDIO
+from tts_speech import STUB_SCRIPT, SpeechSession, SpeechSessionPool
+
+
+def stub_command(startup, latency, crash_after=None):
+    command = [sys.executable, str(STUB_SCRIPT), '--startup', str(startup), '--latency', str(latency)]
+    return command + ['--crash-after', str(crash_after)] if crash_after else command
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run_check(utterances, sessions, startup, latency):
+    texts = [f"Line number {i}" for i in range(utterances)]
+    expected = Path(DEFAULT_AUDIO).read_bytes()
+
+    def per_launch(text):
+        session = SpeechSession(stub_command(startup, latency))
+        try:
+            return session.speak(text)
+        finally:
+            session.close()
+
+    launched, launch_time = timed(lambda: [per_launch(text) for text in texts])
+
+    with SpeechSessionPool(stub_command(startup, latency)) as pool:
+        pool.speak("warm up")
+        resident, resident_time = timed(lambda: [pool.speak(text) for text in texts])
+
+    with SpeechSessionPool(stub_command(startup, latency), size=sessions) as pool:
+        with ThreadPoolExecutor(max_workers=sessions) as threads:
+            list(threads.map(pool.speak, ["warm up"] * sessions))
+            pooled, pooled_time = timed(lambda: list(threads.map(pool.speak, texts)))
+        pooled_stats = pool.stats()
+
+    # The session exits on its third utterance; the pool restarts it and retries
+    with SpeechSessionPool(stub_command(startup, latency, crash_after=3)) as pool:
+        crashed = [pool.speak(text) for text in texts[:5]]
+        crash_stats = pool.stats()
+
+    checks = {
+        "all_audio_returned": all(audio == expected for audio in launched + resident + pooled + crashed),
+        "one_start_per_session": pooled_stats["restarts"] == 0 and pooled_stats["running"] == sessions,
+        "crashed_session_restarted": crash_stats["restarts"] >= 1 and crash_stats["running"] == 1
+    }
+    return {
+        "success": all(checks.values()),
+        "checks": checks,
+        "utterances": utterances,
+        "per_launch_ms": round(1000 * launch_time / utterances, 1),
+        "resident_ms": round(1000 * resident_time / utterances, 1),
+        "speedup": round(launch_time / resident_time, 1),
+        "pooled_ms": round(1000 * pooled_time / utterances, 1),
+        "pool": pooled_stats,
+        "crash": crash_stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check persistent SAPI sessions against the local stand-in')
+    parser.add_argument('--utterances', type=int, default=12)
+    parser.add_argument('--sessions', type=int, default=3, help='Pool size for the concurrent run')
+    parser.add_argument('--startup', type=float, default=0.5,
+                        help='Simulated session start-up (s); PowerShell with System.Speech takes about this')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated synthesis time (s)')
+    args = parser.parse_args()
+
+    result = run_check(args.utterances, args.sessions, args.startup, args.latency)
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Check the fused voice effects chain against the original serial chains
+Runs both on the checked-in test clips and checks that the fused output
+matches its reference within MAX_DISTANCE_DB of log-spectral distance and
+that it takes at most 1 / MIN_SPEEDUP of the serial chain's CPU time.
+The march7th_rvc reference is a single 7-semitone librosa shift: the serial
+chain stacked two shifts, which the fused chain collapses on purpose. The
+march7th_enhanced chain has a single shift, so there the fused pass only
+has to be no slower than the serial one
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import librosa
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+from voice_effects import VoiceEffectsChain
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def serial_enhanced(audio, sr):
+    """The chain enhance_voice_for_march7th used to run, step by step."""
+    audio = librosa.effects.pitch_shift(audio, sr=sr, n_steps=2)
+    t = np.linspace(0, len(audio) / sr, len(audio))
+    audio = audio * (1 + 0.08 * np.sin(2 * np.pi * 5.5 * t))
+    sos = butter(2, 1000, btype='highpass', fs=sr, output='sos')
+    audio = audio + sosfilt(sos, audio) * 0.15
+    delay_samples = int(0.05 * sr)
+    reverb_audio = np.pad(np.copy(audio), (delay_samples, 0))[:len(audio)]
+    audio = 0.85 * audio + 0.15 * reverb_audio
+    return librosa.util.normalize(audio) * 0.8
+
+
+def serial_rvc(audio, sr):
+    """apply_rvc_conversion followed by enhance_voice_characteristics, as before."""
+    audio = librosa.effects.pitch_shift(audio, sr=sr, n_steps=4)
+    audio = librosa.effects.pitch_shift(audio, sr=sr, n_steps=3)
+    t = np.linspace(0, len(audio) / sr, len(audio))
+    audio = audio * (1 + 0.1 * np.sin(2 * np.pi * 4.5 * t))
+    return audio / np.max(np.abs(audio)) * 0.8
+
+
+def single_shift_rvc(audio, sr):
+    """serial_rvc with its two shifts done as one, which is what the fused chain computes."""
+    audio = librosa.effects.pitch_shift(audio, sr=sr, n_steps=7)
+    t = np.linspace(0, len(audio) / sr, len(audio))
+    audio = audio * (1 + 0.1 * np.sin(2 * np.pi * 4.5 * t))
+    return audio / np.max(np.abs(audio)) * 0.8
+
+
+SERIAL_CHAINS = {
+    'march7th_enhanced': serial_enhanced,
+    'march7th_rvc': serial_rvc
+}
+
+REFERENCES = {
+    'march7th_enhanced': serial_enhanced,
+    'march7th_rvc': single_shift_rvc
+}
+
+MAX_DISTANCE_DB = 1.0
+
+# One STFT round trip instead of two for the rvc preset; the single-shift
+# enhanced preset only saves the separate high-pass and tremolo sweeps
+MIN_SPEEDUP = {
+    'march7th_enhanced': 1.0,
+    'march7th_rvc': 1.4
+}
+
+
+def log_spectral_distance(reference, candidate):
+    """Mean per-frame RMS difference of the log magnitude spectra, in dB."""
+    ref = np.abs(librosa.stft(reference)) + 1e-8
+    cand = np.abs(librosa.stft(candidate)) + 1e-8
+    frames = min(ref.shape[1], cand.shape[1])
+    diff = 20 * np.log10(ref[:, :frames] / cand[:, :frames])
+    return float(np.mean(np.sqrt(np.mean(diff ** 2, axis=0))))
+
+
+def cpu_times(funcs, *args, repeat=3):
+    """Best CPU time of each function, run in turns so both see the same machine load."""
+    best = [None] * len(funcs)
+    results = [None] * len(funcs)
+    for _ in range(repeat):
+        for index, func in enumerate(funcs):
+            start = time.process_time()
+            results[index] = func(*args)
+            elapsed = time.process_time() - start
+            best[index] = elapsed if best[index] is None else min(best[index], elapsed)
+    return results, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fused and serial voice effect chains')
+    parser.add_argument('--clips', nargs='*',
+                        default=sorted(str(p) for p in BACKEND_DIR.glob('test_march7th*.wav')),
+                        help='Input WAV files (default: backend/test_march7th*.wav)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is kept)')
+    args = parser.parse_args()
+
+    report = []
+    for clip in args.clips:
+        audio, sr = librosa.load(clip, sr=22050)
+        for preset, serial in SERIAL_CHAINS.items():
+            fused_chain = VoiceEffectsChain.from_preset(preset)
+            # Warm up FFT plans and resampler so neither side pays first-call costs
+            fused_chain.process(audio[:sr], sr)
+            serial(audio[:sr], sr)
+
+            (_, fused), (serial_time, fused_time) = cpu_times([serial, fused_chain.process], audio, sr,
+                                                              repeat=args.repeat)
+            speedup = serial_time / fused_time if fused_time else float('inf')
+            distance = log_spectral_distance(REFERENCES[preset](audio, sr), fused)
+            report.append({
+                "clip": Path(clip).name,
+                "preset": preset,
+                "duration": round(len(audio) / sr, 2),
+                "serial_cpu_s": round(serial_time, 4),
+                "fused_cpu_s": round(fused_time, 4),
+                "speedup": round(speedup, 2),
+                "min_speedup": MIN_SPEEDUP[preset],
+                "log_spectral_distance_db": round(distance, 3),
+                "ok": bool(distance <= MAX_DISTANCE_DB and speedup >= MIN_SPEEDUP[preset])
+            })
+
+    result = {
+        "success": bool(report) and all(entry["ok"] for entry in report),
+        "max_distance_db": MAX_DISTANCE_DB,
+        "cases": report
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
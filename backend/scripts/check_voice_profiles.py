@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Offline check for voice profile loading and hot reload
+Loads the shipped profiles config, then edits a scratch copy under a live
+VoiceProfileRegistry and checks that only edited profiles are recompiled,
+that numeric pitches are taken as percentages, and that a profile with an
+invalid pitch, or a file that fails to parse, leaves the previous profiles
+in place instead of failing lookups
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+from voice_profiles import BUILTIN_PROFILES, DEFAULT_PROFILE, PROFILES_PATH, VoiceProfileRegistry, edge_prosody
+
+OFFSET = re.compile(r'^[+-]\d+(%|Hz)$')
+
+
+def write_config(path, data, generation):
+    """Rewrite the config with a distinct mtime, so the registry sees every edit."""
+    path.write_text(json.dumps(data), encoding='utf-8')
+    stamp = 1_000_000_000 + generation
+    os.utime(path, ns=(stamp * 10 ** 9, stamp * 10 ** 9))
+
+
+def check_shipped(path):
+    """Every shipped profile compiles, resolves by key and by character, and sends valid offsets."""
+    registry = VoiceProfileRegistry(path)
+    data = json.loads(Path(path).read_text(encoding='utf-8'))
+    profiles = {name: profile.prosody for name, profile in registry.profiles.items()}
+    ok = (sorted(registry.profiles) == sorted(data["profiles"])
+          and registry.get() is registry.profiles[data.get("default", DEFAULT_PROFILE)]
+          and all(registry.get(profile.character) is profile for profile in registry.profiles.values())
+          and all(OFFSET.match(value) for prosody in profiles.values() for value in prosody.values()))
+    return ok, profiles
+
+
+def check_prosody():
+    """Numbers are percentages like their string form; other pitch types are rejected."""
+    numeric = {str(pitch): edge_prosody(pitch=pitch)["pitch"] for pitch in (15, -5, 7.5)}
+    ok = numeric == {str(pitch): edge_prosody(pitch=f"{pitch:+}%")["pitch"] for pitch in (15, -5, 7.5)}
+    rejected = {}
+    for pitch in (None, True, "+15", ["+15%"]):
+        try:
+            edge_prosody(pitch=pitch)
+            rejected[repr(pitch)] = False
+        except ValueError:
+            rejected[repr(pitch)] = True
+    return ok and all(rejected.values()), {"numeric": numeric, "rejected": rejected}
+
+
+def check_reload(path):
+    """Edits a scratch config under a live registry, one step at a time."""
+    data = json.loads(Path(path).read_text(encoding='utf-8'))
+    names = sorted(data["profiles"])
+    edited, other = names[0], names[1]
+    steps = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Path(tmp) / 'voice_profiles.json'
+        missing = VoiceProfileRegistry(config)
+        steps["missing_file_uses_builtin"] = sorted(missing.profiles) == sorted(BUILTIN_PROFILES)
+
+        write_config(config, data, 1)
+        registry = VoiceProfileRegistry(config)
+        before = dict(registry.profiles)
+
+        data["profiles"][edited]["edge"]["pitch"] = 12
+        write_config(config, data, 2)
+        profile = registry.get(edited)
+        steps["numeric_pitch_loaded"] = (profile is not before[edited]
+                                         and profile.prosody["pitch"] == edge_prosody(pitch="+12%")["pitch"]
+                                         and profile.fingerprint != before[edited].fingerprint)
+        steps["unedited_kept"] = registry.profiles[other] is before[other]
+        numeric = profile
+
+        data["profiles"][edited]["edge"]["pitch"] = ["+12%"]
+        data["profiles"][other]["edge"]["rate"] = 1.3
+        write_config(config, data, 3)
+        steps["invalid_pitch_keeps_previous"] = registry.get(edited) is numeric
+        steps["valid_edit_alongside_applied"] = registry.get(other).prosody["rate"] == "+30%"
+
+        config.write_text('{"profiles": ', encoding='utf-8')
+        os.utime(config, ns=(1_000_000_004 * 10 ** 9,) * 2)
+        steps["broken_file_keeps_previous"] = (registry.get(edited) is numeric
+                                               and sorted(registry.profiles) == names)
+    return all(steps.values()), steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check voice profile loading and hot reload')
+    parser.add_argument('--profiles', default=str(PROFILES_PATH),
+                        help='Profiles config to load (default: $MARCH7TH_VOICE_PROFILES or backend/config)')
+    args = parser.parse_args()
+
+    shipped_ok, shipped = check_shipped(args.profiles)
+    prosody_ok, prosody = check_prosody()
+    reload_ok, reload = check_reload(args.profiles)
+    checks = {
+        "shipped_profiles_load": shipped_ok,
+        "pitch_types": prosody_ok,
+        "hot_reload": reload_ok
+    }
+    result = {
+        "success": all(checks.values()),
+        "checks": checks,
+        "profiles": shipped,
+        "prosody": prosody,
+        "reload": reload
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if result["success"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
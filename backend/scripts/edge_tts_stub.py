@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Edge-TTS service
+Mimics edge_tts.Communicate by streaming a checked-in WAV after a simulated
+network latency, and records how many calls were made and how many overlapped
+"""
+
+import asyncio
+from pathlib import Path
+
+DEFAULT_AUDIO = Path(__file__).resolve().parent.parent / "test_march7th.wav"
+
+
+class StubEdgeService:
+    def __init__(self, audio_path=DEFAULT_AUDIO, latency=0.3, chunk_size=4096):
+        """
+        Args:
+            audio_path: File whose bytes are returned as the synthesized audio
+            latency: Seconds to wait before the first chunk, like a network round trip
+            chunk_size: Size of each streamed audio chunk
+        """
+        self.audio = Path(audio_path).read_bytes()
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        # (text, voice, options) of every Communicate created
+        self.requests = []
+
+    def communicate(self, text, voice, **kwargs):
+        """Factory with the same call signature as edge_tts.Communicate."""
+        self.requests.append((text, voice, kwargs))
+        return StubCommunicate(self, text, voice)
+
+
+class StubCommunicate:
+    def __init__(self, service, text, voice):
+        self.service = service
+        self.text = text
+        self.voice = voice
+
+    async def stream(self):
+        service = self.service
+        service.calls += 1
+        service.active += 1
+        service.max_active = max(service.max_active, service.active)
+        try:
+            await asyncio.sleep(service.latency)
+            for start in range(0, len(service.audio), service.chunk_size):
+                yield {"type": "audio", "data": service.audio[start:start + service.chunk_size]}
+        finally:
+            service.active -= 1
+
+    async def save(self, audio_fname):
+        with open(audio_fname, "wb") as f:
+            async for chunk in self.stream():
+                if chunk["type"] == "audio":
+                    f.write(chunk["data"])
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Generate a tiny randomly initialized RVC model, HuBERT and feature index
+Writes them in the formats RVC and fairseq use (an exported v2 .pth with
+fp16 weight-normalized parameters, a hubert_base.pt with pickled config
+objects next to the weights, and a feature index), so the real inference
+path of march7th_rvc_tts.py can be exercised without the trained
+March 7th model
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from torch import nn
+
+from rvc_models import HubertModel, Synthesizer
+
+# Parameters RVC and fairseq keep weight-normalized, with the normalized dimension
+WEIGHT_NORM_PARAMS = [
+    (re.compile(r'^dec\.ups\.\d+\.weight$'), 0),
+    (re.compile(r'^dec\.resblocks\.\d+\.convs[12]?\.\d+\.weight$'), 0),
+    (re.compile(r'^flow\.flows\.\d+\.enc\.(in_layers\.\d+|res_skip_layers\.\d+|cond_layer)\.weight$'), 0),
+    (re.compile(r'^encoder\.pos_conv\.0\.weight$'), 2)
+]
+
+# Decoder upsampling RVC's configs use per output rate (100 feature frames a second)
+UPSAMPLING = {
+    32000: ([10, 4, 2, 2, 2], [16, 16, 4, 4, 4]),
+    40000: ([10, 10, 2, 2], [16, 16, 4, 4]),
+    48000: ([12, 10, 2, 2], [24, 20, 4, 4])
+}
+
+
+def weight_normalized(state):
+    """State dict with weight-normalized parameters split into weight_g/weight_v, as saved by training."""
+    saved = {}
+    for name, value in state.items():
+        dim = next((dim for pattern, dim in WEIGHT_NORM_PARAMS if pattern.match(name)), None)
+        if dim is None:
+            saved[name] = value
+            continue
+        prefix = name[:-len('.weight')]
+        dims = [other for other in range(value.dim()) if other != dim]
+        saved[f"{prefix}.weight_g"] = value.norm(dim=dims, keepdim=True)
+        saved[f"{prefix}.weight_v"] = value
+    return saved
+
+
+def content_driven_decoder(dec, gain=0.5, excitation=0.1, post_gain=10.0):
+    """
+    Re-initialize a random NSF decoder so its output follows the latent it is given
+
+    With PyTorch's default init every upsampling layer shrinks the latent,
+    and the output is made of the conv biases and the F0 excitation, so it
+    hardly depends on the content features. Here the weights are scaled to
+    the fan-in, the biases are zeroed, the excitation is damped and the
+    output has no DC offset.
+    """
+    with torch.no_grad():
+        for name, module in dec.named_modules():
+            if not isinstance(module, (nn.Conv1d, nn.ConvTranspose1d)):
+                continue
+            fan_in = module.in_channels * module.kernel_size[0] / module.groups
+            if isinstance(module, nn.ConvTranspose1d):
+                fan_in /= module.stride[0]
+            module.weight.normal_(0.0, gain / math.sqrt(fan_in))
+            if module.bias is not None:
+                module.bias.zero_()
+            if name.startswith('noise_convs.'):
+                module.weight.mul_(excitation)
+            elif name == 'conv_post':
+                # Zero-mean taps keep the positive mean of leaky_relu out of the output
+                module.weight.sub_(module.weight.mean(dim=2, keepdim=True)).mul_(post_gain)
+
+
+def write_test_model(output_dir, name='March7th_test', hidden=64, hubert_dims=64, hubert_layers=2,
+                     sample_rate=40000, index_rows=2048, seed=7):
+    """
+    Write a random RVC model, hubert_base.pt and index; returns (model_path, index_path, info)
+
+    The model is a v2-style f0 model with feature_dims = hubert_dims and a
+    decoder that responds to its content features (content_driven_decoder);
+    the HuBERT is written next to it, where RVCConverter looks by default.
+    """
+    upsample_rates, upsample_kernel_sizes = UPSAMPLING[sample_rate]
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # RVC's config list: spec_channels, segment_size, inter_channels, hidden_channels,
+    # filter_channels, n_heads, n_layers, kernel_size, p_dropout, resblock,
+    # resblock_kernel_sizes, resblock_dilation_sizes, upsample_rates,
+    # upsample_initial_channel, upsample_kernel_sizes, spk_embed_dim, gin_channels, sr
+    config = [1025, 32, hidden, hidden, hidden * 2, 2, 2, 3, 0, "1", [3, 7, 11],
+              [[1, 3, 5], [1, 3, 5], [1, 3, 5]], upsample_rates, hidden * 2, upsample_kernel_sizes, 109,
+              hidden, sample_rate]
+    net = Synthesizer(*config, feature_dims=hubert_dims)
+    content_driven_decoder(net.dec)
+    model_path = output_dir / f"{name}.pth"
+    torch.save({
+        "weight": {key: value.half() for key, value in weight_normalized(net.state_dict()).items()},
+        "config": config,
+        "info": "random test model",
+        "sr": f"{sample_rate // 1000}k",
+        "f0": 1,
+        "version": "v2"
+    }, model_path)
+
+    hubert = HubertModel(conv_channels=32, dims=hubert_dims, ffn_dims=hubert_dims * 2, layers=hubert_layers,
+                         heads=max(1, hubert_dims // 64), pos_kernel=16, pos_groups=4, final_dims=hubert_dims)
+    hubert_path = output_dir / 'hubert_base.pt'
+    # fairseq stores its options as objects; the loader must not need them
+    torch.save({"args": argparse.Namespace(arch='hubert'), "cfg": {"model": {"_name": "hubert"}},
+                "model": weight_normalized(hubert.state_dict())}, hubert_path)
+
+    # Content-feature-like rows: a smooth offset per dimension plus noise
+    features = (rng.normal(0.0, 1.0, hubert_dims)
+                + rng.normal(0.0, 0.5, (index_rows, hubert_dims))).astype(np.float32)
+    index_path = output_dir / f"{name}.index"
+    with open(index_path, 'wb') as f:
+        # np.save on a file object keeps the .index name instead of adding .npy
+        np.save(f, features)
+
+    info = {
+        "model": str(model_path),
+        "hubert": str(hubert_path),
+        "index": str(index_path),
+        "parameters": sum(p.numel() for p in net.parameters()),
+        "hubert_parameters": sum(p.numel() for p in hubert.parameters()),
+        "config": config
+    }
+    return model_path, index_path, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a tiny random RVC model, HuBERT and index')
+    parser.add_argument('--output-dir', default='.', help='Directory for the generated files')
+    parser.add_argument('--name', default='March7th_test', help='Base name of the .pth/.index files')
+    parser.add_argument('--hidden', type=int, default=64, help='Synthesizer hidden width')
+    parser.add_argument('--hubert-dims', type=int, default=64, help='HuBERT (and content feature) width')
+    parser.add_argument('--hubert-layers', type=int, default=2, help='HuBERT transformer layers')
+    parser.add_argument('--sample-rate', type=int, default=40000, choices=[32000, 40000, 48000])
+    parser.add_argument('--index-rows', type=int, default=2048, help='Rows in the feature index')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    _, _, info = write_test_model(
+        args.output_dir, args.name, hidden=args.hidden, hubert_dims=args.hubert_dims,
+        hubert_layers=args.hubert_layers, sample_rate=args.sample_rate, index_rows=args.index_rows,
+        seed=args.seed
+    )
+    print(json.dumps(info, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
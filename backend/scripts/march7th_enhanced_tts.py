@@ -5,206 +5,931 @@ This provides much better voice quality than basic SAPI while being web-compatib
 """
 
 import asyncio
-import edge_tts
-import librosa
-import soundfile as sf
-import numpy as np
 import argparse
+import codecs
+import contextlib
 import json
+import logging
 import os
 import sys
-import tempfile
+import time
 from pathlib import Path
 
+from tts_batch import add_batch_arguments, run_batch
+from tts_budget import BudgetTimer, LatencyScheduler, RequestCancelled, add_budget_arguments
+from tts_cache import add_cache_arguments, cache_from_args
+from tts_edge import EdgeSpeechFetcher
+from tts_logging import add_logging_arguments, logging_from_args, setup_logging
+from tts_metrics import add_metrics_arguments, metrics_from_args
+from tts_output import AudioWriter, add_output_arguments, is_stream_target, resolve_format
+from tts_phrases import add_phrase_arguments, crossfade_blocks, match_rate, phrase_index_from_args, phrase_report
+from tts_pipeline import CancelFlag, DSPPipeline, SharedAudio, add_pipeline_arguments
+from tts_profiling import add_profiling_arguments, record_timings, run_profiled
+from tts_queue import add_queue_arguments, queue_from_args
+from tts_server import serve
+from tts_text import SentenceBuffer
+from voice_effects import add_effects_arguments
+from voice_profiles import PROFILES_PATH, VoiceProfileRegistry, add_profile_arguments, profiles_from_args
+
+log = logging.getLogger('march7th.enhanced')
+
 class March7thEnhancedTTS:
-    def __init__(self):
-        """Initialize March 7th Enhanced TTS."""
-        # Use a young female voice from Edge-TTS
-        # These are high-quality neural voices
-        self.voice_options = [
-            "en-US-JennyNeural",      # Young, energetic female
-            "en-US-AriaNeural",       # Clear, youthful female  
-            "en-US-CoraNeural",       # Warm, friendly female
-            "en-GB-LibbyNeural",      # Young British female
-            "en-AU-NatashaNeural"     # Young Australian female
-        ]
-        self.selected_voice = self.voice_options[0]  # Default to Jenny
-        print(f"Using Edge-TTS voice: {self.selected_voice}")
+    model_name = "March7th_Enhanced_EdgeTTS"
+    
+    def __init__(self, cache=None, fetcher=None, block_threshold=30.0, output_format=None, bitrate=None,
+                 profiles=None, voice_profile=None, phrases=None, pipeline=None):
+        """
+        Initialize March 7th Enhanced TTS.
+        
+        Args:
+            cache: Optional AudioCache used to reuse earlier renders (a
+                DistributedAudioCache shares them across workers and hosts)
+            fetcher: Optional EdgeSpeechFetcher shared across requests
+            block_threshold: Base speech longer than this many seconds is
+                enhanced block by block (None disables block mode)
+            output_format: Output codec (see tts_output.OUTPUT_FORMATS), None
+                picks it from each output path
+            bitrate: Target kbps for compressed output codecs
+            profiles: Optional VoiceProfileRegistry; the config's effects
+                chains are compiled here, once per engine
+            voice_profile: Profile used when a request names none (default:
+                the config's default, March 7th)
+            phrases: Optional PhraseIndex of precomputed stock phrases
+            pipeline: Optional DSPPipeline whose workers (initialized with
+                init_enhance_worker) run the enhancement while the event loop
+                keeps fetching base speech
+        """
+        self.cache = cache
+        self.block_threshold = block_threshold
+        self.output_format = output_format
+        self.bitrate = bitrate
+        self.fetcher = fetcher or EdgeSpeechFetcher()
+        self.profiles = profiles or VoiceProfileRegistry()
+        self.voice_profile = voice_profile
+        self.phrases = phrases
+        self.pipeline = pipeline
+        self.scheduler = LatencyScheduler()
+        profile = self.profile()
+        log.info("Using Edge-TTS voice: %s (%s)", profile.voice, profile.character)
+    
+    def profile(self, name=None):
+        """Voice profile for a request, reloading the config if it was edited."""
+        return self.profiles.get(name or self.voice_profile)
     
-    async def generate_base_speech(self, text, output_path):
-        """Generate high-quality base speech using Edge-TTS."""
+    async def generate_base_speech(self, text, profile=None):
+        """Generate high-quality base speech using Edge-TTS; returns the encoded audio bytes."""
+        profile = profile or self.profile()
         try:
-            print(f"Generating Edge-TTS speech for: '{text}'")
-            
-            # Configure voice with March 7th characteristics
-            # Edge-TTS supports SSML for voice modulation
-            ssml_text = f"""
-            <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="en-US">
-                <voice name="{self.selected_voice}">
-                    <prosody rate="1.15" pitch="+15%" volume="95">
-                        {text}
-                    </prosody>
-                </voice>
-            </speak>
-            """
-            
-            # Generate speech using Edge-TTS
-            communicate = edge_tts.Communicate(ssml_text, self.selected_voice)
-            await communicate.save(output_path)
-            
-            if os.path.exists(output_path):
-                print(f"Edge-TTS generated: {output_path}")
-                return True
-            else:
-                raise RuntimeError("Edge-TTS failed to generate audio file")
+            log.debug("Generating Edge-TTS speech for: %r", text)
+            
+            # Generate speech using Edge-TTS (bounded and coalesced across requests);
+            # the character's prosody goes as Communicate options, since the text is escaped
+            audio_bytes = await self.fetcher.fetch(text, profile.voice, **profile.prosody)
+            log.debug("Edge-TTS generated %d bytes", len(audio_bytes))
+            return audio_bytes
                 
         except Exception as e:
-            print(f"Edge-TTS generation error: {e}")
-            return False
+            log.error("Edge-TTS generation error: %s", e)
+            return None
     
-    def enhance_voice_for_march7th(self, audio_path, output_path):
-        """Apply March 7th-specific voice enhancements."""
+    def open_output(self, output_path, sample_rate):
+        """Encoder for a file path or a stdout/socket target (see tts_output)."""
+        return AudioWriter(output_path, sample_rate, self.output_format, self.bitrate)
+    
+    def use_blocks(self, audio, sr):
+        """Long replies run the effects in fixed-size blocks, spilled to disk instead of held until normalized."""
+        return self.block_threshold is not None and len(audio) > self.block_threshold * sr
+    
+    def plans(self, audio, sr):
+        """Scheduler tiers for one utterance, best first, with the stages each runs."""
+        full = ['block_effects'] if self.use_blocks(audio, sr) else ['pitch_shift_eq', 'tremolo_echo', 'normalize']
+        return [
+            ('full', full),
+            ('reduced', ['tremolo_echo', 'normalize']),
+            ('base_only', ['normalize'])
+        ]
+    
+    def render_tier(self, tier, audio, sr, timer, profile, normalize=True):
+        """
+        Process decoded base speech for one tier; returns the blocks to encode.
+        
+        normalize=False skips the final normalization, for runs that are
+        normalized together with the rest of a reply.
+        """
+        from voice_effects import render_blocks
+        if tier == 'full':
+            if self.use_blocks(audio, sr):
+                return render_blocks(profile.effects, audio, sr, timer=timer, normalize=normalize)
+            # Apply the character's effects in one fused pass: pitch shift and
+            # brightness share a single STFT, then the precompiled tremolo
+            # table, echo and normalization to 0.8
+            return [profile.effects.process(audio, sr, timer=timer, normalize=normalize)]
+        if tier == 'reduced':
+            return [profile.reduced_effects.process(audio, sr, timer=timer, normalize=normalize)]
+        if not normalize:
+            return [audio]
+        with timer.stage("normalize"):
+            return [profile.effects.normalize(audio)]
+    
+    def enhance_voice_for_march7th(self, audio_bytes, output_path, timer=None, profile=None):
+        """
+        Apply March 7th-specific voice enhancements to encoded base speech.
+        
+        The Edge-TTS stream is decoded straight from memory at its own sample
+        rate, so there is no temp file and no resampling between stages. The
+        scheduler then runs the best tier that fits the timer's budget,
+        degrading to a cheaper one if a stage would overrun it or fails.
+        
+        Args:
+            output_path: File path, or "-" / "unix:PATH" / "tcp:HOST:PORT" to
+                stream the encoded pages
+            timer: Optional BudgetTimer carrying the deadline and receiving
+                decode/effects/encode timings
+            profile: VoiceProfile whose effects are applied (default profile if None)
+        
+        Returns:
+            AudioWriter.summary() of what was written
+        """
+        from tts_audio import decode_audio
+        timer = timer or BudgetTimer(self.scheduler)
+        profile = profile or self.profile()
+        log.debug("Applying %s voice enhancements", profile.character)
         try:
-            print("Applying March 7th voice enhancements...")
-            
-            # Load the audio
-            audio, sr = librosa.load(audio_path, sr=22050)
-            
-            # Apply March 7th characteristics
+            with timer.stage("decode"):
+                audio, sr = decode_audio(audio_bytes)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            log.warning("Decode error, keeping the base speech: %s", e)
+            if is_stream_target(output_path):
+                raise
+            return self.write_undecoded(audio_bytes, output_path, timer)
+        
+        tier, blocks = self.scheduler.run(self.plans(audio, sr), timer, len(audio) / sr,
+                                          lambda tier: self.render_tier(tier, audio, sr, timer, profile),
+                                          resolve_format(self.output_format, output_path))
+        return self.encode(blocks, sr, output_path, timer)
+    
+    def write_undecoded(self, audio_bytes, output_path, timer):
+        """Fallback: keep the base speech exactly as Edge-TTS sent it."""
+        import soundfile as sf
+        with open(output_path, 'wb') as f:
+            f.write(audio_bytes)
+        info = sf.info(output_path)
+        timer.tier = 'base_only'
+        return {
+            "duration": info.frames / info.samplerate,
+            "sample_rate": info.samplerate,
+            "format": info.format.lower(),
+            "bytes": len(audio_bytes)
+        }
+    
+    def encode(self, blocks, sr, output_path, timer):
+        """Save enhanced audio; returns AudioWriter.summary()."""
+        with timer.stage("encode"), self.open_output(output_path, sr) as writer:
+            for block in blocks:
+                writer.write(block)
+        log.debug("Enhanced audio saved (%s): %s", timer.tier, output_path)
+        return writer.summary()
+    
+    def enhance_runs(self, audios, sr, output_path, timer, profile, normalize=True):
+        """
+        Enhance decoded buffers under one scheduler decision.
+        
+        Args:
+            audios: Mono float32 buffers at sr, e.g. the novel runs of a reply
+            output_path: Target the audio will be encoded to (picks the encode cost)
+            normalize: False leaves each run at the level the effects made (see render_tier)
+        
+        Returns:
+            Enhanced audio per input, each as the blocks render_tier returns
+            (long runs stay spilled to disk until the blocks are read)
+        """
+        def render(tier):
+            return [self.render_tier(tier, audio, sr, timer, profile, normalize) for audio in audios]
+        
+        _, enhanced = self.scheduler.run(self.plans(max(audios, key=len), sr), timer,
+                                         sum(len(audio) for audio in audios) / sr, render,
+                                         resolve_format(self.output_format, output_path))
+        return enhanced
+    
+    async def offload(self, func, *args, timer=None):
+        """
+        Run CPU work (decode, encode, enhancement without a DSP pipeline) in a thread.
+        
+        The event loop keeps fetching base speech meanwhile. If the request is
+        cancelled, timer's cancel flag stops the thread at its next stage or block.
+        """
+        try:
+            return await asyncio.to_thread(func, *args)
+        except asyncio.CancelledError:
+            if timer is not None:
+                timer.cancel()
+            raise
+    
+    async def cache_io(self, func, *args):
+        """Reach a remote cache tier in a thread, so other requests keep running on the loop."""
+        if self.cache.remote:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+    
+    async def enhance_audio(self, audios, sr, output_path, timer, profile, normalize=True):
+        """
+        Enhance decoded buffers, in the DSP pipeline's workers when there is one
+        and in a thread otherwise.
+        
+        Buffers go to the worker in shared memory and are enhanced in place
+        there; only the segment names, timings and schedule are pickled. If
+        the request is cancelled meanwhile, a shared flag stops the worker at
+        its next stage or block.
+        
+        Returns:
+            Enhanced audio per input, each as an iterable of float32 blocks
+        """
+        if not audios:
+            return []
+        if not self.pipeline:
+            return await self.offload(self.enhance_runs, audios, sr, output_path, timer, profile, normalize,
+                                      timer=timer)
+        # The worker enforces whatever is left of the budget
+        remaining_ms = timer.remaining() * 1000 if timer.budget_ms is not None else None
+        shared = []
+        cancel = CancelFlag()
+        try:
+            for audio in audios:
+                shared.append(SharedAudio.from_array(audio))
+            try:
+                frames, worker_stages, worker_schedule = await self.pipeline.run(
+                    enhance_shared_in_worker, [buffer.spec for buffer in shared], sr, output_path,
+                    remaining_ms, profile.name, cancel.name, normalize)
+            except asyncio.CancelledError:
+                cancel.set()
+                raise
+            timer.merge(worker_stages)
+            timer.merge_schedule(worker_schedule)
+            return [[buffer.read(count)] for buffer, count in zip(shared, frames)]
+        finally:
+            for buffer in shared:
+                buffer.close()
+            cancel.close()
+    
+    async def compose_from_phrases(self, plan, output_path, timer, profile):
+        """
+        Render a reply from precomputed phrases plus freshly synthesized runs.
+        
+        Only the novel runs go to Edge-TTS and the effects chain; indexed
+        phrases are taken from the memory-mapped store as they are. Neither
+        is normalized on its own: the pieces are joined with short
+        equal-power crossfades and the assembled reply is normalized once,
+        so the level does not jump at the seams.
+        
+        Args:
+            plan: PhraseIndex.plan() of the reply
+        
+        Returns:
+            (AudioWriter.summary(), phrase_report())
+        """
+        from tts_audio import decode_audio
+        runs = [text for text, hit in plan if hit is None]
+        novel = []
+        if runs:
+            with timer.stage("base_speech"):
+                fetched = await asyncio.gather(*(self.generate_base_speech(text, profile) for text in runs))
+            if not all(fetched):
+                raise RuntimeError("Base speech generation failed")
+            with timer.stage("decode"):
+                decoded = await self.offload(lambda: [decode_audio(audio_bytes) for audio_bytes in fetched])
+            sr = decoded[0][1]
+            inputs = [match_rate(audio, rate, sr) for audio, rate in decoded]
+            novel = await self.enhance_audio(inputs, sr, output_path, timer, profile, normalize=False)
+            # Enhancement keeps the length, so the total is known before the blocks are read
+            total = sum(len(audio) for audio in inputs)
+        else:
+            # The whole reply is stock phrases rendered by the full pipeline
+            sr = plan[0][1][1]
+            timer.tier = 'full'
+            total = 0
+        
+        novel = iter(novel)
+        pieces = []
+        indexed = 0
+        for _, hit in plan:
+            if hit is None:
+                pieces.append(next(novel))
+            else:
+                pieces.append(match_rate(hit[0], hit[1], sr))
+                indexed += len(pieces[-1])
+        total += indexed
+        written = await self.offload(self.assemble, pieces, sr, output_path, timer, profile)
+        log.debug("Composed %d segments, %d from the phrase index: %s", len(plan), len(plan) - len(runs), output_path)
+        report = phrase_report(indexed, total, len(plan) - len(runs), len(plan), sr)
+        return written, report
+    
+    def assemble(self, pieces, sr, output_path, timer, profile):
+        """Crossfade the pieces of a composed reply, normalize it as a whole and encode it."""
+        from voice_effects import spill_normalized
+        with timer.stage("normalize"):
+            # Spilled to disk while the peak is found, so the reply is never joined in memory
+            blocks = spill_normalized(crossfade_blocks(pieces, sr), profile.effects.peak)
+        return self.encode(blocks, sr, output_path, timer)
+    
+    def cache_key(self, text, output_path, pitch, speed, profile):
+        """Cache key covering everything that changes the encoded output."""
+        return self.cache.make_key(text, profile.voice, self.model_name,
+                                   {"pitch": pitch, "speed": speed,
+                                    "profile": profile.fingerprint,
+                                    "format": resolve_format(self.output_format, output_path),
+                                    "bitrate": self.bitrate})
+    
+    def build_result(self, output_path, written, pitch, speed, profile):
+        """Assemble the result dict reported for a finished utterance."""
+        return {
+            "success": True,
+            "output_path": output_path,
+            "duration": round(written["duration"], 2),
+            "settings": {
+                "pitch": pitch,
+                "speed": speed,
+                "energy": 1.0,
+                "sample_rate": written["sample_rate"],
+                "format": written["format"],
+                "bitrate": self.bitrate,
+                "model": self.model_name,
+                "voice": profile.voice,
+                "voice_profile": profile.name
+            },
+            "file_size": written["bytes"]
+        }
+    
+    async def synthesize(self, text, output_path, pitch=0.2, speed=1.2, budget_ms=None,
+                         voice_profile=None, cancel=None):
+        """
+        Complete TTS synthesis with March 7th voice.
+        
+        With a DSP pipeline the request first takes one of its slots, so
+        base speech is only fetched while the workers can keep up.
+        
+        Args:
+            budget_ms: Optional latency budget; the result's "schedule" reports
+                the tier that ran and whether the deadline was met
+            voice_profile: Profile key or character name (default profile if None)
+            cancel: Optional threading.Event; once set, the request stops at
+                its next stage and fails with "Request cancelled"
+        """
+        timer = BudgetTimer(self.scheduler, budget_ms, cancel)
+        try:
+            profile = self.profile(voice_profile)
+            log.info("Synthesizing %d characters as %s to %s", len(text), profile.name, output_path)
+            log.debug("Text: %r", text)
             
-            # 1. Slight pitch increase for youthful energy
-            audio = librosa.effects.pitch_shift(audio, sr=sr, n_steps=2)
+            # Serve repeated lines straight from the cache; stdout/socket
+            # targets are encoded live and never cached
+            cache = None if is_stream_target(output_path) else self.cache
+            cache_key = None
+            if cache:
+                with timer.stage("cache_lookup"):
+                    cache_key = self.cache_key(text, output_path, pitch, speed, profile)
+                    meta = await self.cache_io(cache.fetch, cache_key, output_path)
+                if meta:
+                    timer.tier = 'cached'
+                    result = self.build_result(output_path, meta, pitch, speed, profile)
+                    result["cache"] = cache.stats(hit=True)
+                    result["schedule"] = timer.schedule_report()
+                    result["timings"] = timer.as_dict()
+                    log.info("Cache hit: %s", output_path)
+                    return result
             
-            # 2. Add subtle vibrancy/tremolo for personality
-            tremolo_rate = 5.5  # Hz - energetic character
-            tremolo_depth = 0.08
-            t = np.linspace(0, len(audio)/sr, len(audio))
-            tremolo = 1 + tremolo_depth * np.sin(2 * np.pi * tremolo_rate * t)
-            audio = audio * tremolo
+            # Stock phrases come from the precomputed index; only the rest is synthesized
+            plan = self.phrases.plan(text, profile) if self.phrases else None
+            phrases_used = None
+            async with self.pipeline.slot() if self.pipeline else contextlib.nullcontext():
+                if plan and any(hit for _, hit in plan):
+                    written, phrases_used = await self.compose_from_phrases(plan, output_path, timer, profile)
+                else:
+                    written = await self.synthesize_whole(text, output_path, timer, profile)
             
-            # 3. Enhance brightness for ice/crystal theme
-            # High-pass filter to brighten the voice
-            from scipy.signal import butter, sosfilt
-            sos = butter(2, 1000, btype='highpass', fs=sr, output='sos')
-            bright_component = sosfilt(sos, audio) * 0.15
-            audio = audio + bright_component
+            if not is_stream_target(output_path) and not os.path.exists(output_path):
+                raise RuntimeError("Output file was not created")
             
-            # 4. Add subtle reverb for ethereal ice theme
-            reverb_audio = np.copy(audio)
-            delay_samples = int(0.05 * sr)  # 50ms delay
-            reverb_audio = np.pad(reverb_audio, (delay_samples, 0))[:len(audio)]
-            audio = 0.85 * audio + 0.15 * reverb_audio
+            result = self.build_result(output_path, written, pitch, speed, profile)
+            if phrases_used:
+                result["phrase_index"] = phrases_used
             
-            # 5. Normalize and apply dynamics
-            audio = librosa.util.normalize(audio) * 0.8
+            # Degraded renders are never cached
+            if cache and timer.tier == 'full':
+                with timer.stage("cache_store"):
+                    await self.cache_io(cache.store, cache_key, output_path, written)
+            if cache:
+                result["cache"] = cache.stats(hit=False)
             
-            # Save enhanced audio
-            sf.write(output_path, audio, sr)
-            print(f"Enhanced audio saved: {output_path}")
-            return True
+            result["schedule"] = timer.schedule_report()
+            result["timings"] = timer.as_dict()
+            if self.pipeline:
+                result["pipeline"] = self.pipeline.stats()
             
+            log.info("TTS successful: %s (%d bytes, %s tier)", output_path, result['file_size'], timer.tier)
+            return result
+                
         except Exception as e:
-            print(f"Enhancement error: {e}")
-            # Fallback: just copy original if enhancement fails
-            import shutil
-            shutil.copy2(audio_path, output_path)
-            return True
-    
-    async def synthesize(self, text, output_path, pitch=0.2, speed=1.2):
-        """Complete TTS synthesis with March 7th voice."""
+            log.error("TTS synthesis failed: %s", e)
+            return {
+                "success": False,
+                "error": str(e),
+                "output_path": None
+            }
+    
+    async def synthesize_whole(self, text, output_path, timer, profile):
+        """Base speech for the whole reply in one request, then enhancement; returns the written summary."""
+        from tts_audio import decode_audio
+        # Step 1: Generate high-quality base speech with Edge-TTS
+        with timer.stage("base_speech"):
+            audio_bytes = await self.generate_base_speech(text, profile)
+        if not audio_bytes:
+            raise RuntimeError("Base speech generation failed")
+        
+        # Step 2: Apply March 7th voice enhancements
+        if not self.pipeline:
+            return await self.offload(self.enhance_voice_for_march7th, audio_bytes, output_path, timer, profile,
+                                      timer=timer)
+        log.debug("Applying %s voice enhancements", profile.character)
         try:
-            print(f"Starting March 7th Enhanced TTS...")
-            print(f"Text: '{text}'")
-            print(f"Output: {output_path}")
+            with timer.stage("decode"):
+                audio, sr = await self.offload(decode_audio, audio_bytes)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            log.warning("Decode error, keeping the base speech: %s", e)
+            if is_stream_target(output_path):
+                raise
+            return self.write_undecoded(audio_bytes, output_path, timer)
+        blocks, = await self.enhance_audio([audio], sr, output_path, timer, profile)
+        return await self.offload(self.encode, blocks, sr, output_path, timer)
+
+    async def synthesize_stream(self, text, output_path, pitch=0.2, speed=1.2, on_segment=None,
+                                voice_profile=None, cancel=None):
+        """
+        Synthesize sentence by sentence, emitting each segment once it is enhanced.
+        
+        Every segment is appended to one continuous encoder on output_path as
+        soon as it is ready, so stdout/socket targets receive the reply's
+        pages while later sentences are still being synthesized. File targets
+        also get each segment as <stem>_000<suffix>, ...
+        
+        Sentences found in the phrase index are emitted straight from it.
+        Each segment is decoded and enhanced in a DSP pipeline worker, or in
+        a thread without one, while the next sentence is fetched on the
+        event loop.
+        
+        Args:
+            on_segment: Optional callback receiving each finished segment dict
+            voice_profile: Profile key or character name (default profile if None)
+            cancel: Optional threading.Event stopping the request (see synthesize)
+        """
+        async def whole_text():
+            yield text
+        
+        return await self.synthesize_incremental(whole_text(), output_path, pitch, speed,
+                                                 on_segment, voice_profile, cancel)
+
+    async def synthesize_incremental(self, deltas, output_path, pitch=0.2, speed=1.2, on_segment=None,
+                                     voice_profile=None, cancel=None):
+        """
+        Stream a reply whose text is still arriving, e.g. from a streamed LLM completion.
+        
+        Text deltas are cut into sentences as soon as a boundary is stable
+        (see tts_text.SentenceBuffer); each finished sentence starts its base
+        speech fetch right away, while earlier ones are enhanced and written,
+        so voice synthesis overlaps text generation. Segments are written and
+        emitted in reading order, as in synthesize_stream.
+        
+        Args:
+            deltas: Async iterable of text pieces; the reply ends with it
+            on_segment: Optional callback receiving each finished segment dict
+            voice_profile: Profile key or character name (default profile if None)
+            cancel: Optional threading.Event stopping the request (see synthesize)
+        """
+        import numpy as np
+        from tts_audio import decode_audio
+        start_time = time.perf_counter()
+        # No budget: every segment gets the full tier
+        timer = BudgetTimer(self.scheduler, cancel=cancel)
+        ready = asyncio.Queue()
+        reader = None
+        joined = None
+        try:
+            # One profile for the whole reply, even if the config is edited mid-stream
+            profile = self.profile(voice_profile)
+            log.info("Streaming as %s to %s", profile.name, output_path)
             
-            # Create temporary file for base speech
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as tmp_file:
-                temp_audio = tmp_file.name
+            if self.phrases:
+                self.phrases.check_reload()
             
-            try:
-                # Step 1: Generate high-quality base speech with Edge-TTS
-                success = await self.generate_base_speech(text, temp_audio)
-                if not success:
-                    raise RuntimeError("Base speech generation failed")
+            async def fetch_segment(segment_text):
+                """Indexed (audio, sample_rate) for stock phrases, encoded base speech otherwise."""
+                hit = self.phrases.lookup(segment_text, profile) if self.phrases else None
+                if hit:
+                    return hit
+                with timer.stage("base_speech"):
+                    audio_bytes = await self.generate_base_speech(segment_text, profile)
+                if not audio_bytes:
+                    raise RuntimeError(f"Base speech generation failed for: '{segment_text}'")
+                return audio_bytes
+            
+            # At most one fetch runs ahead of the segment being enhanced
+            lookahead = asyncio.Semaphore(1)
+            
+            async def read_text():
+                """Split the deltas into sentences and start their fetches in order."""
+                sentences = SentenceBuffer()
                 
-                # Step 2: Apply March 7th voice enhancements
-                success = self.enhance_voice_for_march7th(temp_audio, output_path)
-                if not success:
-                    raise RuntimeError("Voice enhancement failed")
+                async def start(segment_texts):
+                    for segment_text in segment_texts:
+                        text_ready = time.perf_counter() - start_time
+                        await lookahead.acquire()
+                        ready.put_nowait((segment_text, text_ready,
+                                          asyncio.ensure_future(fetch_segment(segment_text))))
                 
-                # Clean up temporary file
-                if os.path.exists(temp_audio):
-                    os.unlink(temp_audio)
+                try:
+                    async for delta in deltas:
+                        await start(sentences.feed(delta))
+                    await start(sentences.flush())
+                    ready.put_nowait(None)
+                except Exception as e:
+                    ready.put_nowait(e)
+            
+            reader = asyncio.ensure_future(read_text())
+            stream_target = is_stream_target(output_path)
+            output = Path(output_path)
+            segments = []
+            indexed_frames = 0
+            total_frames = 0
+            time_to_first_audio = None
+            
+            while True:
+                entry = await ready.get()
+                if isinstance(entry, Exception):
+                    raise entry
+                if entry is None:
+                    break
+                segment_text, text_ready, pending = entry
+                try:
+                    fetched = await pending
+                finally:
+                    # Start fetching the next sentence before enhancing this one
+                    lookahead.release()
+                index = len(segments)
                 
-                if os.path.exists(output_path):
-                    # Get file info
-                    audio_info = sf.info(output_path)
-                    file_size = os.path.getsize(output_path)
-                    
-                    result = {
-                        "success": True,
-                        "output_path": output_path,
-                        "duration": round(audio_info.duration, 2),
-                        "settings": {
-                            "pitch": pitch,
-                            "speed": speed,
-                            "energy": 1.0,
-                            "sample_rate": audio_info.samplerate,
-                            "model": "March7th_Enhanced_EdgeTTS",
-                            "voice": self.selected_voice
-                        },
-                        "file_size": file_size
-                    }
-                    
-                    print(f"TTS successful! March 7th Enhanced voice: {output_path} ({file_size} bytes)")
-                    return result
+                indexed = isinstance(fetched, tuple)
+                if indexed:
+                    audio, sample_rate = fetched
+                    # Stored at the chain's level; a segment is normalized on its own like synthesized ones
+                    blocks = [profile.effects.normalize(audio)]
                 else:
-                    raise RuntimeError("Output file was not created")
-                    
-            except Exception as e:
-                # Clean up temp file on error
-                if os.path.exists(temp_audio):
-                    os.unlink(temp_audio)
-                raise e
+                    with timer.stage("decode"):
+                        audio, sample_rate = await self.offload(decode_audio, fetched, timer=timer)
+                    blocks, = await self.enhance_audio([audio], sample_rate, output_path, timer, profile)
+                if joined is not None and sample_rate != joined.input_rate:
+                    blocks = [match_rate(np.concatenate(list(blocks)), sample_rate, joined.input_rate)]
+                    sample_rate = joined.input_rate
                 
-        except Exception as e:
-            print(f"TTS synthesis failed: {e}")
+                segment_path = None
+                frames = 0
+                with timer.stage("encode"):
+                    if joined is None:
+                        joined = self.open_output(output_path, sample_rate)
+                    if not stream_target:
+                        segment_path = str(output.with_name(f"{output.stem}_{index:03d}{output.suffix}"))
+                    # Blocks go to both writers as they are read, so a long segment is never joined
+                    with (self.open_output(segment_path, sample_rate) if segment_path
+                          else contextlib.nullcontext()) as part:
+                        for block in blocks:
+                            joined.write(block)
+                            if part is not None:
+                                part.write(block)
+                            frames += len(block)
+                    joined.flush()
+                total_frames += frames
+                if indexed:
+                    indexed_frames += frames
+                elapsed = time.perf_counter() - start_time
+                if time_to_first_audio is None:
+                    time_to_first_audio = elapsed
+                
+                segment = {
+                    "event": "segment",
+                    "index": index,
+                    "text": segment_text,
+                    "output_path": segment_path,
+                    "frames": frames,
+                    "duration": round(frames / sample_rate, 2),
+                    "text_ready": round(text_ready, 3),
+                    "elapsed": round(elapsed, 3),
+                    "indexed": indexed
+                }
+                if stream_target:
+                    segment["bytes_sent"] = joined.bytes_written
+                segments.append(segment)
+                if on_segment:
+                    on_segment(segment)
+            
+            if not segments:
+                raise ValueError("Nothing to synthesize")
+            log.debug("Text: %r", ' '.join(segment["text"] for segment in segments))
+            
+            joined.close()
+            result = self.build_result(output_path, joined.summary(), pitch, speed, profile)
+            result.update({
+                "streamed": True,
+                "segments": segments,
+                "time_to_first_audio": round(time_to_first_audio, 3),
+                # When the reply's text was complete; voice latency after that is
+                # synthesis_time - text_complete
+                "text_complete": round(segments[-1]["text_ready"], 3),
+                "synthesis_time": round(time.perf_counter() - start_time, 3),
+                "timings": timer.as_dict()
+            })
+            if self.pipeline:
+                result["pipeline"] = self.pipeline.stats()
+            if self.phrases:
+                result["phrase_index"] = phrase_report(indexed_frames, total_frames,
+                                                       sum(segment["indexed"] for segment in segments),
+                                                       len(segments), joined.input_rate)
+            
+            log.info("TTS successful: %d segments, first audio after %.2fs", len(segments), time_to_first_audio)
+            return result
+            
+        except BaseException as e:
+            # Also when the request task itself is cancelled: stop the reader and pending fetches
+            if reader:
+                reader.cancel()
+            while not ready.empty():
+                entry = ready.get_nowait()
+                if isinstance(entry, tuple):
+                    entry[2].cancel()
+            if joined:
+                joined.close()
+            if not isinstance(e, Exception):
+                raise
+            log.error("TTS synthesis failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "output_path": None
             }
 
-async def main():
+    async def synthesize_many(self, requests, cancel=None):
+        """
+        Synthesize several utterances concurrently.
+        
+        Base speech fetches overlap up to the fetcher's concurrency limit, and
+        identical texts share one upstream call. Each reply is enhanced off
+        the event loop, in the DSP pipeline's workers when there is one, so
+        other requests of a serving worker keep running meanwhile.
+        
+        Args:
+            requests: List of dicts with text, output_path and optional
+                pitch/speed/voice_profile/budget_ms
+            cancel: Optional threading.Event stopping every request (see synthesize)
+        """
+        return list(await asyncio.gather(*(self.synthesize(**request, cancel=cancel) for request in requests)))
+
+# Engine owned by each batch worker process for the CPU-bound enhancement stage
+_worker_tts = None
+
+def init_enhance_worker(block_threshold, output_format=None, bitrate=None, profiles_path=None,
+                        log_level='INFO', log_format='text', pitch_backend=None):
+    """DSPPipeline initializer: build the engine and compile every profile once per worker."""
+    global _worker_tts
+    # The parent owns stdout (result JSON, the serve protocol or streamed audio)
+    sys.stdout = sys.stderr
+    setup_logging(log_level, log_format)
+    profiles = VoiceProfileRegistry(profiles_path or PROFILES_PATH, pitch_backend)
+    _worker_tts = March7thEnhancedTTS(block_threshold=block_threshold,
+                                      output_format=output_format, bitrate=bitrate,
+                                      profiles=profiles)
+
+def enhance_shared_in_worker(specs, sr, output_path, budget_ms=None, voice_profile=None, cancel_name=None,
+                             normalize=True):
+    """
+    Enhance SharedAudio buffers in place in a pool worker.
+    
+    Args:
+        cancel_name: Name of the parent's CancelFlag for this request
+    
+    Returns:
+        (frames written per buffer, stage timings, schedule) to the parent
+    """
+    cancel = CancelFlag(cancel_name) if cancel_name else None
+    timer = BudgetTimer(_worker_tts.scheduler, budget_ms, cancel)
+    buffers = [SharedAudio.attach(spec) for spec in specs]
+    try:
+        enhanced = _worker_tts.enhance_runs([buffer.array for buffer in buffers], sr, output_path, timer,
+                                            _worker_tts.profile(voice_profile), normalize)
+        frames = [buffer.write_blocks(blocks) for buffer, blocks in zip(buffers, enhanced)]
+    finally:
+        for buffer in buffers:
+            buffer.close()
+        if cancel:
+            cancel.close()
+    return frames, timer.as_dict(), timer.schedule_report()
+
+def build_parser():
     parser = argparse.ArgumentParser(description='March 7th Enhanced TTS')
-    parser.add_argument('--text', required=True, help='Text to synthesize')
-    parser.add_argument('--output', required=True, help='Output audio file path')
+    parser.add_argument('--text', help='Text to synthesize, - to stream it from stdin as it is written '
+                                       '(implies --stream)')
+    parser.add_argument('--output', help='Output audio file path, - for stdout, or unix:PATH / tcp:HOST:PORT')
     parser.add_argument('--model', help='Model path (for compatibility, not used)')
     parser.add_argument('--index', help='Index path (for compatibility, not used)')
     parser.add_argument('--pitch', type=float, default=0.2, help='Pitch adjustment')
     parser.add_argument('--speed', type=float, default=1.2, help='Speed adjustment')
-    
-    args = parser.parse_args()
-    
+    parser.add_argument('--stream', action='store_true',
+                        help='Synthesize sentence by sentence, printing a JSON line per finished segment')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a resident worker reading JSON-line requests')
+    parser.add_argument('--socket', help='Unix socket path for --serve (default: stdin/stdout)')
+    parser.add_argument('--max-fetches', type=int, default=4,
+                        help='Maximum concurrent Edge-TTS requests')
+    parser.add_argument('--edge-stub', action='store_true',
+                        help='Use the offline Edge-TTS stand-in (for local testing)')
+    parser.add_argument('--block-dsp-seconds', type=float, default=30.0,
+                        help='Enhance audio longer than this in constant-memory blocks')
+    add_profile_arguments(parser)
+    add_effects_arguments(parser)
+    add_phrase_arguments(parser)
+    add_output_arguments(parser)
+    add_budget_arguments(parser)
+    add_cache_arguments(parser)
+    add_batch_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_queue_arguments(parser)
+    add_profiling_arguments(parser)
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
+    return parser
+
+def fetcher_from_args(args):
+    """Build the Edge-TTS fetcher, optionally backed by the offline stub."""
+    communicate_factory = None
+    if args.edge_stub:
+        from edge_tts_stub import StubEdgeService
+        communicate_factory = StubEdgeService().communicate
+    return EdgeSpeechFetcher(communicate_factory, max_concurrency=args.max_fetches)
+
+async def stdin_deltas(chunk_size=4096):
+    """Text piped to stdin, yielded as it is written (e.g. by a streaming LLM client)."""
+    loop = asyncio.get_running_loop()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    fd = sys.stdin.fileno()
+    while True:
+        chunk = await loop.run_in_executor(None, os.read, fd, chunk_size)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            yield text
+        if not chunk:
+            return
+
+def pipeline_from_args(args, workers):
+    """DSP pipeline whose workers build the engine from the parsed arguments, or None for no workers."""
+    if not workers:
+        return None
+    return DSPPipeline(workers, initializer=init_enhance_worker,
+                       initargs=(args.block_dsp_seconds, args.format, args.bitrate, args.voice_profiles,
+                                 args.log_level, args.log_format, args.pitch_backend),
+                       max_pending=args.dsp_queue)
+
+def engine_metrics(args, pipeline=None):
+    """Worker metrics for this engine, with the DSP queue when there is a pipeline."""
+    metrics = metrics_from_args(args, 'edge_enhanced')
+    if metrics and pipeline:
+        pipeline.add_metrics(metrics)
+    return metrics
+
+def make_handler(args, queue=None):
+    """Create the engine once and return a request handler for serve mode."""
+    # A resident worker keeps one DSP process so fetching never waits on the effects chain
+    pipeline = pipeline_from_args(args, 1 if args.dsp_workers is None else args.dsp_workers)
+    metrics = engine_metrics(args, pipeline)
+    if metrics and queue:
+        queue.add_metrics(metrics)
+    cache = cache_from_args(args)
+    if metrics and cache and cache.remote:
+        cache.add_metrics(metrics)
+    march7th_tts = March7thEnhancedTTS(
+        cache=cache,
+        fetcher=fetcher_from_args(args),
+        block_threshold=args.block_dsp_seconds,
+        output_format=args.format,
+        bitrate=args.bitrate,
+        profiles=profiles_from_args(args),
+        voice_profile=args.voice_profile,
+        phrases=phrase_index_from_args(args),
+        pipeline=pipeline
+    )
+
+    async def handle(request, emit):
+        if request.get('op') == 'batch':
+            # Group chats / pre-rendering: the replies are fetched and enhanced concurrently
+            results = await march7th_tts.synthesize_many([
+                {
+                    "text": item['text'],
+                    "output_path": item['output'],
+                    "pitch": item.get('pitch', args.pitch),
+                    "speed": item.get('speed', args.speed),
+                    "budget_ms": item.get('budget_ms', args.budget_ms),
+                    "voice_profile": item.get('voice_profile')
+                }
+                for item in request['requests']
+            ], cancel=request.get('cancel'))
+            for result in results:
+                record_timings(args, result, metrics)
+            return {"success": all(result["success"] for result in results), "results": results}
+        if request.get('deltas') is not None:
+            # Text arrives in later "text" lines (see tts_server.TTSWorker)
+            result = await march7th_tts.synthesize_incremental(
+                request['deltas'],
+                output_path=request['output'],
+                pitch=request.get('pitch', args.pitch),
+                speed=request.get('speed', args.speed),
+                on_segment=emit,
+                voice_profile=request.get('voice_profile'),
+                cancel=request.get('cancel')
+            )
+        elif request.get('stream'):
+            result = await march7th_tts.synthesize_stream(
+                text=request['text'],
+                output_path=request['output'],
+                pitch=request.get('pitch', args.pitch),
+                speed=request.get('speed', args.speed),
+                on_segment=emit,
+                voice_profile=request.get('voice_profile'),
+                cancel=request.get('cancel')
+            )
+        else:
+            result = await march7th_tts.synthesize(
+                text=request['text'],
+                output_path=request['output'],
+                pitch=request.get('pitch', args.pitch),
+                speed=request.get('speed', args.speed),
+                budget_ms=request.get('budget_ms', args.budget_ms),
+                voice_profile=request.get('voice_profile'),
+                cancel=request.get('cancel')
+            )
+        record_timings(args, result, metrics)
+        return result
+
+    return handle
+
+async def run_once(args):
+    pipeline = None
     try:
+        pipeline = pipeline_from_args(args, args.dsp_workers)
+        metrics = engine_metrics(args, pipeline)
         # Initialize March 7th Enhanced TTS
-        march7th_tts = March7thEnhancedTTS()
+        march7th_tts = March7thEnhancedTTS(
+            cache=cache_from_args(args),
+            fetcher=fetcher_from_args(args),
+            block_threshold=args.block_dsp_seconds,
+            output_format=args.format,
+            bitrate=args.bitrate,
+            profiles=profiles_from_args(args),
+            voice_profile=args.voice_profile,
+            phrases=phrase_index_from_args(args),
+            pipeline=pipeline
+        )
         
         # Synthesize speech
-        result = await march7th_tts.synthesize(
-            text=args.text,
-            output_path=args.output,
-            pitch=args.pitch,
-            speed=args.speed
-        )
+        on_segment = lambda segment: print(json.dumps(segment, ensure_ascii=False), flush=True)
+        if args.text == '-':
+            result = await march7th_tts.synthesize_incremental(
+                stdin_deltas(),
+                output_path=args.output,
+                pitch=args.pitch,
+                speed=args.speed,
+                on_segment=on_segment
+            )
+        elif args.stream:
+            result = await march7th_tts.synthesize_stream(
+                text=args.text,
+                output_path=args.output,
+                pitch=args.pitch,
+                speed=args.speed,
+                on_segment=on_segment
+            )
+        else:
+            result = await march7th_tts.synthesize(
+                text=args.text,
+                output_path=args.output,
+                pitch=args.pitch,
+                speed=args.speed,
+                budget_ms=args.budget_ms
+            )
+        
+        record_timings(args, result, metrics)
         
         # Output result as JSON
         print(json.dumps(result, ensure_ascii=False))
         
-        if result["success"]:
-            sys.exit(0)
-        else:
-            sys.exit(1)
+        return 0 if result["success"] else 1
             
     except Exception as e:
         error_result = {
@@ -213,8 +938,63 @@ async def main():
             "output_path": None
         }
         print(json.dumps(error_result, ensure_ascii=False))
-        sys.exit(1)
+        return 1
+    finally:
+        if pipeline:
+            pipeline.shutdown()
+
+async def run_batch_job(args):
+    """Fetch base speech concurrently on the event loop, enhance in the DSP pipeline's workers."""
+    with pipeline_from_args(args, args.workers) as pipeline:
+        metrics = engine_metrics(args, pipeline)
+        march7th_tts = March7thEnhancedTTS(
+            cache=cache_from_args(args),
+            fetcher=fetcher_from_args(args),
+            block_threshold=args.block_dsp_seconds,
+            output_format=args.format,
+            bitrate=args.bitrate,
+            profiles=profiles_from_args(args),
+            voice_profile=args.voice_profile,
+            phrases=phrase_index_from_args(args),
+            pipeline=pipeline
+        )
+        
+        async def process_item(item):
+            result = await march7th_tts.synthesize(
+                text=item['text'],
+                output_path=item['output'],
+                pitch=item.get('pitch', args.pitch),
+                speed=item.get('speed', args.speed),
+                budget_ms=item.get('budget_ms', args.budget_ms),
+                voice_profile=item.get('voice_profile')
+            )
+            record_timings(args, result, metrics)
+            return result
+        
+        summary = await run_batch(args.batch, process_item, args.results)
+        summary["pipeline"] = pipeline.stats()
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary["success"] else 1
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging_from_args(args)
+    
+    if args.serve:
+        queue = queue_from_args(args)
+        return serve(lambda: make_handler(args, queue), args.socket, queue)
+    if args.batch:
+        return asyncio.run(run_batch_job(args))
+    if not args.text or not args.output:
+        parser.error('--text and --output are required unless --serve or --batch is given')
+    
+    # With audio on stdout, the result JSON goes to stderr
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.output == '-' else contextlib.nullcontext()
+    
+    # Run the async synthesis
+    with quiet:
+        return run_profiled(args, lambda: asyncio.run(run_once(args)))
 
 if __name__ == '__main__':
-    # Run the async main function
-    asyncio.run(main())
+    sys.exit(main())
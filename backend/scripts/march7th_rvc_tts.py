@@ -4,26 +4,58 @@ March 7th RVC-based Text-to-Speech System
 Uses real voice conversion with March 7th voice model files
 """
 
-import torch
-import torchaudio
-import librosa
-import soundfile as sf
-import numpy as np
+import asyncio
 import argparse
+import contextlib
 import json
+import logging
 import os
 import sys
-import subprocess
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from tts_batch import add_batch_arguments, run_batch
+from tts_budget import BudgetTimer, LatencyScheduler, add_budget_arguments
+from tts_cache import add_cache_arguments, cache_from_args
+from tts_logging import add_logging_arguments, logging_from_args, setup_logging
+from tts_metrics import add_metrics_arguments, metrics_from_args
+from tts_output import AudioWriter, add_output_arguments, is_stream_target, resolve_format
+from tts_profiling import add_profiling_arguments, record_timings, run_profiled
+from tts_queue import add_queue_arguments, queue_from_args
+from tts_server import serve
+from tts_speech import SpeechSessionPool, add_speech_arguments, sapi_command, speech_options_from_args
+from voice_effects import add_effects_arguments
+
+log = logging.getLogger('march7th.rvc')
+
 class March7thRVCTTS:
-    def __init__(self, model_path, index_path):
-        """Initialize March 7th RVC TTS with voice model files."""
+    model_name = "March7thEN_RVC"
+    
+    def __init__(self, model_path, index_path, cache=None, block_threshold=30.0, inference_options=None,
+                 output_format=None, bitrate=None, pitch_backend=None, speech=None):
+        """
+        Initialize March 7th RVC TTS with voice model files.
+        
+        Args:
+            inference_options: Keyword arguments for RVCConverter (thread
+                policy, int8 quantization), see inference_options_from_args
+            output_format: Output codec (see tts_output.OUTPUT_FORMATS), None
+                picks it from each output path
+            bitrate: Target kbps for compressed output codecs
+            pitch_backend: Pitch shift algorithm (see voice_effects.PITCH_BACKENDS),
+                None for the preset's
+            speech: tts_speech.SpeechSessionPool for the SAPI base speech,
+                defaults to one resident session with the first female voice
+        """
+        self.cache = cache
+        self.block_threshold = block_threshold
+        self.output_format = output_format
+        self.bitrate = bitrate
         self.model_path = Path(model_path)
         self.index_path = Path(index_path)
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"Using device: {self.device}")
+        self._device = None
+        # Started on the first utterance, then kept for the engine's life
+        self.speech = speech or SpeechSessionPool(sapi_command())
         
         # Verify model files exist
         if not self.model_path.exists():
@@ -31,197 +63,361 @@ class March7thRVCTTS:
         if not self.index_path.exists():
             raise FileNotFoundError(f"Index file not found: {self.index_path}")
             
-        print(f"March 7th RVC model loaded: {self.model_path}")
-        print(f"March 7th index loaded: {self.index_path}")
+        # DSP dependencies load with the first engine, not at module import
+        from voice_effects import VoiceEffectsChain
+        from voice_profiles import DEFAULT_SAMPLE_RATES
+        self.pitch_backend = pitch_backend
+        overrides = {"pitch_backend": pitch_backend} if pitch_backend else {}
+        self.scheduler = LatencyScheduler()
+        self.inference_options = dict(inference_options or {})
+        self.converter = self.load_converter()
+        # The model itself transposes the converted voice; without it the
+        # chain adds the conversion's +4 semitones to the +3 enhancement
+        n_steps = 3 if self.converter else 7
+        # Filters, tremolo table and delay line are compiled once per engine
+        self.effects = VoiceEffectsChain.from_preset('march7th_rvc', n_steps=n_steps,
+                                                     **overrides).compile(DEFAULT_SAMPLE_RATES)
+        # Reduced tier: timbre conversion and tremolo without the enhancement shift
+        self.reduced_effects = VoiceEffectsChain.from_preset('march7th_rvc', n_steps=0,
+                                                             **overrides).compile(DEFAULT_SAMPLE_RATES)
+    
+    def load_converter(self):
+        """Load the model, HuBERT and index once; None means DSP-only conversion."""
+        try:
+            from rvc_inference import RVCConverter
+            converter = RVCConverter(self.model_path, self.index_path, **self.inference_options)
+        except (ImportError, ValueError) as e:
+            # Missing torch, no hubert_base.pt, or a checkpoint we cannot run (e.g. a training checkpoint)
+            log.warning("RVC inference unavailable, using DSP voice conversion: %s", e)
+            return None
+        log.info("March 7th RVC %s model loaded: %s (%d Hz%s)", converter.version, self.model_path,
+                 converter.target_sr, (', int8 HuBERT' if converter.quantized else '')
+                 + (', bfloat16 decoder' if converter.bf16 else ''))
+        if converter.index is not None:
+            log.info("March 7th index loaded: %s (%d rows)", self.index_path, len(converter.index.features))
+        return converter
+    
+    @property
+    def device(self):
+        """Inference device, resolved on first use so startup never imports torch."""
+        if self._device is None:
+            try:
+                import torch
+                self._device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            except ImportError:
+                self._device = 'cpu'
+            log.info("Using device: %s", self._device)
+        return self._device
     
     def text_to_speech_base(self, text):
-        """Generate base speech using Windows SAPI as intermediate step."""
-        print(f"Generating base speech for: '{text}'")
+        """Generate base speech using Windows SAPI as intermediate step; returns WAV bytes."""
+        log.debug("Generating base speech for: %r", text)
         
-        # Create temporary file for base speech
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-            temp_wav = tmp_file.name
+        # The resident SAPI session returns the WAV in memory; no PowerShell
+        # launch, System.Speech load or voice lookup per utterance
+        return self.speech.speak(text, rate=0)
+    
+    def open_output(self, output_path, sample_rate):
+        """Encoder for a file path or a stdout/socket target (see tts_output)."""
+        return AudioWriter(output_path, sample_rate, self.output_format, self.bitrate)
+    
+    def use_blocks(self, audio, sr):
+        """Long replies run the effects in fixed-size blocks, spilled to disk instead of held until normalized."""
+        return self.block_threshold is not None and len(audio) > self.block_threshold * sr
+    
+    def plans(self, audio, sr):
+        """Scheduler tiers for one utterance, best first, with the stages each runs."""
+        inference = ['rvc_inference'] if self.converter else []
+        if self.use_blocks(audio, sr):
+            full = ['block_effects']
+        else:
+            full = inference + ['pitch_shift_eq', 'tremolo_echo', 'normalize']
+        return [
+            ('full', full),
+            ('reduced', inference + ['tremolo_echo', 'normalize']),
+            ('base_only', ['normalize'])
+        ]
+    
+    def render_tier(self, tier, audio, sr, timer):
+        """Process decoded base speech for one tier; returns the blocks to encode."""
+        from voice_effects import render_blocks
+        if tier == 'base_only':
+            with timer.stage("normalize"):
+                return [self.effects.normalize(audio)]
+        if tier == 'full' and self.use_blocks(audio, sr):
+            return render_blocks(self.effects, audio, sr, timer=timer, converter=self.converter)
         
-        try:
-            # Use Windows SAPI to generate base speech
-            powershell_script = f'''
-Add-Type -AssemblyName System.Speech
-$synth = New-Object System.Speech.Synthesis.SpeechSynthesizer
-$synth.SetOutputToWaveFile("{temp_wav}")
-
-# Set voice parameters for better base speech
-$synth.Rate = 0
-$synth.Volume = 100
-
-# Try to find a female voice for better base conversion
-$voices = $synth.GetInstalledVoices()
-foreach ($voice in $voices) {{
-    if ($voice.VoiceInfo.Gender -eq "Female") {{
-        $synth.SelectVoice($voice.VoiceInfo.Name)
-        break
-    }}
-}}
-
-$synth.Speak("{text}")
-$synth.Dispose()
-'''
-            
-            # Execute PowerShell script
-            result = subprocess.run(
-                ['powershell', '-Command', powershell_script],
-                capture_output=True,
-                text=True,
-                cwd=os.getcwd()
-            )
-            
-            if result.returncode != 0:
-                raise RuntimeError(f"PowerShell TTS failed: {result.stderr}")
-            
-            if not os.path.exists(temp_wav):
-                raise RuntimeError("Base speech file was not created")
-                
-            return temp_wav
-            
-        except Exception as e:
-            # Clean up temp file on error
-            if os.path.exists(temp_wav):
-                os.unlink(temp_wav)
-            raise e
+        # Voice conversion through the resident model (timbre and the +4
+        # semitone transpose), when one is loaded
+        if self.converter:
+            with timer.stage("rvc_inference"):
+                audio = self.converter.convert(audio, sr)
+        if tier == 'reduced':
+            return [self.reduced_effects.process(audio, sr, timer=timer)]
+        
+        # The +3 semitone enhancement shift; without the model, the +4
+        # semitone conversion shift joins it as one +7 shift in a single STFT pass
+        return [self.effects.process(audio, sr, timer=timer)]
     
-    def apply_rvc_conversion(self, input_audio_path, output_path):
-        """Apply RVC voice conversion using March 7th model."""
-        print(f"Applying March 7th RVC conversion...")
+    def apply_rvc_conversion(self, base_audio, output_path, timer=None):
+        """
+        Apply RVC voice conversion using March 7th model.
         
-        try:
-            # Load the input audio
-            audio, sr = librosa.load(input_audio_path, sr=None)
-            print(f"Loaded audio: {len(audio)} samples at {sr}Hz")
-            
-            # For now, since we don't have the full RVC inference code,
-            # we'll enhance the audio with March 7th characteristics
-            # This is a simplified approach until we get proper RVC inference
-            
-            # Apply pitch shifting to match March 7th's higher voice
-            audio_shifted = librosa.effects.pitch_shift(audio, sr=sr, n_steps=4)
-            
-            # Apply some formant shifting for more feminine voice
-            audio_enhanced = self.enhance_voice_characteristics(audio_shifted, sr)
-            
-            # Save the enhanced audio
-            sf.write(output_path, audio_enhanced, sr)
-            
-            return True
-            
-        except Exception as e:
-            print(f"RVC conversion error: {e}")
-            # Fallback: just copy the input to output with basic enhancement
-            audio, sr = librosa.load(input_audio_path, sr=22050)
-            audio_enhanced = self.enhance_voice_characteristics(audio, sr)
-            sf.write(output_path, audio_enhanced, sr)
-            return True
-    
-    def enhance_voice_characteristics(self, audio, sr):
-        """Enhance audio to match March 7th's voice characteristics."""
-        try:
-            # Apply pitch shifting for higher, more youthful voice
-            audio = librosa.effects.pitch_shift(audio, sr=sr, n_steps=3)
-            
-            # Add slight tremolo for energetic character
-            tremolo_rate = 4.5  # Hz
-            tremolo_depth = 0.1
-            t = np.linspace(0, len(audio)/sr, len(audio))
-            tremolo = 1 + tremolo_depth * np.sin(2 * np.pi * tremolo_rate * t)
-            audio = audio * tremolo
-            
-            # Normalize audio
-            audio = audio / np.max(np.abs(audio)) * 0.8
-            
-            return audio
-            
-        except Exception as e:
-            print(f"Enhancement error: {e}")
-            # Return original audio if enhancement fails
-            return audio / np.max(np.abs(audio)) * 0.8
+        The scheduler runs the best tier that fits the timer's budget. A
+        failing or overrunning tier degrades to the next cheaper one over
+        the same decoded buffer instead of re-running a second full chain.
+        
+        Args:
+            base_audio: Encoded base speech (WAV bytes), decoded in memory
+            timer: Optional BudgetTimer carrying the deadline
+        
+        Returns:
+            AudioWriter.summary() of what was written
+        """
+        log.debug("Applying March 7th RVC conversion")
+        from tts_audio import decode_audio
+        timer = timer or BudgetTimer(self.scheduler)
+        
+        # Decode once at the source rate; every tier reuses the buffer
+        with timer.stage("decode"):
+            audio, sr = decode_audio(base_audio)
+        log.debug("Loaded audio: %d samples at %dHz", len(audio), sr)
+        
+        tier, blocks = self.scheduler.run(self.plans(audio, sr), timer, len(audio) / sr,
+                                          lambda tier: self.render_tier(tier, audio, sr, timer),
+                                          resolve_format(self.output_format, output_path))
+        
+        # Save the enhanced audio
+        with timer.stage("encode"), self.open_output(output_path, sr) as writer:
+            for block in blocks:
+                writer.write(block)
+        log.debug("Converted %d samples at %dHz (%s)", len(audio), sr, tier)
+        return writer.summary()
+    
+    def build_result(self, output_path, written, pitch, speed):
+        """Assemble the result dict reported for a finished utterance."""
+        return {
+            "success": True,
+            "output_path": output_path,
+            "duration": round(written["duration"], 2),
+            "settings": {
+                "pitch": pitch,
+                "speed": speed,
+                "energy": 1.0,
+                "sample_rate": written["sample_rate"],
+                "format": written["format"],
+                "bitrate": self.bitrate,
+                "model": self.model_name
+            },
+            "file_size": written["bytes"]
+        }
     
-    def synthesize(self, text, output_path, pitch=0.2, speed=1.2):
-        """Complete TTS synthesis with March 7th voice."""
+    def synthesize(self, text, output_path, pitch=0.2, speed=1.2, budget_ms=None, cancel=None):
+        """
+        Complete TTS synthesis with March 7th voice.
+        
+        Args:
+            budget_ms: Optional latency budget; the result's "schedule" reports
+                the tier that ran and whether the deadline was met
+            cancel: Optional threading.Event; once set, the request stops at
+                its next stage or conversion block and fails with "Request cancelled"
+        """
+        timer = BudgetTimer(self.scheduler, budget_ms, cancel)
         try:
-            print(f"Starting March 7th TTS synthesis...")
-            print(f"Text: '{text}'")
-            print(f"Output: {output_path}")
+            log.info("Synthesizing %d characters to %s", len(text), output_path)
+            log.debug("Text: %r", text)
+            
+            # Serve repeated lines straight from the cache; stdout/socket
+            # targets are encoded live and never cached
+            cache = None if is_stream_target(output_path) else self.cache
+            cache_key = None
+            if cache:
+                voice = f"{self.model_path.name}:{self.index_path.name}"
+                with timer.stage("cache_lookup"):
+                    cache_key = cache.make_key(text, voice, self.model_name,
+                                               {"pitch": pitch, "speed": speed,
+                                                "rvc_inference": self.converter is not None,
+                                                "transpose": self.converter.transpose if self.converter else None,
+                                                "int8": bool(self.converter and self.converter.quantized),
+                                                "bf16": bool(self.converter and self.converter.bf16),
+                                                "pitch_backend": self.pitch_backend,
+                                                "format": resolve_format(self.output_format, output_path),
+                                                "bitrate": self.bitrate})
+                    meta = cache.fetch(cache_key, output_path)
+                if meta:
+                    timer.tier = 'cached'
+                    result = self.build_result(output_path, meta, pitch, speed)
+                    result["cache"] = cache.stats(hit=True)
+                    result["schedule"] = timer.schedule_report()
+                    result["timings"] = timer.as_dict()
+                    log.info("Cache hit: %s", output_path)
+                    return result
             
             # Step 1: Generate base speech
-            base_audio_path = self.text_to_speech_base(text)
+            with timer.stage("base_speech"):
+                base_audio = self.text_to_speech_base(text)
             
             # Step 2: Apply RVC conversion
-            success = self.apply_rvc_conversion(base_audio_path, output_path)
-            
-            # Clean up temporary file
-            if os.path.exists(base_audio_path):
-                os.unlink(base_audio_path)
+            written = self.apply_rvc_conversion(base_audio, output_path, timer=timer)
             
-            if success and os.path.exists(output_path):
-                # Get file info
-                audio_info = sf.info(output_path)
-                file_size = os.path.getsize(output_path)
+            if is_stream_target(output_path) or os.path.exists(output_path):
+                result = self.build_result(output_path, written, pitch, speed)
                 
-                result = {
-                    "success": True,
-                    "output_path": output_path,
-                    "duration": round(audio_info.duration, 2),
-                    "settings": {
-                        "pitch": pitch,
-                        "speed": speed,
-                        "energy": 1.0,
-                        "sample_rate": audio_info.samplerate,
-                        "model": "March7thEN_RVC"
-                    },
-                    "file_size": file_size
-                }
+                # Degraded renders are never cached
+                if cache and timer.tier == 'full':
+                    with timer.stage("cache_store"):
+                        cache.store(cache_key, output_path, written)
+                if cache:
+                    result["cache"] = cache.stats(hit=False)
                 
-                print(f"TTS successful! March 7th voice generated: {output_path} ({file_size} bytes)")
+                result["schedule"] = timer.schedule_report()
+                result["timings"] = timer.as_dict()
+                result["speech"] = self.speech.stats()
+                
+                log.info("TTS successful: %s (%d bytes, %s tier)", output_path, result['file_size'], timer.tier)
                 return result
             else:
                 raise RuntimeError("RVC conversion failed")
                 
         except Exception as e:
-            print(f"TTS synthesis failed: {e}")
+            log.error("TTS synthesis failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "output_path": None
             }
+    
+    def close(self):
+        self.speech.close()
 
-def main():
-    parser = argparse.ArgumentParser(description='March 7th RVC Text-to-Speech')
-    parser.add_argument('--text', required=True, help='Text to synthesize')
-    parser.add_argument('--output', required=True, help='Output audio file path')
-    parser.add_argument('--model', required=True, help='Path to March 7th .pth model file')
-    parser.add_argument('--index', required=True, help='Path to March 7th .index file')
-    parser.add_argument('--pitch', type=float, default=0.2, help='Pitch adjustment')
-    parser.add_argument('--speed', type=float, default=1.2, help='Speed adjustment')
+# Engine owned by each batch worker process
+_worker_tts = None
+
+def inference_options_from_args(args, workers=None):
+    """
+    RVCConverter options for one process
+    
+    With several workers on a host each gets an equal share of the cores and
+    a single inter-op thread, so workers do not oversubscribe the CPU.
+    """
+    threads, interop_threads = args.torch_threads, args.torch_interop_threads
+    if workers:
+        threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        interop_threads = interop_threads or 1
+    return {
+        "hubert_path": args.hubert,
+        "transpose": args.transpose,
+        "threads": threads,
+        "interop_threads": interop_threads,
+        "quantized": args.int8,
+        "quantized_cache_dir": args.int8_cache_dir
+    }
+
+def init_batch_worker(model_path, index_path, block_threshold, inference_options,
+                      output_format=None, bitrate=None, log_level='INFO', log_format='text',
+                      pitch_backend=None, speech_options=None):
+    """ProcessPoolExecutor initializer: load the model and start SAPI once per worker."""
+    global _worker_tts
+    setup_logging(log_level, log_format)
+    _worker_tts = March7thRVCTTS(model_path, index_path, block_threshold=block_threshold,
+                                 inference_options=inference_options,
+                                 output_format=output_format, bitrate=bitrate,
+                                 pitch_backend=pitch_backend,
+                                 speech=SpeechSessionPool(**speech_options) if speech_options else None)
+
+def synthesize_in_worker(text, output_path, pitch, speed, budget_ms=None):
+    return _worker_tts.synthesize(text, output_path, pitch=pitch, speed=speed, budget_ms=budget_ms)
+
+async def run_batch_job(args):
+    """Fan manifest items out over a pool of worker processes."""
+    loop = asyncio.get_running_loop()
+    metrics = metrics_from_args(args, 'rvc')
+    inference_options = inference_options_from_args(args, workers=args.workers)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_batch_worker,
+                             initargs=(args.model, args.index, args.block_dsp_seconds,
+                                       inference_options, args.format, args.bitrate,
+                                       args.log_level, args.log_format, args.pitch_backend,
+                                       speech_options_from_args(args, sessions=1))) as pool:
+        async def process_item(item):
+            result = await loop.run_in_executor(
+                pool, synthesize_in_worker, item['text'], item['output'],
+                item.get('pitch', args.pitch), item.get('speed', args.speed),
+                item.get('budget_ms', args.budget_ms)
+            )
+            record_timings(args, result, metrics)
+            return result
+        
+        summary = await run_batch(args.batch, process_item, args.results, max_pending=args.workers * 2)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary["success"] else 1
+
+def make_handler(args, queue=None):
+    """Load the model once and return a request handler for serve mode."""
+    metrics = metrics_from_args(args, 'rvc')
+    if metrics and queue:
+        queue.add_metrics(metrics)
+    cache = cache_from_args(args)
+    if metrics and cache and cache.remote:
+        cache.add_metrics(metrics)
+    march7th_tts = March7thRVCTTS(
+        args.model, args.index,
+        cache=cache,
+        block_threshold=args.block_dsp_seconds,
+        inference_options=inference_options_from_args(args),
+        output_format=args.format,
+        bitrate=args.bitrate,
+        pitch_backend=args.pitch_backend,
+        speech=SpeechSessionPool(**speech_options_from_args(args))
+    )
     
-    args = parser.parse_args()
+    def handle(request, emit):
+        if request.get('op') == 'batch':
+            # Inference runs one utterance at a time; answer the batch in order
+            results = [handle(dict(item, cancel=request.get('cancel')), emit) for item in request['requests']]
+            return {"success": all(result["success"] for result in results), "results": results}
+        result = march7th_tts.synthesize(
+            text=request['text'],
+            output_path=request['output'],
+            pitch=request.get('pitch', args.pitch),
+            speed=request.get('speed', args.speed),
+            budget_ms=request.get('budget_ms', args.budget_ms),
+            cancel=request.get('cancel')
+        )
+        record_timings(args, result, metrics)
+        return result
     
+    return handle
+
+def run_once(args):
+    metrics = metrics_from_args(args, 'rvc')
     try:
         # Initialize March 7th RVC TTS
-        march7th_tts = March7thRVCTTS(args.model, args.index)
+        march7th_tts = March7thRVCTTS(
+            args.model, args.index,
+            cache=cache_from_args(args),
+            block_threshold=args.block_dsp_seconds,
+            inference_options=inference_options_from_args(args),
+            output_format=args.format,
+            bitrate=args.bitrate,
+            pitch_backend=args.pitch_backend,
+            speech=SpeechSessionPool(**speech_options_from_args(args))
+        )
         
         # Synthesize speech
-        result = march7th_tts.synthesize(
+        result = run_profiled(args, lambda: march7th_tts.synthesize(
             text=args.text,
             output_path=args.output,
             pitch=args.pitch,
-            speed=args.speed
-        )
+            speed=args.speed,
+            budget_ms=args.budget_ms
+        ))
+        march7th_tts.close()
+        record_timings(args, result, metrics)
         
         # Output result as JSON
         print(json.dumps(result, ensure_ascii=False))
         
-        if result["success"]:
-            sys.exit(0)
-        else:
-            sys.exit(1)
+        return 0 if result["success"] else 1
             
     except Exception as e:
         error_result = {
@@ -230,7 +426,60 @@ def main():
             "output_path": None
         }
         print(json.dumps(error_result, ensure_ascii=False))
-        sys.exit(1)
+        return 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='March 7th RVC Text-to-Speech')
+    parser.add_argument('--text', help='Text to synthesize')
+    parser.add_argument('--output', help='Output audio file path, - for stdout, or unix:PATH / tcp:HOST:PORT')
+    parser.add_argument('--model', required=True, help='Path to March 7th .pth model file')
+    parser.add_argument('--index', required=True, help='Path to March 7th .index file')
+    parser.add_argument('--hubert', help='Path to hubert_base.pt (default: next to the model)')
+    parser.add_argument('--transpose', type=float, default=4.0,
+                        help='Semitones the RVC model shifts the base speech by (default: 4)')
+    parser.add_argument('--pitch', type=float, default=0.2, help='Pitch adjustment')
+    parser.add_argument('--speed', type=float, default=1.2, help='Speed adjustment')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a resident worker reading JSON-line requests')
+    parser.add_argument('--socket', help='Unix socket path for --serve (default: stdin/stdout)')
+    parser.add_argument('--block-dsp-seconds', type=float, default=30.0,
+                        help='Convert audio longer than this in constant-memory blocks')
+    parser.add_argument('--torch-threads', type=int,
+                        help='Intra-op threads for RVC inference (batch default: cores / workers)')
+    parser.add_argument('--torch-interop-threads', type=int,
+                        help='Inter-op threads for RVC inference (batch default: 1 per worker)')
+    parser.add_argument('--int8', action='store_true',
+                        help='Run the HuBERT content encoder on a dynamic int8 copy, and the decoder '
+                             'blocks in bfloat16 where the CPU supports it natively')
+    parser.add_argument('--int8-cache-dir',
+                        help='Where the int8 HuBERT is cached (default: next to hubert_base.pt)')
+    add_speech_arguments(parser)
+    add_effects_arguments(parser)
+    add_output_arguments(parser)
+    add_budget_arguments(parser)
+    add_cache_arguments(parser)
+    add_batch_arguments(parser)
+    add_queue_arguments(parser)
+    add_profiling_arguments(parser)
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    logging_from_args(args)
+    
+    if args.serve:
+        queue = queue_from_args(args)
+        return serve(lambda: make_handler(args, queue), args.socket, queue)
+    if args.batch:
+        return asyncio.run(run_batch_job(args))
+    if not args.text or not args.output:
+        parser.error('--text and --output are required unless --serve or --batch is given')
+    
+    # With audio on stdout, the result JSON goes to stderr
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.output == '-' else contextlib.nullcontext()
+    
+    with quiet:
+        return run_once(args)
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -4,29 +4,50 @@ March 7th Voice Synthesis Script
 Uses Windows SAPI with voice adjustments to simulate March 7th voice characteristics
 """
 
+import asyncio
+import io
 import sys
 import os
 import json
 import argparse
-import subprocess
+import logging
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from tts_batch import add_batch_arguments, run_batch
+from tts_logging import add_logging_arguments, logging_from_args
+from tts_metrics import add_metrics_arguments, metrics_from_args
+from tts_profiling import StageTimer, add_profiling_arguments, record_timings, run_profiled
+from tts_queue import add_queue_arguments, queue_from_args
+from tts_server import serve
+from tts_speech import SpeechSessionPool, add_speech_arguments, sapi_command, speech_options_from_args
+
+log = logging.getLogger('march7th.sapi')
+
+# Young female voices first, then any female voice
+PREFERRED_VOICES = ("Microsoft Zira Desktop", "Microsoft Hazel Desktop", "Microsoft Eva Desktop")
+
 class March7thTTS:
-    def __init__(self, model_path, index_path):
+    def __init__(self, model_path, index_path, speech=None):
         """
         Initialize March 7th TTS with the trained model
         
         Args:
             model_path: Path to March7thEN.pth file
             index_path: Path to the index file
+            speech: tts_speech.SpeechSessionPool speaking the utterances,
+                defaults to one resident SAPI session
         """
         self.model_path = model_path
         self.index_path = index_path
         self.is_loaded = True  # Using system TTS for now
+        # SAPI starts once and picks its voice once, not per utterance
+        self.speech = speech or SpeechSessionPool(sapi_command(PREFERRED_VOICES))
         
-        print(f"Initializing March 7th TTS (fallback mode)")
-        print(f"Model path: {model_path}")
-        print(f"Index path: {index_path}")
+        log.info("Initializing March 7th TTS (fallback mode)")
+        log.debug("Model path: %s, index path: %s", model_path, index_path)
         
     def synthesize(self, text, output_path, settings=None):
         """
@@ -50,131 +71,134 @@ class March7thTTS:
         
         if settings:
             default_settings.update(settings)
-            
+        
+        timer = StageTimer()
         try:
-            # Create PowerShell script for TTS with March 7th-like characteristics
-            ps_script = f'''
-Add-Type -AssemblyName System.Speech
-$synth = New-Object System.Speech.Synthesis.SpeechSynthesizer
-
-# Try to find the best female voice available
-$voices = $synth.GetInstalledVoices()
-$selectedVoice = $null
-
-# Priority order: young female voices first
-$preferredVoices = @("Microsoft Zira Desktop", "Microsoft Hazel Desktop", "Microsoft Eva Desktop")
-
-foreach ($preferred in $preferredVoices) {{
-    foreach ($voice in $voices) {{
-        if ($voice.VoiceInfo.Name -eq $preferred) {{
-            $selectedVoice = $voice.VoiceInfo.Name
-            break
-        }}
-    }}
-    if ($selectedVoice) {{ break }}
-}}
-
-# If no preferred voice found, use any female voice
-if (-not $selectedVoice) {{
-    foreach ($voice in $voices) {{
-        if ($voice.VoiceInfo.Gender -eq "Female") {{
-            $selectedVoice = $voice.VoiceInfo.Name
-            break
-        }}
-    }}
-}}
-
-# Fallback to default voice
-if ($selectedVoice) {{
-    $synth.SelectVoice($selectedVoice)
-    Write-Host "Using voice: $selectedVoice"
-}} else {{
-    Write-Host "Using default system voice"
-}}
-
-# March 7th voice characteristics:
-# - Energetic and cheerful (faster rate)
-# - Young and bright (higher pitch via voice selection)
-$rate = [Math]::Max(-10, [Math]::Min(10, {int(default_settings['speed'] * 3 - 2)}))
-$synth.Rate = $rate
-$synth.Volume = 100
-
-Write-Host "Synthesizing: '{text}'"
-Write-Host "Rate: $rate"
-
-# Create output directory if it doesn't exist
-$outputDir = Split-Path "{output_path}" -Parent
-if (-not (Test-Path $outputDir)) {{
-    New-Item -ItemType Directory -Path $outputDir -Force
-}}
-
-# Save to WAV file
-$synth.SetOutputToWaveFile("{output_path}")
-$synth.Speak("{text}")
-$synth.Dispose()
-
-Write-Host "Audio saved to: {output_path}"
-'''
-            
-            # Write PowerShell script to temporary file
-            script_path = Path(output_path).parent / "temp_march7th_tts.ps1"
-            with open(script_path, 'w', encoding='utf-8') as f:
-                f.write(ps_script)
+            log.debug("Running TTS for March 7th: %r", text)
             
-            print(f"Running TTS for March 7th: '{text}'")
+            # March 7th voice characteristics:
+            # - Energetic and cheerful (faster rate)
+            # - Young and bright (higher pitch via voice selection)
+            rate = int(default_settings['speed'] * 3 - 2)
+            with timer.stage('base_speech'):
+                wav_bytes = self.speech.speak(text, rate)
             
-            # Execute PowerShell script
-            result = subprocess.run([
-                "powershell.exe", 
-                "-ExecutionPolicy", "Bypass", 
-                "-File", str(script_path)
-            ], capture_output=True, text=True, cwd=str(Path(output_path).parent))
+            with timer.stage('write'):
+                write_file(output_path, wav_bytes)
+            file_size = len(wav_bytes)
+            log.info("TTS successful: %s (%d bytes)", output_path, file_size)
             
-            # Clean up
-            script_path.unlink(missing_ok=True)
+            # Real duration from the WAV header
+            with timer.stage('probe'):
+                with wave.open(io.BytesIO(wav_bytes), 'rb') as wav_file:
+                    duration = wav_file.getnframes() / wav_file.getframerate()
             
-            if result.returncode == 0 and os.path.exists(output_path):
-                file_size = os.path.getsize(output_path)
-                print(f"TTS successful! Audio file created: {output_path} ({file_size} bytes)")
-                
-                return {
-                    'success': True,
-                    'output_path': output_path,
-                    'duration': len(text) * 0.15,  # Estimate based on speech rate
-                    'settings': default_settings,
-                    'file_size': file_size
-                }
-            else:
-                error_msg = f"PowerShell execution failed. Return code: {result.returncode}"
-                if result.stderr:
-                    error_msg += f" Error: {result.stderr}"
-                if result.stdout:
-                    print(f"PowerShell output: {result.stdout}")
-                
-                return {
-                    'success': False,
-                    'error': error_msg
-                }
+            return {
+                'success': True,
+                'output_path': output_path,
+                'duration': round(duration, 2),
+                'settings': default_settings,
+                'file_size': file_size,
+                'timings': timer.as_dict(),
+                'speech': self.speech.stats()
+            }
             
         except Exception as e:
             return {
                 'success': False,
                 'error': f"Exception during synthesis: {str(e)}"
             }
+    
+    def close(self):
+        self.speech.close()
+
+def write_file(output_path, data):
+    """Write data to output_path atomically, creating its directory."""
+    directory = Path(output_path).parent
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-def main():
+async def run_batch_job(args):
+    """Run manifest items on a thread pool, one resident SAPI session per thread."""
+    tts = March7thTTS(args.model, args.index, speech=speech_from_args(args, sessions=args.workers))
+    metrics = metrics_from_args(args, 'sapi')
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        async def process_item(item):
+            result = await loop.run_in_executor(
+                pool, tts.synthesize, item['text'], item['output'], {
+                    'pitch': item.get('pitch', args.pitch),
+                    'speed': item.get('speed', args.speed)
+                }
+            )
+            record_timings(args, result, metrics)
+            return result
+        
+        summary = await run_batch(args.batch, process_item, args.results, max_pending=args.workers * 2)
+    tts.close()
+    print(json.dumps(summary))
+    return 0 if summary['success'] else 1
+
+def speech_from_args(args, sessions=None):
+    return SpeechSessionPool(**speech_options_from_args(args, PREFERRED_VOICES, sessions))
+
+def make_handler(args, queue=None):
+    """Initialize TTS once and return a request handler for serve mode."""
+    # One SAPI utterance cannot be interrupted; cancelled requests are only dropped while queued
+    tts = March7thTTS(args.model, args.index, speech=speech_from_args(args))
+    metrics = metrics_from_args(args, 'sapi')
+    if metrics and queue:
+        queue.add_metrics(metrics)
+    
+    def handle(request, emit):
+        settings = {
+            'pitch': request.get('pitch', args.pitch),
+            'speed': request.get('speed', args.speed)
+        }
+        result = tts.synthesize(request['text'], request['output'], settings)
+        record_timings(args, result, metrics)
+        return result
+    
+    return handle
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='March 7th Voice Synthesis')
-    parser.add_argument('--text', required=True, help='Text to synthesize')
-    parser.add_argument('--output', required=True, help='Output audio file path')
+    parser.add_argument('--text', help='Text to synthesize')
+    parser.add_argument('--output', help='Output audio file path')
     parser.add_argument('--model', required=True, help='Path to March7thEN.pth')
     parser.add_argument('--index', required=True, help='Path to index file')
     parser.add_argument('--pitch', type=float, default=0.2, help='Pitch adjustment')
     parser.add_argument('--speed', type=float, default=1.2, help='Speed adjustment')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a resident worker reading JSON-line requests')
+    parser.add_argument('--socket', help='Unix socket path for --serve (default: stdin/stdout)')
+    add_speech_arguments(parser)
+    add_batch_arguments(parser)
+    add_queue_arguments(parser)
+    add_profiling_arguments(parser)
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    logging_from_args(args)
     
-    args = parser.parse_args()
+    if args.serve:
+        queue = queue_from_args(args)
+        return serve(lambda: make_handler(args, queue), args.socket, queue)
+    if args.batch:
+        return asyncio.run(run_batch_job(args))
+    if not args.text or not args.output:
+        parser.error('--text and --output are required unless --serve or --batch is given')
     
     # Initialize TTS
-    tts = March7thTTS(args.model, args.index)
+    tts = March7thTTS(args.model, args.index, speech=speech_from_args(args))
     
     # Synthesize
     settings = {
@@ -182,7 +206,9 @@ def main():
         'speed': args.speed
     }
     
-    result = tts.synthesize(args.text, args.output, settings)
+    result = run_profiled(args, lambda: tts.synthesize(args.text, args.output, settings))
+    tts.close()
+    record_timings(args, result, metrics_from_args(args, 'sapi'))
     
     # Return JSON result
     print(json.dumps(result))
@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+"""
+CPU voice-conversion inference for the March 7th RVC model
+Loads the RVC v1/v2 checkpoint, the HuBERT content encoder and the speaker
+feature index once per process, then converts audio the way RVC's own
+pipeline does: HuBERT features blended with their nearest index rows, F0
+transposed and fed to the NSF decoder, in segments cut at quiet points
+with a second of context on either side
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+import types
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+
+from rvc_models import HubertModel, Synthesizer, fold_weight_norm
+
+log = logging.getLogger('march7th.rvc')
+
+NPY_MAGIC = b'\x93NUMPY'
+
+# HuBERT and the F0 tracker run at 16 kHz; one F0 frame (and half a HuBERT frame) is 10 ms
+CONTENT_SR = 16000
+FRAME = 160
+F0_MIN = 50.0
+F0_MAX = 1100.0
+# Voicing gate of the YIN fallback: a voiced frame repeats at its tracked
+# period and is within VOICED_FLOOR_DB of the loudest frame
+APERIODICITY_MAX = 0.5
+VOICED_FLOOR_DB = -50.0
+
+# Long inputs are converted in segments of about this length, cut at the
+# quietest frame within SEGMENT_SEARCH_SECONDS of it; every segment sees
+# CONTEXT_SECONDS of real audio on both sides, which is trimmed afterwards
+SEGMENT_SECONDS = 10.0
+SEGMENT_SEARCH_SECONDS = 1.0
+CONTEXT_SECONDS = 1.0
+# Segments are padded to a multiple of this length, so that inputs of
+# similar length reuse the convolution kernels oneDNN builds per input shape
+SHAPE_BUCKET_SECONDS = 0.5
+
+SAMPLE_RATES = {'32k': 32000, '40k': 40000, '48k': 48000}
+
+# Globals a HuBERT checkpoint may use to rebuild its tensors and containers
+_TENSOR_GLOBALS = {
+    ('collections', 'OrderedDict'),
+    ('torch._utils', '_rebuild_tensor_v2'),
+    ('torch._utils', '_rebuild_parameter'),
+    ('torch._utils', '_rebuild_parameter_with_state'),
+    ('torch._tensor', '_rebuild_from_type_v2'),
+    ('torch.nn.parameter', 'Parameter'),
+    ('torch', 'Tensor'),
+    ('torch', 'Size'),
+    ('copyreg', '_reconstructor'),
+    ('builtins', 'object'),
+    ('builtins', 'set'),
+    ('builtins', 'frozenset'),
+    ('builtins', 'slice')
+}
+
+
+class UnsupportedCheckpoint(ValueError):
+    """The model or index is not in a format this converter can run."""
+
+
+def configure_threads(intra_op=None, inter_op=None):
+    """
+    Apply a worker's torch thread policy (None keeps torch's default)
+
+    Args:
+        intra_op: Threads used inside one operator (matmul, conv)
+        inter_op: Threads running independent operators concurrently
+    """
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op and torch.get_num_interop_threads() != inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Only settable once per process, before any inter-op work ran
+            log.debug("torch inter-op threads already fixed at %d", torch.get_num_interop_threads())
+
+
+class _Placeholder:
+    """Inert stand-in for a class pickled next to the weights (fairseq configs and dictionaries)."""
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Placeholder()
+
+    def __setstate__(self, state):
+        pass
+
+
+class _TensorsOnlyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) in _TENSOR_GLOBALS:
+            return super().find_class(module, name)
+        if module == 'torch' and isinstance(getattr(torch, name, None), torch.dtype):
+            return getattr(torch, name)
+        # Nothing else is imported or called, so the file cannot run code
+        return _Placeholder
+
+
+_tensors_only_pickle = types.ModuleType('tensors_only_pickle')
+_tensors_only_pickle.Unpickler = _TensorsOnlyUnpickler
+_tensors_only_pickle.load = lambda file, **kwargs: _TensorsOnlyUnpickler(file, **kwargs).load()
+
+
+def load_checkpoint(model_path):
+    """Read an RVC inference model (the small .pth RVC exports), rejecting anything else."""
+    try:
+        checkpoint = torch.load(model_path, map_location='cpu', weights_only=True)
+    except TypeError:
+        # torch < 1.13 has no weights_only
+        checkpoint = torch.load(model_path, map_location='cpu')
+    except Exception as e:
+        raise UnsupportedCheckpoint(f"Cannot read checkpoint {model_path}: {e}")
+
+    if not isinstance(checkpoint, dict) or 'weight' not in checkpoint or 'config' not in checkpoint:
+        raise UnsupportedCheckpoint(
+            f"{model_path} is not an RVC inference model (training checkpoints must be exported "
+            f"with RVC's small-model export first)")
+    return checkpoint
+
+
+def build_synthesizer(checkpoint):
+    """Synthesizer for a checkpoint from load_checkpoint, with its weights loaded."""
+    weights = fold_weight_norm({name: value.float() for name, value in checkpoint['weight'].items()
+                                if not name.startswith('enc_q.')})
+    config = list(checkpoint['config'])
+    try:
+        config[-1] = SAMPLE_RATES.get(config[-1], config[-1])
+        # RVC sizes the speaker table from the weights, not the stored config
+        config[-3] = weights['emb_g.weight'].shape[0]
+        net = Synthesizer(*config, feature_dims=weights['enc_p.emb_phone.weight'].shape[1],
+                          f0=bool(checkpoint.get('f0', 1)),
+                          conv_post_bias='dec.conv_post.bias' in weights)
+        net.load_state_dict(weights)
+    except (KeyError, TypeError, ValueError, RuntimeError) as e:
+        raise UnsupportedCheckpoint(f"Unexpected RVC model layout: {e}")
+    if net.hop_length * 100 != net.sr:
+        raise UnsupportedCheckpoint(f"Decoder upsamples {net.hop_length}x, which does not fit {net.sr} Hz")
+    return net.eval()
+
+
+def load_hubert(path):
+    """
+    HuBERT content encoder from fairseq's hubert_base.pt
+
+    fairseq pickles its config and dictionary objects next to the weights;
+    they are replaced by inert placeholders, so only tensors are rebuilt.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise UnsupportedCheckpoint(f"HuBERT content encoder not found at {path} (RVC models need hubert_base.pt)")
+    try:
+        checkpoint = torch.load(path, map_location='cpu', weights_only=False, pickle_module=_tensors_only_pickle)
+        state = checkpoint.get('model', checkpoint)
+        state = fold_weight_norm({name: value.float() for name, value in state.items()
+                                  if torch.is_tensor(value) and name not in ('label_embs_concat', 'mask_emb')})
+        model = HubertModel.from_state_dict(state)
+        model.load_state_dict(state)
+    except Exception as e:
+        raise UnsupportedCheckpoint(f"Cannot load HuBERT from {path}: {e}")
+    return model.eval()
+
+
+def _blend(features, dist, rows):
+    """Rows mixed by inverse squared distance, as RVC weights its retrieved features."""
+    weights = np.where(rows >= 0, 1.0 / np.square(np.maximum(dist, 0.0) + 1e-3), 0.0)
+    weights /= weights.sum(axis=1, keepdims=True)
+    neighbours = np.asarray(features[np.maximum(rows, 0).ravel()], dtype=np.float32)
+    neighbours = neighbours.reshape(*rows.shape, features.shape[1])
+    return np.einsum('qk,qkd->qd', weights, neighbours).astype(np.float32)
+
+
+class FeatureIndex:
+    def __init__(self, path):
+        """
+        Speaker feature bank stored as an .npy array (RVC's total_fea.npy)
+
+        The array is memory-mapped read-only, so it is paged in on demand and
+        shared between every process that opens the same file.
+        """
+        self.features = np.load(path, mmap_mode='r')
+        if self.features.ndim != 2:
+            raise UnsupportedCheckpoint(f"{path} must hold a 2-D (rows, dims) feature array")
+
+    @property
+    def dims(self):
+        return self.features.shape[1]
+
+    def search(self, queries, k=8, query_rows=512, chunk_rows=16384):
+        """
+        Blend of the k nearest index rows for every query row
+
+        Queries and index rows are both taken in chunks, so the distance
+        matrix never exceeds query_rows x chunk_rows; only the k best
+        distances and their row numbers are carried between chunks.
+        """
+        k = min(k, len(self.features))
+        blended = np.empty((len(queries), self.dims), dtype=np.float32)
+        for query_start in range(0, len(queries), query_rows):
+            batch = queries[query_start:query_start + query_rows]
+            batch_norms = np.sum(batch ** 2, axis=1, keepdims=True)
+            best_dist = np.full((len(batch), k), np.inf, dtype=np.float32)
+            best_rows = np.full((len(batch), k), -1, dtype=np.int64)
+
+            for start in range(0, len(self.features), chunk_rows):
+                chunk = np.asarray(self.features[start:start + chunk_rows], dtype=np.float32)
+                dist = batch_norms - 2.0 * batch @ chunk.T + np.sum(chunk ** 2, axis=1)
+                nearest = min(k, len(chunk))
+                columns = np.argpartition(dist, nearest - 1, axis=1)[:, :nearest]
+                merged_dist = np.concatenate([best_dist, np.take_along_axis(dist, columns, axis=1)], axis=1)
+                merged_rows = np.concatenate([best_rows, columns + start], axis=1)
+                order = np.argpartition(merged_dist, k - 1, axis=1)[:, :k]
+                best_dist = np.take_along_axis(merged_dist, order, axis=1)
+                best_rows = np.take_along_axis(merged_rows, order, axis=1)
+
+            blended[query_start:query_start + len(batch)] = _blend(self.features, best_dist, best_rows)
+        return blended
+
+
+class FaissIndex:
+    def __init__(self, path):
+        """The .index RVC training writes; needs faiss."""
+        import faiss
+
+        self.index = faiss.read_index(str(path))
+        self.features = self.index.reconstruct_n(0, self.index.ntotal)
+
+    @property
+    def dims(self):
+        return self.index.d
+
+    def search(self, queries, k=8):
+        dist, rows = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return _blend(self.features, dist, rows)
+
+
+def load_index(path):
+    """Feature index for an .npy bank or a faiss index, or None when it cannot be read here."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(NPY_MAGIC))
+    if magic == NPY_MAGIC:
+        return FeatureIndex(path)
+    try:
+        return FaissIndex(path)
+    except ImportError:
+        log.warning("faiss is not installed; converting without index retrieval from %s", path)
+    except RuntimeError as e:
+        log.warning("Cannot read feature index %s (%s); converting without retrieval", path, e)
+    return None
+
+
+def estimate_f0(audio, frames):
+    """
+    F0 in Hz (0 when unvoiced) for frames 10 ms frames of 16 kHz audio
+
+    Uses Praat's autocorrelation tracker (RVC's "pm" method) when
+    parselmouth is installed; otherwise YIN gated by yin_voicing, which
+    agrees with a full pYIN run on about 9 frames in 10 at a small
+    fraction of its cost.
+    """
+    try:
+        import parselmouth
+        f0 = parselmouth.Sound(audio, CONTENT_SR).to_pitch_ac(
+            time_step=FRAME / CONTENT_SR, voicing_threshold=0.6,
+            pitch_floor=F0_MIN, pitch_ceiling=F0_MAX).selected_array['frequency']
+        lead = max((frames - len(f0) + 1) // 2, 0)
+        f0 = np.pad(f0, (lead, 0))
+    except ImportError:
+        import librosa
+        f0 = librosa.yin(audio, fmin=F0_MIN, fmax=F0_MAX, sr=CONTENT_SR, frame_length=1024, hop_length=FRAME)
+        f0 = np.where(yin_voicing(audio, f0, frame_length=1024), f0, 0.0)
+    f0 = np.asarray(f0[:frames], dtype=np.float32)
+    return np.pad(f0, (0, frames - len(f0)))
+
+
+def yin_voicing(audio, f0, frame_length=1024):
+    """
+    Voiced flags for a librosa.yin track (centered frames at FRAME hops)
+
+    YIN reports a period for every frame, noise and silence included. A
+    frame counts as voiced when its aperiodicity at that period, the
+    difference from the signal one period later relative to their energy,
+    is below APERIODICITY_MAX and it is within VOICED_FLOOR_DB of the
+    loudest frame.
+    """
+    import librosa
+    frames = librosa.util.frame(np.pad(audio, frame_length // 2), frame_length=frame_length,
+                                hop_length=FRAME)[:, :len(f0)]
+    lag = np.rint(CONTENT_SR / f0[:frames.shape[1]]).astype(np.int64)
+    # Compared span that still fits in the frame at the longest period
+    width = frame_length - int(np.ceil(CONTENT_SR / F0_MIN))
+    head = frames[:width]
+    lagged = np.take_along_axis(frames, np.arange(width)[:, None] + lag, axis=0)
+    level = np.sum(head ** 2, axis=0)
+    energy = level + np.sum(lagged ** 2, axis=0)
+    aperiodicity = np.sum((head - lagged) ** 2, axis=0) / np.maximum(energy, 1e-10)
+    loud = level > level.max() * 10 ** (VOICED_FLOOR_DB / 10)
+    voiced = (aperiodicity < APERIODICITY_MAX) & loud
+    return np.pad(voiced, (0, len(f0) - len(voiced)))
+
+
+def coarse_pitch(f0):
+    """RVC's 255 mel-spaced pitch bins (1 is unvoiced) for the prior encoder."""
+    mel_min, mel_max = (1127.0 * np.log(1.0 + bound / 700.0) for bound in (F0_MIN, F0_MAX))
+    mel = 1127.0 * np.log(1.0 + f0 / 700.0)
+    voiced = mel > 0
+    mel[voiced] = (mel[voiced] - mel_min) * 254.0 / (mel_max - mel_min) + 1.0
+    return np.rint(np.clip(mel, 1.0, 255.0)).astype(np.int64)
+
+
+def quantize(model):
+    """Dynamic int8 quantization: weights stored as int8, activations quantized per call."""
+    # Only Linear layers have dynamic int8 kernels; HuBERT's transformer is made of them
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def bf16_supported():
+    """Whether oneDNN has native bfloat16 kernels on this CPU (AVX512-BF16 or AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class _BFloat16(nn.Module):
+    def __init__(self, module):
+        """Runs a layer's convolutions in bfloat16; what it returns (and residual sums) stays float32."""
+        super().__init__()
+        self.module = module
+
+    def forward(self, x):
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            return self.module(x).float()
+
+
+def bfloat16_decoder(net):
+    """
+    Move the NSF decoder's upsampling and residual blocks to bfloat16
+
+    These hold nearly all of the decoder's convolutions, which dominate
+    conversion time and have no dynamic int8 kernels. The excitation,
+    input and output convolutions stay float32: they carry the signal
+    itself rather than a residual added to it, and bfloat16 there costs
+    far more accuracy than time.
+    """
+    dec = net.dec
+    for layers in (dec.ups, dec.resblocks):
+        for index, layer in enumerate(layers):
+            layers[index] = _BFloat16(layer)
+    return net
+
+
+def quantized_skeleton(config):
+    """
+    Uninitialized HuBERT with the layout quantize() produces, for loading a cached int8 state dict
+
+    Built on the meta device, so nothing is allocated until load_state_dict(assign=True).
+    """
+    with torch.device('meta'):
+        model = HubertModel(**config)
+    for name, module in list(model.named_modules()):
+        if isinstance(module, nn.Linear):
+            parent_name, _, child = name.rpartition('.')
+            parent = model.get_submodule(parent_name) if parent_name else model
+            setattr(parent, child, torch.ao.nn.quantized.dynamic.Linear(
+                module.in_features, module.out_features, bias_=module.bias is not None, dtype=torch.qint8))
+    return model
+
+
+def load_quantized(hubert_path, cache_dir=None):
+    """
+    int8 HuBERT, from a cached quantized state dict when valid
+
+    The cache sits next to the checkpoint (or in cache_dir) and is keyed on
+    the checkpoint's size and modification time, the torch version and the
+    quantized kernel backend; the key is checked before anything is
+    built, so a hit never loads the fp32 weights or quantizes. The cache
+    is loaded with weights_only, as it may be shared between users.
+    """
+    hubert_path = Path(hubert_path)
+    if not hubert_path.exists():
+        raise UnsupportedCheckpoint(f"HuBERT content encoder not found at {hubert_path} "
+                                    "(RVC models need hubert_base.pt)")
+    cache_path = Path(cache_dir or hubert_path.parent) / f"{hubert_path.stem}.int8.pt"
+    stat = hubert_path.stat()
+    key = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "torch": str(torch.__version__),
+        "engine": torch.backends.quantized.engine
+    }
+
+    if cache_path.exists():
+        try:
+            cached = torch.load(cache_path, map_location='cpu', weights_only=True)
+            if cached.get("key") == key:
+                model = quantized_skeleton(cached["config"])
+                model.load_state_dict(cached["weight"], assign=True)
+                log.info("Loaded int8 HuBERT from %s", cache_path)
+                return model.eval()
+        except Exception as e:
+            log.warning("Ignoring unreadable int8 cache %s: %s", cache_path, e)
+
+    hubert = load_hubert(hubert_path)
+    quantized = quantize(hubert)
+    temp_path = None
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=f"{hubert_path.stem}.int8-",
+                                         suffix='.tmp')
+        os.close(fd)
+        torch.save({"key": key, "config": hubert.config, "weight": quantized.state_dict()}, temp_path)
+        os.replace(temp_path, cache_path)
+        temp_path = None
+        log.info("Cached int8 HuBERT at %s", cache_path)
+    except (OSError, RuntimeError) as e:
+        log.warning("Could not cache int8 HuBERT: %s", e)
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+    return quantized
+
+
+class RVCConverter:
+    def __init__(self, model_path, index_path, hubert_path=None, transpose=0.0, index_rate=0.75,
+                 protect=0.33, k=8, seed=0, threads=None, interop_threads=None,
+                 quantized=False, quantized_cache_dir=None):
+        """
+        Load the RVC model, HuBERT and the feature index once
+
+        Args:
+            model_path: RVC v1/v2 inference checkpoint (.pth)
+            index_path: faiss .index from RVC training (needs faiss), or an
+                .npy feature bank; without either, retrieval is skipped
+            hubert_path: fairseq hubert_base.pt (default: next to the model)
+            transpose: Semitones the converted pitch is shifted by
+            index_rate: Share of the retrieved features in the blend
+            protect: Feature blend kept for unvoiced frames, protecting
+                consonants from the index (0.5 disables protection)
+            k: Index rows retrieved per frame
+            seed: Seed of the prior and excitation noise, so a buffer
+                always converts to the same output
+            threads: Intra-op thread count for this process (None keeps torch's default)
+            interop_threads: Inter-op thread count for this process
+            quantized: Run HuBERT on a dynamic int8 copy, and the decoder's
+                upsampling and residual blocks in bfloat16 where the CPU has
+                native kernels for it
+            quantized_cache_dir: Where the int8 copy is cached (default: next to HuBERT)
+        """
+        configure_threads(threads, interop_threads)
+        with torch.inference_mode():
+            self.net = build_synthesizer(load_checkpoint(model_path))
+        self.target_sr = self.net.sr
+        self.feature_dims = self.net.enc_p.emb_phone.in_features
+        # v1 models take layer 9 projected to 256 dims, v2 the last layer's 768
+        self.version = 'v1' if self.feature_dims == 256 else 'v2'
+
+        hubert_path = Path(hubert_path) if hubert_path else Path(model_path).parent / 'hubert_base.pt'
+        self.quantized = quantized
+        self.hubert = load_quantized(hubert_path, quantized_cache_dir) if quantized else load_hubert(hubert_path)
+        self.bf16 = quantized and bf16_supported()
+        if self.bf16:
+            bfloat16_decoder(self.net)
+        elif quantized:
+            log.info("No native bfloat16 on this CPU; the decoder stays in float32")
+        self.output_layer = min(9 if self.version == 'v1' else 12, len(self.hubert.encoder.layers))
+
+        self.index = load_index(index_path)
+        if self.index is not None and self.index.dims != self.feature_dims:
+            raise UnsupportedCheckpoint(
+                f"Index has {self.index.dims}-dim features but the model expects {self.feature_dims}")
+        self.transpose = transpose
+        self.index_rate = index_rate
+        self.protect = protect
+        self.k = k
+        self.seed = seed
+
+        from scipy.signal import butter
+        # RVC removes rumble below 48 Hz before extracting features
+        self._highpass = butter(5, 48, btype='high', fs=CONTENT_SR, output='sos')
+
+    def content_features(self, audio):
+        """(frames, feature_dims) HuBERT features of 16 kHz audio at 50 frames/s."""
+        with torch.inference_mode():
+            features = self.hubert.extract_features(torch.from_numpy(audio).unsqueeze(0), self.output_layer,
+                                                    project=self.version == 'v1')
+        return features[0].numpy()
+
+    def convert_segment(self, audio, generator=None):
+        """
+        Convert one 16 kHz segment (context included) to target_sr
+
+        Returns len(audio) // FRAME frames of output, or one or two fewer
+        when HuBERT's receptive field does not cover the last of them.
+        """
+        from scipy.signal import sosfiltfilt
+
+        audio = sosfiltfilt(self._highpass, audio).astype(np.float32)
+        original = self.content_features(audio)
+        features = original
+        if self.index is not None and self.index_rate:
+            retrieved = self.index.search(original, k=self.k)
+            features = self.index_rate * retrieved + (1.0 - self.index_rate) * original
+        # F0 frames are 10 ms, HuBERT frames 20 ms
+        frames = min(len(audio) // FRAME, 2 * len(features))
+        features = np.repeat(features, 2, axis=0)[:frames]
+
+        pitch = pitchf = None
+        if self.net.f0:
+            f0 = estimate_f0(audio, frames) * 2.0 ** (self.transpose / 12.0)
+            if self.protect < 0.5:
+                weight = np.where(f0 > 0, 1.0, self.protect)[:, np.newaxis]
+                features = features * weight + np.repeat(original, 2, axis=0)[:frames] * (1.0 - weight)
+            pitch = torch.from_numpy(coarse_pitch(f0)).unsqueeze(0)
+            pitchf = torch.from_numpy(f0).unsqueeze(0)
+        with torch.inference_mode():
+            output = self.net.infer(torch.from_numpy(np.ascontiguousarray(features, dtype=np.float32)).unsqueeze(0),
+                                    pitch, pitchf, generator=generator)
+        return output.numpy()
+
+    def stream(self, sr):
+        """Block-by-block conversion stage with process()/flush()."""
+        return StreamingConverter(self, sr)
+
+    def convert(self, audio, sr):
+        """Convert a whole buffer (the same code path as streaming, in one block)."""
+        stream = self.stream(sr)
+        return np.concatenate([stream.process(audio), stream.flush()])
+
+
+class StreamingConverter:
+    def __init__(self, converter, sr):
+        """
+        Segmented conversion with bounded state
+
+        Input is resampled to 16 kHz as it arrives; once a segment and its
+        right context are buffered, the segment is cut at its quietest frame
+        and converted with the context on both sides, and the output is
+        resampled back to sr. Cuts depend only on the audio, so the result
+        does not depend on block size; flush() converts the rest and pads or
+        trims the output to the input length.
+        """
+        import soxr
+
+        self.converter = converter
+        self.sr = sr
+        self.context = int(CONTEXT_SECONDS * CONTENT_SR) // FRAME * FRAME
+        self.segment = int(SEGMENT_SECONDS * CONTENT_SR) // FRAME * FRAME
+        self.search = int(SEGMENT_SEARCH_SECONDS * CONTENT_SR) // FRAME * FRAME
+        self.bucket = int(SHAPE_BUCKET_SECONDS * CONTENT_SR) // FRAME * FRAME
+        self.upp = converter.net.hop_length
+        self._to_content = soxr.ResampleStream(sr, CONTENT_SR, 1, dtype='float32') if sr != CONTENT_SR else None
+        self._to_output = (soxr.ResampleStream(converter.target_sr, sr, 1, dtype='float32')
+                           if converter.target_sr != sr else None)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._left = None
+        self._segments = 0
+        self._consumed = 0
+        self._emitted = 0
+
+    def _convert(self, segment, right):
+        left = self._left
+        if left is None:
+            # The start of the audio gets a mirrored context, as RVC pads it
+            left = np.pad(segment, (self.context, 0), mode='reflect' if len(segment) > 1 else 'edge')[:self.context]
+        if len(right) < self.context:
+            right = np.pad(np.concatenate([segment, right]), (0, self.context - len(right)),
+                           mode='reflect' if len(segment) + len(right) > 1 else 'edge')[-self.context:]
+        generator = torch.Generator().manual_seed(self.converter.seed + self._segments)
+        self._segments += 1
+        padded = np.concatenate([left, segment, right])
+        # The extra right context is trimmed with the rest of it
+        padded = np.pad(padded, (0, -len(padded) % self.bucket), mode='reflect')
+        output = self.converter.convert_segment(padded, generator)
+        start = self.context // FRAME * self.upp
+        keep = -(-len(segment) // FRAME) * self.upp
+        history = np.concatenate([left, segment])
+        self._left = history[len(history) - self.context:]
+        return output[start:start + keep]
+
+    def _emit(self, out, last=False):
+        if self._to_output:
+            out = self._to_output.resample_chunk(out, last=last)
+        out = out[:max(0, self._consumed - self._emitted)]
+        self._emitted += len(out)
+        return out
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        self._consumed += len(block)
+        if self._to_content:
+            block = self._to_content.resample_chunk(block)
+        self._pending = np.concatenate([self._pending, block])
+
+        outputs = []
+        while len(self._pending) >= self.segment + self.search + self.context:
+            region = self._pending[self.segment - self.search:self.segment + self.search]
+            quietest = np.argmin(np.abs(region).reshape(-1, FRAME).sum(axis=1))
+            cut = self.segment - self.search + quietest * FRAME
+            outputs.append(self._convert(self._pending[:cut], self._pending[cut:cut + self.context]))
+            self._pending = self._pending[cut:]
+        return self._emit(np.concatenate(outputs) if outputs else np.zeros(0, dtype=np.float32))
+
+    def flush(self):
+        if self._to_content:
+            self._pending = np.concatenate([self._pending,
+                                            self._to_content.resample_chunk(np.zeros(0, dtype=np.float32), last=True)])
+        tail = np.zeros(0, dtype=np.float32)
+        if len(self._pending):
+            tail = self._convert(self._pending, np.zeros(0, dtype=np.float32))
+        self._pending = np.zeros(0, dtype=np.float32)
+        out = self._emit(tail, last=True)
+        missing = self._consumed - self._emitted
+        self._emitted += missing
+        return np.concatenate([out, np.zeros(missing, dtype=np.float32)])
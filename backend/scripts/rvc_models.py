@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Inference-only networks for RVC voice conversion
+The HuBERT content encoder and the RVC v1/v2 synthesizers (text encoder,
+coupling flow and NSF-HiFiGAN decoder), with the module names RVC's
+checkpoints use, so their state dicts load directly once weight norm is
+folded into plain weights (see fold_weight_norm)
+"""
+
+import math
+
+import numpy as np
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+LRELU_SLOPE = 0.1
+
+# Conv feature extractor of HuBERT base: (kernel, stride) per layer, 320x downsampling
+HUBERT_CONV_LAYERS = [(10, 5)] + [(3, 2)] * 4 + [(2, 2)] * 2
+
+
+def fold_weight_norm(state):
+    """
+    State dict with weight-normalized parameters replaced by plain weights
+
+    RVC and fairseq save weight norm as weight_g/weight_v (older torch) or
+    parametrizations.weight.original0/original1 (newer); g holds a norm per
+    slice of v along the normalized dimension, so the norm is taken over
+    every dimension where g has size 1.
+    """
+    folded = {}
+    pairs = {}
+    for name, value in state.items():
+        for g_suffix, v_suffix in (('.weight_g', '.weight_v'),
+                                   ('.parametrizations.weight.original0', '.parametrizations.weight.original1')):
+            if name.endswith(g_suffix) or name.endswith(v_suffix):
+                suffix = g_suffix if name.endswith(g_suffix) else v_suffix
+                prefix = name[:-len(suffix)]
+                pairs.setdefault(prefix, {})['g' if suffix == g_suffix else 'v'] = value
+                break
+        else:
+            folded[name] = value
+    for prefix, pair in pairs.items():
+        g, v = pair['g'].float(), pair['v'].float()
+        dims = [dim for dim in range(v.dim()) if g.shape[dim] == 1]
+        folded[f"{prefix}.weight"] = v * (g / v.norm(dim=dims, keepdim=True))
+    return folded
+
+
+class _SamePad(nn.Module):
+    def forward(self, x):
+        # An even positional kernel yields one frame too many
+        return x[:, :, :-1]
+
+
+class _HubertLayer(nn.Module):
+    def __init__(self, dims, ffn_dims, heads):
+        super().__init__()
+        self.heads = heads
+        self.self_attn = nn.Module()
+        for name in ('k_proj', 'v_proj', 'q_proj', 'out_proj'):
+            setattr(self.self_attn, name, nn.Linear(dims, dims))
+        self.self_attn_layer_norm = nn.LayerNorm(dims)
+        self.fc1 = nn.Linear(dims, ffn_dims)
+        self.fc2 = nn.Linear(ffn_dims, dims)
+        self.final_layer_norm = nn.LayerNorm(dims)
+
+    def forward(self, x):
+        batch, frames, dims = x.shape
+        attn = self.self_attn
+
+        def split(projected):
+            return projected.view(batch, frames, self.heads, dims // self.heads).transpose(1, 2)
+
+        context = F.scaled_dot_product_attention(split(attn.q_proj(x)), split(attn.k_proj(x)),
+                                                 split(attn.v_proj(x)))
+        x = self.self_attn_layer_norm(x + attn.out_proj(context.transpose(1, 2).reshape(batch, frames, dims)))
+        return self.final_layer_norm(x + self.fc2(F.gelu(self.fc1(x))))
+
+
+class HubertModel(nn.Module):
+    def __init__(self, conv_channels=512, dims=768, ffn_dims=3072, layers=12, heads=12,
+                 pos_kernel=128, pos_groups=16, final_dims=256):
+        """HuBERT base as fairseq builds it (post-norm transformer), without the training heads."""
+        super().__init__()
+        # Plain constructor arguments, so a model can be rebuilt without its weights
+        self.config = dict(conv_channels=conv_channels, dims=dims, ffn_dims=ffn_dims, layers=layers,
+                           heads=heads, pos_kernel=pos_kernel, pos_groups=pos_groups, final_dims=final_dims)
+        self.feature_extractor = nn.Module()
+        conv_layers = []
+        channels = 1
+        for index, (kernel, stride) in enumerate(HUBERT_CONV_LAYERS):
+            block = [nn.Conv1d(channels, conv_channels, kernel, stride, bias=False), nn.Dropout(0.0)]
+            if index == 0:
+                block.append(nn.GroupNorm(conv_channels, conv_channels))
+            block.append(nn.GELU())
+            conv_layers.append(nn.Sequential(*block))
+            channels = conv_channels
+        self.feature_extractor.conv_layers = nn.ModuleList(conv_layers)
+        self.layer_norm = nn.LayerNorm(conv_channels)
+        self.post_extract_proj = nn.Linear(conv_channels, dims)
+        self.encoder = nn.Module()
+        self.encoder.pos_conv = nn.Sequential(
+            nn.Conv1d(dims, dims, pos_kernel, padding=pos_kernel // 2, groups=pos_groups),
+            _SamePad(),
+            nn.GELU()
+        )
+        self.encoder.layer_norm = nn.LayerNorm(dims)
+        self.encoder.layers = nn.ModuleList(_HubertLayer(dims, ffn_dims, heads) for _ in range(layers))
+        self.final_proj = nn.Linear(dims, final_dims)
+
+    @classmethod
+    def from_state_dict(cls, state):
+        """Build a model sized to a (weight-norm folded) fairseq HuBERT state dict."""
+        layers = 1 + max(int(name.split('.')[2]) for name in state if name.startswith('encoder.layers.'))
+        pos = state['encoder.pos_conv.0.weight']
+        dims = state['post_extract_proj.weight'].shape[0]
+        return cls(conv_channels=state['post_extract_proj.weight'].shape[1],
+                   dims=dims,
+                   ffn_dims=state['encoder.layers.0.fc1.weight'].shape[0],
+                   layers=layers,
+                   # fairseq's HuBERT base and large both use 64-dim heads
+                   heads=max(1, dims // 64),
+                   pos_kernel=pos.shape[2],
+                   pos_groups=dims // pos.shape[1],
+                   final_dims=state['final_proj.weight'].shape[0])
+
+    def extract_features(self, audio, output_layer, project=False):
+        """
+        Content features of 16 kHz mono audio, one row per 20 ms
+
+        Args:
+            audio: (batch, samples) float tensor
+            output_layer: Transformer layers to run (9 for RVC v1, 12 for v2)
+            project: Apply final_proj (RVC v1 models take 256-dim features)
+        """
+        x = audio.unsqueeze(1)
+        for block in self.feature_extractor.conv_layers:
+            x = block(x)
+        x = self.post_extract_proj(self.layer_norm(x.transpose(1, 2)))
+        x = x + self.encoder.pos_conv(x.transpose(1, 2)).transpose(1, 2)
+        x = self.encoder.layer_norm(x)
+        for layer in self.encoder.layers[:output_layer]:
+            x = layer(x)
+        return self.final_proj(x) if project else x
+
+
+class LayerNorm(nn.Module):
+    def __init__(self, channels, eps=1e-5):
+        """Layer norm over the channel axis of (batch, channels, frames)."""
+        super().__init__()
+        self.channels = channels
+        self.eps = eps
+        self.gamma = nn.Parameter(torch.ones(channels))
+        self.beta = nn.Parameter(torch.zeros(channels))
+
+    def forward(self, x):
+        x = F.layer_norm(x.transpose(1, -1), (self.channels,), self.gamma, self.beta, self.eps)
+        return x.transpose(1, -1)
+
+
+class MultiHeadAttention(nn.Module):
+    def __init__(self, channels, out_channels, n_heads, window_size=10):
+        """Self-attention with windowed relative position embeddings shared by all heads."""
+        super().__init__()
+        self.n_heads = n_heads
+        self.window_size = window_size
+        self.k_channels = channels // n_heads
+        self.conv_q = nn.Conv1d(channels, channels, 1)
+        self.conv_k = nn.Conv1d(channels, channels, 1)
+        self.conv_v = nn.Conv1d(channels, channels, 1)
+        self.conv_o = nn.Conv1d(channels, out_channels, 1)
+        stddev = self.k_channels ** -0.5
+        self.emb_rel_k = nn.Parameter(torch.randn(1, window_size * 2 + 1, self.k_channels) * stddev)
+        self.emb_rel_v = nn.Parameter(torch.randn(1, window_size * 2 + 1, self.k_channels) * stddev)
+
+    def _relative_embeddings(self, embeddings, length):
+        pad = max(length - (self.window_size + 1), 0)
+        start = max((self.window_size + 1) - length, 0)
+        if pad:
+            embeddings = F.pad(embeddings, [0, 0, pad, pad, 0, 0])
+        return embeddings[:, start:start + 2 * length - 1]
+
+    @staticmethod
+    def _relative_to_absolute(x):
+        batch, heads, length, _ = x.size()
+        x = F.pad(x, [0, 1])
+        x = F.pad(x.reshape(batch, heads, length * 2 * length), [0, length - 1])
+        return x.view(batch, heads, length + 1, 2 * length - 1)[:, :, :length, length - 1:]
+
+    @staticmethod
+    def _absolute_to_relative(x):
+        batch, heads, length, _ = x.size()
+        x = F.pad(x, [0, length - 1])
+        x = F.pad(x.reshape(batch, heads, length ** 2 + length * (length - 1)), [length, 0])
+        return x.view(batch, heads, length, 2 * length)[:, :, :, 1:]
+
+    def forward(self, x, attn_mask):
+        batch, channels, length = x.size()
+
+        def heads(projected):
+            return projected.view(batch, self.n_heads, self.k_channels, length).transpose(2, 3)
+
+        query = heads(self.conv_q(x)) / math.sqrt(self.k_channels)
+        key, value = heads(self.conv_k(x)), heads(self.conv_v(x))
+        scores = query @ key.transpose(-2, -1)
+        relative_keys = self._relative_embeddings(self.emb_rel_k, length)
+        scores = scores + self._relative_to_absolute(query @ relative_keys.unsqueeze(0).transpose(-2, -1))
+        weights = F.softmax(scores.masked_fill(attn_mask == 0, -1e4), dim=-1)
+        output = weights @ value
+        relative_values = self._relative_embeddings(self.emb_rel_v, length)
+        output = output + self._absolute_to_relative(weights) @ relative_values.unsqueeze(0)
+        return self.conv_o(output.transpose(2, 3).reshape(batch, channels, length))
+
+
+class FFN(nn.Module):
+    def __init__(self, channels, filter_channels, kernel_size):
+        super().__init__()
+        self.kernel_size = kernel_size
+        self.conv_1 = nn.Conv1d(channels, filter_channels, kernel_size)
+        self.conv_2 = nn.Conv1d(filter_channels, channels, kernel_size)
+
+    def _pad(self, x):
+        return F.pad(x, [(self.kernel_size - 1) // 2, self.kernel_size // 2])
+
+    def forward(self, x, x_mask):
+        x = torch.relu(self.conv_1(self._pad(x * x_mask)))
+        return self.conv_2(self._pad(x * x_mask)) * x_mask
+
+
+class Encoder(nn.Module):
+    def __init__(self, hidden_channels, filter_channels, n_heads, n_layers, kernel_size):
+        super().__init__()
+        self.attn_layers = nn.ModuleList(MultiHeadAttention(hidden_channels, hidden_channels, n_heads)
+                                         for _ in range(n_layers))
+        self.norm_layers_1 = nn.ModuleList(LayerNorm(hidden_channels) for _ in range(n_layers))
+        self.ffn_layers = nn.ModuleList(FFN(hidden_channels, filter_channels, kernel_size)
+                                        for _ in range(n_layers))
+        self.norm_layers_2 = nn.ModuleList(LayerNorm(hidden_channels) for _ in range(n_layers))
+
+    def forward(self, x, x_mask):
+        attn_mask = x_mask.unsqueeze(2) * x_mask.unsqueeze(-1)
+        x = x * x_mask
+        for attn, norm_1, ffn, norm_2 in zip(self.attn_layers, self.norm_layers_1,
+                                             self.ffn_layers, self.norm_layers_2):
+            x = norm_1(x + attn(x, attn_mask))
+            x = norm_2(x + ffn(x, x_mask))
+        return x * x_mask
+
+
+class TextEncoder(nn.Module):
+    def __init__(self, feature_dims, out_channels, hidden_channels, filter_channels, n_heads, n_layers,
+                 kernel_size, f0=True):
+        """Prior encoder over content features (256-dim for v1, 768-dim for v2) and coarse pitch."""
+        super().__init__()
+        self.out_channels = out_channels
+        self.hidden_channels = hidden_channels
+        self.emb_phone = nn.Linear(feature_dims, hidden_channels)
+        if f0:
+            self.emb_pitch = nn.Embedding(256, hidden_channels)
+        self.encoder = Encoder(hidden_channels, filter_channels, n_heads, n_layers, kernel_size)
+        self.proj = nn.Conv1d(hidden_channels, out_channels * 2, 1)
+
+    def forward(self, phone, pitch, x_mask):
+        x = self.emb_phone(phone)
+        if pitch is not None:
+            x = x + self.emb_pitch(pitch)
+        x = F.leaky_relu(x * math.sqrt(self.hidden_channels), LRELU_SLOPE).transpose(1, -1)
+        stats = self.proj(self.encoder(x * x_mask, x_mask)) * x_mask
+        return torch.split(stats, self.out_channels, dim=1)
+
+
+class WN(nn.Module):
+    def __init__(self, hidden_channels, kernel_size, dilation_rate, n_layers, gin_channels):
+        """Gated dilated convolution stack (WaveNet-style) conditioned on the speaker."""
+        super().__init__()
+        self.hidden_channels = hidden_channels
+        self.cond_layer = nn.Conv1d(gin_channels, 2 * hidden_channels * n_layers, 1)
+        self.in_layers = nn.ModuleList()
+        self.res_skip_layers = nn.ModuleList()
+        for i in range(n_layers):
+            dilation = dilation_rate ** i
+            self.in_layers.append(nn.Conv1d(hidden_channels, 2 * hidden_channels, kernel_size,
+                                            dilation=dilation, padding=(kernel_size * dilation - dilation) // 2))
+            res_skip_channels = 2 * hidden_channels if i < n_layers - 1 else hidden_channels
+            self.res_skip_layers.append(nn.Conv1d(hidden_channels, res_skip_channels, 1))
+
+    def forward(self, x, x_mask, g):
+        hidden = self.hidden_channels
+        output = torch.zeros_like(x)
+        g = self.cond_layer(g)
+        for i, (in_layer, res_skip_layer) in enumerate(zip(self.in_layers, self.res_skip_layers)):
+            x_in = in_layer(x) + g[:, i * 2 * hidden:(i + 1) * 2 * hidden]
+            acts = torch.tanh(x_in[:, :hidden]) * torch.sigmoid(x_in[:, hidden:])
+            res_skip = res_skip_layer(acts)
+            if i < len(self.in_layers) - 1:
+                x = (x + res_skip[:, :hidden]) * x_mask
+                output = output + res_skip[:, hidden:]
+            else:
+                output = output + res_skip
+        return output * x_mask
+
+
+class ResidualCouplingLayer(nn.Module):
+    def __init__(self, channels, hidden_channels, kernel_size, dilation_rate, n_layers, gin_channels):
+        super().__init__()
+        self.half_channels = channels // 2
+        self.pre = nn.Conv1d(self.half_channels, hidden_channels, 1)
+        self.enc = WN(hidden_channels, kernel_size, dilation_rate, n_layers, gin_channels)
+        # Mean-only coupling
+        self.post = nn.Conv1d(hidden_channels, self.half_channels, 1)
+
+    def reverse(self, x, x_mask, g):
+        x0, x1 = torch.split(x, [self.half_channels] * 2, 1)
+        mean = self.post(self.enc(self.pre(x0) * x_mask, x_mask, g)) * x_mask
+        return torch.cat([x0, (x1 - mean) * x_mask], 1)
+
+
+class ResidualCouplingBlock(nn.Module):
+    def __init__(self, channels, hidden_channels, gin_channels, n_flows=4):
+        super().__init__()
+        # Flips sit between the couplings, at the odd indexes
+        self.flows = nn.ModuleList()
+        for _ in range(n_flows):
+            self.flows.append(ResidualCouplingLayer(channels, hidden_channels, 5, 1, 3, gin_channels))
+            self.flows.append(nn.Identity())
+
+    def reverse(self, x, x_mask, g):
+        for flow in reversed(self.flows):
+            x = torch.flip(x, [1]) if isinstance(flow, nn.Identity) else flow.reverse(x, x_mask, g)
+        return x
+
+
+def _padding(kernel_size, dilation=1):
+    return (kernel_size * dilation - dilation) // 2
+
+
+class ResBlock1(nn.Module):
+    def __init__(self, channels, kernel_size=3, dilation=(1, 3, 5)):
+        super().__init__()
+        self.convs1 = nn.ModuleList(nn.Conv1d(channels, channels, kernel_size, dilation=d,
+                                              padding=_padding(kernel_size, d)) for d in dilation)
+        self.convs2 = nn.ModuleList(nn.Conv1d(channels, channels, kernel_size, padding=_padding(kernel_size))
+                                    for _ in dilation)
+
+    def forward(self, x):
+        for conv1, conv2 in zip(self.convs1, self.convs2):
+            x = x + conv2(F.leaky_relu(conv1(F.leaky_relu(x, LRELU_SLOPE)), LRELU_SLOPE))
+        return x
+
+
+class ResBlock2(nn.Module):
+    def __init__(self, channels, kernel_size=3, dilation=(1, 3)):
+        super().__init__()
+        self.convs = nn.ModuleList(nn.Conv1d(channels, channels, kernel_size, dilation=d,
+                                             padding=_padding(kernel_size, d)) for d in dilation)
+
+    def forward(self, x):
+        for conv in self.convs:
+            x = x + conv(F.leaky_relu(x, LRELU_SLOPE))
+        return x
+
+
+class SourceModuleHnNSF(nn.Module):
+    def __init__(self, sampling_rate, harmonic_num=0, sine_amp=0.1, noise_std=0.003):
+        """Harmonic-plus-noise excitation from frame-rate F0 (the NSF source module)."""
+        super().__init__()
+        self.sampling_rate = sampling_rate
+        self.harmonic_num = harmonic_num
+        self.sine_amp = sine_amp
+        self.noise_std = noise_std
+        self.l_linear = nn.Linear(harmonic_num + 1, 1)
+
+    def forward(self, f0, upp, generator=None):
+        f0 = torch.repeat_interleave(f0, upp, dim=1).unsqueeze(-1)
+        harmonics = f0 * torch.arange(1, self.harmonic_num + 2, dtype=f0.dtype)
+        initial = torch.rand(f0.shape[0], 1, harmonics.shape[2], generator=generator)
+        initial[:, :, 0] = 0
+        # Phase accumulated in float64 so long utterances do not drift
+        phase = torch.cumsum(harmonics.double() / self.sampling_rate, dim=1) + initial.double()
+        sines = torch.sin(2 * np.pi * (phase % 1.0)).float() * self.sine_amp
+        voiced = (f0 > 0).float()
+        noise_amp = voiced * self.noise_std + (1 - voiced) * self.sine_amp / 3
+        noise = torch.randn(sines.shape, generator=generator) * noise_amp
+        return torch.tanh(self.l_linear(sines * voiced + noise)).transpose(1, 2)
+
+
+class Generator(nn.Module):
+    def __init__(self, initial_channel, resblock, resblock_kernel_sizes, resblock_dilation_sizes,
+                 upsample_rates, upsample_initial_channel, upsample_kernel_sizes, gin_channels,
+                 sr=None, conv_post_bias=False):
+        """HiFiGAN decoder; with sr it is the NSF variant driven by an F0 excitation."""
+        super().__init__()
+        self.num_kernels = len(resblock_kernel_sizes)
+        self.upp = int(np.prod(upsample_rates))
+        self.conv_pre = nn.Conv1d(initial_channel, upsample_initial_channel, 7, padding=3)
+        block = ResBlock1 if str(resblock) == '1' else ResBlock2
+        if sr is not None:
+            self.m_source = SourceModuleHnNSF(sr)
+            self.noise_convs = nn.ModuleList()
+
+        self.ups = nn.ModuleList()
+        self.resblocks = nn.ModuleList()
+        for i, (rate, kernel) in enumerate(zip(upsample_rates, upsample_kernel_sizes)):
+            channels = upsample_initial_channel // 2 ** (i + 1)
+            self.ups.append(nn.ConvTranspose1d(upsample_initial_channel // 2 ** i, channels, kernel, rate,
+                                               padding=(kernel - rate) // 2))
+            if sr is not None:
+                if i + 1 < len(upsample_rates):
+                    stride = int(np.prod(upsample_rates[i + 1:]))
+                    self.noise_convs.append(nn.Conv1d(1, channels, stride * 2, stride, padding=stride // 2))
+                else:
+                    self.noise_convs.append(nn.Conv1d(1, channels, 1))
+            for kernel_size, dilation in zip(resblock_kernel_sizes, resblock_dilation_sizes):
+                self.resblocks.append(block(channels, kernel_size, dilation))
+        self.conv_post = nn.Conv1d(channels, 1, 7, padding=3, bias=conv_post_bias)
+        self.cond = nn.Conv1d(gin_channels, upsample_initial_channel, 1)
+
+    def forward(self, x, g, f0=None, generator=None):
+        source = self.m_source(f0, self.upp, generator) if f0 is not None else None
+        x = self.conv_pre(x) + self.cond(g)
+        for i, up in enumerate(self.ups):
+            x = up(F.leaky_relu(x, LRELU_SLOPE))
+            if source is not None:
+                x = x + self.noise_convs[i](source)
+            blocks = self.resblocks[i * self.num_kernels:(i + 1) * self.num_kernels]
+            x = sum(block(x) for block in blocks) / self.num_kernels
+        return torch.tanh(self.conv_post(F.leaky_relu(x)))
+
+
+class Synthesizer(nn.Module):
+    def __init__(self, spec_channels, segment_size, inter_channels, hidden_channels, filter_channels,
+                 n_heads, n_layers, kernel_size, p_dropout, resblock, resblock_kernel_sizes,
+                 resblock_dilation_sizes, upsample_rates, upsample_initial_channel, upsample_kernel_sizes,
+                 spk_embed_dim, gin_channels, sr, feature_dims=768, f0=True, conv_post_bias=False):
+        """
+        RVC synthesizer in inference form (SynthesizerTrnMs256/768NSFsid and _nono)
+
+        The positional arguments are the "config" list RVC stores in its
+        checkpoints; spec_channels, segment_size and p_dropout only matter
+        for training.
+
+        Args:
+            feature_dims: Content feature width, 256 (v1) or 768 (v2)
+            f0: Pitch-conditioned model (NSF decoder) or not
+        """
+        super().__init__()
+        self.f0 = f0
+        self.sr = sr
+        self.enc_p = TextEncoder(feature_dims, inter_channels, hidden_channels, filter_channels, n_heads,
+                                 n_layers, kernel_size, f0=f0)
+        self.dec = Generator(inter_channels, resblock, resblock_kernel_sizes, resblock_dilation_sizes,
+                             upsample_rates, upsample_initial_channel, upsample_kernel_sizes, gin_channels,
+                             sr=sr if f0 else None, conv_post_bias=conv_post_bias)
+        self.flow = ResidualCouplingBlock(inter_channels, hidden_channels, gin_channels)
+        self.emb_g = nn.Embedding(spk_embed_dim, gin_channels)
+
+    @property
+    def hop_length(self):
+        """Output samples per 10 ms feature frame."""
+        return self.dec.upp
+
+    def infer(self, phone, pitch=None, pitchf=None, sid=0, generator=None, noise_scale=0.66666):
+        """
+        Waveform for (1, frames, feature_dims) content features at 100 frames/s
+
+        Args:
+            pitch: (1, frames) coarse pitch bins, for f0 models
+            pitchf: (1, frames) F0 in Hz (0 when unvoiced), for f0 models
+            generator: torch.Generator for the prior and excitation noise
+        """
+        g = self.emb_g(torch.tensor([sid])).unsqueeze(-1)
+        x_mask = torch.ones(1, 1, phone.shape[1])
+        mean, log_scale = self.enc_p(phone, pitch if self.f0 else None, x_mask)
+        noise = torch.randn(mean.shape, generator=generator)
+        z = self.flow.reverse((mean + torch.exp(log_scale) * noise * noise_scale) * x_mask, x_mask, g)
+        return self.dec(z * x_mask, g, pitchf if self.f0 else None, generator)[0, 0]
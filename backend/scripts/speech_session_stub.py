@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for a SAPI speech session
+Speaks the tts_speech JSON-line protocol on stdin/stdout like the PowerShell
+host, answering every utterance with a checked-in WAV after simulated start-up
+and synthesis delays, and can exit mid-session to exercise restarts
+"""
+
+import argparse
+import base64
+import json
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_AUDIO = Path(__file__).resolve().parent.parent / "test_backend.wav"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SAPI speech session stand-in')
+    parser.add_argument('--audio', default=str(DEFAULT_AUDIO), help='WAV returned for every utterance')
+    parser.add_argument('--startup', type=float, default=0.5,
+                        help='Seconds before the ready line, like loading System.Speech and picking a voice')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds per utterance')
+    parser.add_argument('--crash-after', type=int,
+                        help='Exit without replying on this utterance (1-based)')
+    args = parser.parse_args()
+
+    audio = base64.b64encode(Path(args.audio).read_bytes()).decode('ascii')
+    time.sleep(args.startup)
+    print(json.dumps({"ready": True, "voice": "Stub Female Voice"}), flush=True)
+
+    for count, line in enumerate(sys.stdin, 1):
+        if args.crash_after and count >= args.crash_after:
+            return 3
+        try:
+            request = json.loads(line)
+            if not request["text"].strip():
+                raise ValueError("Nothing to speak")
+            time.sleep(args.latency)
+            reply = {"ok": True, "audio": audio}
+        except (KeyError, ValueError) as e:
+            reply = {"ok": False, "error": str(e)}
+        print(json.dumps(reply), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+In-memory audio decoding for the TTS pipelines
+Decodes encoded base speech straight from bytes into float32 buffers and
+resamples only when the source rate differs from the one requested, so
+stages hand each other arrays instead of temp files
+"""
+
+import io
+import os
+import tempfile
+
+import numpy as np
+
+
+def resample(audio, orig_sr, target_sr):
+    """Resample to target_sr; a no-op when the rates already match (or target_sr is None)."""
+    if not target_sr or orig_sr == target_sr:
+        return audio, orig_sr
+    try:
+        import soxr
+        return soxr.resample(audio, orig_sr, target_sr).astype(np.float32), target_sr
+    except ImportError:
+        import librosa
+        return librosa.resample(audio, orig_sr=orig_sr, target_sr=target_sr), target_sr
+
+
+def decode_audio(data, target_sr=None):
+    """
+    Decode encoded audio bytes (WAV, MP3, OGG, ...) to a mono float32 buffer
+
+    Args:
+        data: Encoded audio bytes
+        target_sr: Output sample rate, or None to keep the source rate
+
+    Returns:
+        (audio, sample_rate)
+    """
+    import soundfile as sf
+
+    try:
+        audio, sr = sf.read(io.BytesIO(data), dtype='float32')
+    except RuntimeError:
+        # libsndfile builds without MP3 support cannot read Edge-TTS output;
+        # hand those to librosa's audioread backend, which needs a real file
+        audio, sr = _decode_via_file(data)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return resample(audio, sr, target_sr)
+
+
+def _decode_via_file(data):
+    import librosa
+
+    fd, temp_path = tempfile.mkstemp(suffix='.audio')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        audio, sr = librosa.load(temp_path, sr=None, mono=True)
+        return audio.astype(np.float32), sr
+    finally:
+        os.unlink(temp_path)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Batch synthesis over a JSONL manifest
+Each manifest line is a request ({"text", "output", optional "id", "pitch",
+"speed"}). Results are appended to a JSONL file as items finish, so a rerun
+skips items that already succeeded and only retries the rest
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger('march7th.batch')
+
+
+def add_batch_arguments(parser):
+    """Register the shared batch options on an engine's argument parser."""
+    parser.add_argument('--batch', help='JSONL manifest of requests to synthesize')
+    parser.add_argument('--results', help='Results JSONL (default: <manifest>.results.jsonl)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for the CPU-bound stage')
+
+
+def item_id(item):
+    return str(item.get('id') or item['output'])
+
+
+def load_manifest(path):
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get('text') or not item.get('output'):
+                raise ValueError(f"Manifest line {line_number} needs 'text' and 'output'")
+            items.append(item)
+    return items
+
+
+def load_completed(results_path):
+    """Ids whose latest record succeeded and whose output is still on disk."""
+    latest = {}
+    if os.path.exists(results_path):
+        with open(results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write can leave a torn last line
+                    continue
+                latest[record['id']] = record
+    return {
+        record_id for record_id, record in latest.items()
+        if record['status'] == 'ok' and os.path.exists(record['output'])
+    }
+
+
+async def run_batch(manifest_path, process_item, results_path=None, max_pending=32):
+    """
+    Run process_item over every pending manifest item and log each result
+
+    Args:
+        manifest_path: JSONL manifest
+        process_item: Coroutine function item -> result dict (with "success")
+        results_path: JSONL results log, appended to across runs
+        max_pending: Items allowed in flight at once; the engine's own
+            fetch limit and process pool bound the individual stages
+
+    Returns:
+        Summary dict with counts and total wall time
+    """
+    results_path = results_path or f"{os.path.splitext(manifest_path)[0]}.results.jsonl"
+    items = load_manifest(manifest_path)
+    completed = load_completed(results_path)
+    pending = [item for item in items if item_id(item) not in completed]
+    log.info("Batch: %d items, %d already done, %d to run", len(items), len(items) - len(pending), len(pending))
+
+    counts = {'ok': 0, 'error': 0}
+    semaphore = asyncio.Semaphore(max_pending)
+    start_time = time.perf_counter()
+
+    with open(results_path, 'a', encoding='utf-8') as results:
+        async def run(item):
+            async with semaphore:
+                item_start = time.perf_counter()
+                try:
+                    result = await process_item(item)
+                except Exception as e:
+                    result = {"success": False, "error": str(e), "output_path": None}
+                status = 'ok' if result.get('success') else 'error'
+                counts[status] += 1
+                record = {
+                    "id": item_id(item),
+                    "output": item['output'],
+                    "status": status,
+                    "elapsed": round(time.perf_counter() - item_start, 3),
+                    "result": result
+                }
+                results.write(json.dumps(record, ensure_ascii=False) + "\n")
+                results.flush()
+
+        await asyncio.gather(*(run(item) for item in pending))
+
+    return {
+        "success": counts['error'] == 0,
+        "results_path": results_path,
+        "total": len(items),
+        "skipped": len(items) - len(pending),
+        "succeeded": counts['ok'],
+        "failed": counts['error'],
+        "elapsed": round(time.perf_counter() - start_time, 3)
+    }
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Latency-budget scheduling for the TTS pipelines
+Keeps running per-stage cost estimates, picks the best pipeline tier that
+is predicted to finish inside a request's budget, aborts stages projected
+to overrun it and degrades to the next tier instead of failing. Cancelled
+requests stop at the next stage or block
+"""
+
+import contextlib
+import logging
+import math
+import threading
+import time
+
+from tts_profiling import StageTimer
+
+log = logging.getLogger('march7th.budget')
+
+# Pipeline tiers from best to cheapest. "cached" is served before any
+# planning when the cache holds the full render; "base_only" is the floor
+# and always runs to completion
+TIERS = ('full', 'reduced', 'cached', 'base_only')
+
+# Starting cost of each stage in seconds per second of audio, replaced by
+# measurements as requests complete (warm, single core). Encoding is keyed
+# by codec since Opus costs two orders of magnitude more than WAV
+DEFAULT_STAGE_COSTS = {
+    'rvc_inference': 0.006,
+    'pitch_shift_eq': 0.012,
+    'tremolo_echo': 0.001,
+    'normalize': 0.0002,
+    'block_effects': 0.015,
+    'encode_wav': 0.0005,
+    'encode_flac': 0.001,
+    'encode_opus': 0.06,
+    'encode_mp3': 0.015
+}
+
+
+def add_budget_arguments(parser):
+    """Register the shared latency budget options on an engine's argument parser."""
+    parser.add_argument('--budget-ms', type=float,
+                        help='Latency budget per request; cheaper tiers are used to meet it')
+
+
+class StageAborted(Exception):
+    def __init__(self, stage, predicted, remaining):
+        super().__init__(f"{stage} needs ~{predicted * 1000:.0f} ms, "
+                         f"{max(remaining, 0) * 1000:.0f} ms of budget left")
+        self.stage = stage
+
+
+class RequestCancelled(Exception):
+    def __init__(self, stage):
+        super().__init__(f"Request cancelled before {stage}")
+        self.stage = stage
+
+
+class LatencyScheduler:
+    def __init__(self, alpha=0.3, costs=None):
+        """
+        Per-stage latency model shared by the requests of one engine
+
+        Args:
+            alpha: Weight of the newest measurement in the moving averages
+            costs: Starting seconds-per-audio-second costs (default: DEFAULT_STAGE_COSTS)
+        """
+        self.alpha = alpha
+        self.costs = dict(DEFAULT_STAGE_COSTS if costs is None else costs)
+        self._warm = set()
+
+    def observe(self, stage, wall, audio_seconds):
+        if not audio_seconds:
+            return
+        if stage not in self._warm:
+            # The first run of a stage pays for imports and JIT compilation
+            self._warm.add(stage)
+            return
+        cost = wall / audio_seconds
+        previous = self.costs.get(stage)
+        self.costs[stage] = cost if previous is None else previous + self.alpha * (cost - previous)
+
+    def predict(self, stages, audio_seconds):
+        """Expected seconds for stages over audio_seconds of audio."""
+        return sum(self.costs.get(stage, 0.0) for stage in stages) * (audio_seconds or 0.0)
+
+    def run(self, plans, timer, audio_seconds, render, output_format='wav'):
+        """
+        Run the best tier that fits the remaining budget, degrading on abort or error
+
+        Every tier is followed by an "encode" stage, which is part of the
+        prediction but never aborted once the audio exists.
+
+        Args:
+            plans: [(tier, stages)] from best to cheapest; the last one is the
+                floor and runs without deadline checks
+            timer: BudgetTimer of the request
+            audio_seconds: Duration of the audio being processed
+            render: Callable taking a tier name and returning its output
+            output_format: Codec of the encode stage (see tts_output)
+
+        Returns:
+            (tier, output of render)
+        """
+        encode_key = timer.cost_keys['encode'] = f"encode_{output_format}"
+        plans = [(tier, list(stages) + [encode_key]) for tier, stages in plans]
+        timer.audio_seconds = audio_seconds
+        remaining = timer.remaining()
+        start = next((i for i, (_, stages) in enumerate(plans)
+                      if self.predict(stages, audio_seconds) <= remaining), len(plans) - 1)
+        timer.skipped.extend(tier for tier, _ in plans[:start])
+
+        for index in range(start, len(plans)):
+            tier, stages = plans[index]
+            floor = index == len(plans) - 1
+            timer.begin_tier(tier, stages, enforce=not floor,
+                             predicted=self.predict(stages, audio_seconds))
+            try:
+                output = render(tier)
+                timer.enforce = False
+                return tier, output
+            except StageAborted as e:
+                log.warning("Aborting %s pipeline: %s", tier, e)
+                timer.aborted.append({"tier": tier, "stage": e.stage})
+            except RequestCancelled:
+                # Nobody is waiting for a cheaper tier either
+                raise
+            except Exception as e:
+                if floor:
+                    raise
+                log.warning("%s pipeline failed, degrading: %s", tier, e)
+                timer.failed.append({"tier": tier, "error": str(e)})
+        # The floor either returns or raises
+        raise AssertionError("unreachable")
+
+
+class BudgetTimer(StageTimer):
+    def __init__(self, scheduler, budget_ms=None, cancel=None):
+        """
+        StageTimer that enforces a request deadline on the planned stages
+
+        Stages of the active tier are checked against their predicted cost
+        before they start and, for block-wise stages, as they progress; their
+        measured times feed back into the scheduler's estimates. Stages
+        outside the plan (cache lookup, base speech, decode) are only timed.
+        Every stage, and every block of a block-wise one, first checks the
+        cancel flag and raises RequestCancelled once it is set.
+
+        Args:
+            scheduler: LatencyScheduler holding the stage estimates
+            budget_ms: Deadline relative to construction, None for no deadline
+            cancel: Flag with is_set() (a threading.Event, or a
+                tts_pipeline.CancelFlag in a worker process), default a new Event
+        """
+        super().__init__()
+        self.scheduler = scheduler
+        self.cancel_flag = cancel if cancel is not None else threading.Event()
+        self.budget_ms = budget_ms
+        self.deadline = None if budget_ms is None else self._start_wall + budget_ms / 1000.0
+        self.audio_seconds = None
+        self.tier = None
+        self.predicted = None
+        self.active = frozenset()
+        self.enforce = False
+        self.skipped = []
+        self.aborted = []
+        self.failed = []
+        # Timer stage name -> estimate key, where they differ (encode_<codec>)
+        self.cost_keys = {}
+        self._stage_starts = {}
+
+    def remaining(self):
+        return math.inf if self.deadline is None else self.deadline - time.perf_counter()
+
+    def begin_tier(self, tier, stages, enforce=True, predicted=None):
+        self.tier = tier
+        self.active = frozenset(stages)
+        self.enforce = enforce and self.deadline is not None
+        self.predicted = predicted
+
+    def _check(self, stage, predicted):
+        remaining = self.remaining()
+        if predicted > remaining:
+            raise StageAborted(stage, predicted, remaining)
+
+    def cancel(self):
+        self.cancel_flag.set()
+
+    def check_cancelled(self, stage):
+        if self.cancel_flag.is_set():
+            raise RequestCancelled(stage)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.check_cancelled(name)
+        key = self.cost_keys.get(name, name)
+        planned = key in self.active
+        if planned and self.enforce:
+            self._check(name, self.scheduler.predict([key], self.audio_seconds))
+        start = self._stage_starts[name] = time.perf_counter()
+        with super().stage(name):
+            yield
+        if planned:
+            self.scheduler.observe(key, time.perf_counter() - start, self.audio_seconds)
+
+    def progress(self, name, fraction):
+        """Abort a running stage whose projected finish falls past the deadline."""
+        self.check_cancelled(name)
+        if self.cost_keys.get(name, name) in self.active and self.enforce and 0 < fraction < 1:
+            elapsed = time.perf_counter() - self._stage_starts[name]
+            self._check(name, elapsed / fraction * (1 - fraction))
+
+    def merge_schedule(self, report):
+        """Adopt the schedule_report() of a timer that ran in a worker process."""
+        self.tier = report["tier"]
+        self.predicted = None if report["predicted_ms"] is None else report["predicted_ms"] / 1000.0
+        self.skipped.extend(report["skipped"])
+        self.aborted.extend(report["aborted"])
+        self.failed.extend(report["failed"])
+
+    def schedule_report(self):
+        """Chosen tier and deadline outcome reported in the result JSON."""
+        elapsed = time.perf_counter() - self._start_wall
+        return {
+            "tier": self.tier,
+            "budget_ms": self.budget_ms,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "deadline_met": self.deadline is None or elapsed <= self.budget_ms / 1000.0,
+            "predicted_ms": None if self.predicted is None else round(self.predicted * 1000, 1),
+            "skipped": self.skipped,
+            "aborted": self.aborted,
+            "failed": self.failed
+        }
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache for synthesized utterances
+Entries are keyed on everything that affects the rendered audio, written
+atomically and evicted least-recently-used within size and age bounds. An
+in-memory index (sizes plus recency and age heaps) keeps eviction off the
+directory listing. See tts_cache_cluster for sharing renders across workers
+and hosts
+"""
+
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+# Bump whenever the DSP chain changes so stale renders are never served
+PIPELINE_VERSION = 4
+
+# Other processes sharing the directory (the front tier, a shared node) add
+# entries too, so the index is rebuilt from one directory pass this often
+RESCAN_SECONDS = 60.0
+
+# Index entry: audio file name, its size, last use and creation times
+_Entry = namedtuple('_Entry', 'name size used created')
+
+
+def add_cache_arguments(parser):
+    """Register the shared cache options on an engine's argument parser."""
+    parser.add_argument('--cache-dir', default=os.environ.get('MARCH7TH_TTS_CACHE_DIR'),
+                        help='Audio cache directory (default: $MARCH7TH_TTS_CACHE_DIR, disabled if unset)')
+    parser.add_argument('--cache-max-mb', type=float, default=512,
+                        help='Maximum cache size in megabytes')
+    parser.add_argument('--cache-max-age-hours', type=float, default=24 * 7,
+                        help='Maximum age of a cache entry in hours')
+    parser.add_argument('--cache-nodes', default=os.environ.get('MARCH7TH_TTS_CACHE_NODES'),
+                        help='Share renders across hosts: comma-separated NAME=URL cache nodes (or shared '
+                             'directories), keys spread by consistent hashing; --cache-dir is then the '
+                             'host-local front tier (default: in shared memory)')
+    parser.add_argument('--cache-node', default=os.environ.get('MARCH7TH_TTS_CACHE_NODE'),
+                        help='Name of this host\'s own node in --cache-nodes, for cross-node hit rates')
+    parser.add_argument('--cache-node-timeout', type=float, default=0.5,
+                        help='Seconds to wait for a cache node before treating the lookup as a miss')
+
+
+def cache_from_args(args):
+    """Build an AudioCache (or a DistributedAudioCache) from parsed arguments, or None when caching is off."""
+    if args.cache_nodes:
+        from tts_cache_cluster import FRONT_DIR, DistributedAudioCache, node_from_spec, parse_nodes
+        front = AudioCache(
+            args.cache_dir or FRONT_DIR,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            max_age=args.cache_max_age_hours * 3600
+        )
+        nodes = {name: node_from_spec(spec, args.cache_node_timeout)
+                 for name, spec in parse_nodes(args.cache_nodes).items()}
+        return DistributedAudioCache(front, nodes, local_node=args.cache_node)
+    if not args.cache_dir:
+        return None
+    return AudioCache(
+        args.cache_dir,
+        max_bytes=int(args.cache_max_mb * 1024 * 1024),
+        max_age=args.cache_max_age_hours * 3600
+    )
+
+
+class AudioCache:
+    # Local disk: lookups are cheap enough to make inline
+    remote = False
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600):
+        """
+        Initialize the cache directory
+
+        Args:
+            cache_dir: Directory holding <key>.<format> and <key>.json pairs
+            max_bytes: Total audio size kept after eviction
+            max_age: Seconds after which an entry is considered stale
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # Lookups and stores arrive from several threads (cache_io, the node server)
+        self._lock = threading.Lock()
+        self._scan()
+
+    @staticmethod
+    def make_key(text, voice, engine, settings):
+        """Hash every input that changes the rendered audio."""
+        payload = json.dumps({
+            'text': text,
+            'voice': voice,
+            'engine': engine,
+            'settings': settings,
+            'pipeline_version': PIPELINE_VERSION
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _meta_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def _audio_path(self, key, meta):
+        """Audio file named after the format it was encoded in."""
+        fmt = str(meta.get('format') or 'wav').lower()
+        return self.cache_dir / f"{key}.{fmt if fmt.isalnum() else 'bin'}"
+
+    def _atomic_write(self, target, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _lookup(self, key):
+        """(metadata, audio path) of a live entry; raises OSError or ValueError otherwise."""
+        with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        audio_path = self._audio_path(key, meta)
+        if time.time() - meta.get('created', 0) > self.max_age:
+            self._remove(key, audio_path.name)
+            raise FileNotFoundError(key)
+        return meta, audio_path
+
+    def fetch(self, key, output_path):
+        """Copy a cached render to output_path and return its metadata, or None."""
+        try:
+            meta, audio_path = self._lookup(key)
+            shutil.copyfile(audio_path, output_path)
+            # Touch the file too, so other processes' scans see it as recently used
+            os.utime(audio_path)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        self._touch(key, audio_path, meta)
+        self._count(hit=True)
+        return meta
+
+    def read(self, key):
+        """(audio bytes, metadata) of a cached render, or None; counts like fetch()."""
+        try:
+            meta, audio_path = self._lookup(key)
+            audio = audio_path.read_bytes()
+            os.utime(audio_path)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        self._touch(key, audio_path, meta)
+        self._count(hit=True)
+        return audio, meta
+
+    def store(self, key, source_path, meta):
+        """Atomically add a rendered file to the cache, then enforce the bounds."""
+        def copy_audio(f):
+            with open(source_path, 'rb') as src:
+                shutil.copyfileobj(src, f)
+
+        self._store(key, copy_audio, meta)
+
+    def store_bytes(self, key, audio, meta):
+        """store() for a render held in memory, e.g. one received from another node."""
+        self._store(key, lambda f: f.write(audio), meta)
+
+    def _store(self, key, write_audio, meta):
+        audio_path = self._audio_path(key, meta)
+        # Keep the creation time of a render copied from another tier
+        meta = dict(meta, created=meta.get('created', time.time()))
+
+        # Audio first: an entry only counts once its metadata exists
+        self._atomic_write(audio_path, write_audio)
+        self._atomic_write(self._meta_path(key), lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        size = audio_path.stat().st_size
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous and previous.name != audio_path.name:
+                # Re-rendered in another format
+                self._unlink(previous.name)
+            self._index(key, _Entry(audio_path.name, size, time.time(), meta['created']))
+        self.evict()
+
+    def _scan(self, now=None):
+        """Rebuild the index from one pass over the directory (caller holds the lock, or is __init__)."""
+        audio, created = {}, {}
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                key, dot, suffix = entry.name.partition('.')
+                if not dot or not key:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if suffix == 'json':
+                    # Metadata is written once, so its mtime is the creation time
+                    created[key] = stat.st_mtime
+                else:
+                    # The audio mtime is touched on every hit
+                    audio[key] = (entry.name, stat.st_size, stat.st_mtime)
+        self._entries = {key: _Entry(name, size, used, created[key])
+                         for key, (name, size, used) in audio.items() if key in created}
+        self._bytes = sum(entry.size for entry in self._entries.values())
+        self._rebuild_heaps()
+        self._scanned = time.time() if now is None else now
+
+    def _rebuild_heaps(self):
+        self._lru = [(entry.used, key) for key, entry in self._entries.items()]
+        self._expiry = [(entry.created, key) for key, entry in self._entries.items()]
+        heapq.heapify(self._lru)
+        heapq.heapify(self._expiry)
+
+    def _index(self, key, entry):
+        """Add or replace an index entry (caller holds the lock)."""
+        previous = self._entries.get(key)
+        if previous:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        # Heap items left behind by the previous entry are skipped when popped
+        heapq.heappush(self._lru, (entry.used, key))
+        heapq.heappush(self._expiry, (entry.created, key))
+        if len(self._lru) > 2 * len(self._entries) + 64:
+            self._rebuild_heaps()
+
+    def _touch(self, key, audio_path, meta):
+        """Mark an entry as just used, indexing it if another process stored it."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.name == audio_path.name:
+                self._index(key, entry._replace(used=now))
+                return
+            try:
+                size = audio_path.stat().st_size
+            except OSError:
+                return
+            self._index(key, _Entry(audio_path.name, size, now, meta.get('created', now)))
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _unlink(self, name):
+        try:
+            (self.cache_dir / name).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, key, audio_name):
+        with self._lock:
+            self._drop(key)
+        self._unlink(audio_name)
+        self._unlink(self._meta_path(key).name)
+
+    def _drop(self, key):
+        """Forget an entry (caller holds the lock); returns it, or None if it was not indexed."""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry.size
+        return entry
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones until under max_bytes."""
+        now = time.time()
+        with self._lock:
+            if now - self._scanned > RESCAN_SECONDS:
+                self._scan(now)
+            doomed = []
+            while self._expiry and now - self._expiry[0][0] > self.max_age:
+                created, key = heapq.heappop(self._expiry)
+                entry = self._entries.get(key)
+                if entry and entry.created == created:
+                    doomed.append((key, self._drop(key)))
+            while self._bytes > self.max_bytes and self._lru:
+                used, key = heapq.heappop(self._lru)
+                entry = self._entries.get(key)
+                if entry and entry.used == used:
+                    doomed.append((key, self._drop(key)))
+            for key, entry in doomed:
+                self._unlink(entry.name)
+                self._unlink(self._meta_path(key).name)
+
+    def usage(self):
+        """(entries, bytes) of audio in the index."""
+        with self._lock:
+            return len(self._entries), self._bytes
+
+    def stats(self, hit):
+        """Counters reported in the result JSON."""
+        with self._lock:
+            return {
+                'hit': hit,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Audio cache shared by worker processes and hosts
+Every entry has an owner node picked by consistent hashing of its cache key.
+Workers look in their host's front tier first (an AudioCache in shared
+memory that every worker on the host reads and writes), then ask the owner,
+so a line rendered by any worker on any host is reused everywhere. Run this
+module to start a cache node: a small HTTP server over an on-disk AudioCache
+"""
+
+import argparse
+import bisect
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from tts_cache import AudioCache
+from tts_logging import add_logging_arguments, logging_from_args
+
+log = logging.getLogger('march7th.cache')
+
+# Host-local front tier: tmpfs where there is one, so it lives in shared memory
+FRONT_DIR = Path('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()) / 'march7th-tts-cache'
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _point(value):
+    return int.from_bytes(hashlib.sha256(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, nodes, replicas=128):
+        """
+        Consistent hashing of cache keys onto node names
+
+        Each node is placed at several points on the ring, so keys spread
+        evenly and adding or removing a node only moves the keys it owns.
+
+        Args:
+            nodes: Node names
+            replicas: Points per node
+        """
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((_point(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas))
+        self.nodes = list(nodes)
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        index = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
+
+
+class CacheNodeError(RuntimeError):
+    """A cache node answered, but not with an entry or a miss."""
+
+
+class HTTPCacheNode:
+    def __init__(self, url, timeout=0.5):
+        """
+        Client for a cache node started from this module
+
+        Args:
+            url: Base URL, e.g. http://10.0.0.2:8765
+            timeout: Seconds per request; a slow node counts as a failed one
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, key):
+        """(audio bytes, metadata) owned by this node, or None on a miss."""
+        try:
+            with urllib.request.urlopen(f"{self.url}/entries/{key}", timeout=self.timeout) as response:
+                meta = json.loads(response.headers.get('X-Cache-Meta') or '{}')
+                return response.read(), meta
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise CacheNodeError(f"{self.url} answered {e.code}") from None
+        except (http.client.HTTPException, ValueError) as e:
+            raise CacheNodeError(f"Bad reply from {self.url}: {e}") from None
+
+    def put(self, key, audio, meta):
+        request = urllib.request.Request(f"{self.url}/entries/{key}", data=audio, method='PUT',
+                                         headers={'X-Cache-Meta': json.dumps(meta),
+                                                  'Content-Type': 'application/octet-stream'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except urllib.error.HTTPError as e:
+            raise CacheNodeError(f"{self.url} answered {e.code}") from None
+        except http.client.HTTPException as e:
+            raise CacheNodeError(f"Bad reply from {self.url}: {e}") from None
+
+    def stats(self):
+        with urllib.request.urlopen(f"{self.url}/stats", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+class DirectoryCacheNode:
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600):
+        """Node kept in a directory every host mounts (e.g. NFS), reached without a server."""
+        self.cache = AudioCache(cache_dir, max_bytes, max_age)
+
+    def get(self, key):
+        return self.cache.read(key)
+
+    def put(self, key, audio, meta):
+        self.cache.store_bytes(key, audio, meta)
+
+    def stats(self):
+        return node_stats(self.cache)
+
+
+def node_from_spec(spec, timeout=0.5):
+    """Back-tier client for an http(s):// URL or a shared directory path."""
+    if spec.startswith(('http://', 'https://')):
+        return HTTPCacheNode(spec, timeout)
+    return DirectoryCacheNode(spec)
+
+
+def parse_nodes(value):
+    """'name=spec,...' (or bare specs, named after themselves) as an ordered {name: spec}."""
+    nodes = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, spec = item.partition('=') if re.match(r'^[\w.-]+=', item) else (item, '', item)
+        nodes[name] = spec
+    return nodes
+
+
+class DistributedAudioCache:
+    # Lookups may cross the network; async engines make them off the event loop
+    remote = True
+    make_key = staticmethod(AudioCache.make_key)
+
+    def __init__(self, front, nodes, local_node=None, retry_after=30.0, replicas=128):
+        """
+        Two-tier cache with the AudioCache interface (fetch/store/stats)
+
+        fetch() tries the host's front tier, then the key's owner node; a
+        render found on a node is copied into the front tier. store() writes
+        both. A node that fails is skipped for retry_after seconds and its
+        keys count as misses, so synthesis never waits on a dead node.
+
+        Args:
+            front: Host-local AudioCache (in shared memory), or None
+            nodes: {name: back-tier node} with get(key) and put(key, audio, meta)
+            local_node: Name of this host's own node; hits on any other
+                node are reported as cross-node hits
+            retry_after: Seconds a failed node is left alone
+            replicas: Ring points per node (see HashRing)
+        """
+        self.front = front
+        self.nodes = dict(nodes)
+        self.ring = HashRing(list(self.nodes), replicas)
+        self.local_node = local_node
+        self.retry_after = retry_after
+        self._down_until = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.front_hits = 0
+        self.node_hits = dict.fromkeys(self.nodes, 0)
+        self.misses = 0
+        self.stores = 0
+        self.node_errors = 0
+
+    @property
+    def hits(self):
+        return self.front_hits + sum(self.node_hits.values())
+
+    def _count(self, name):
+        # Async engines look up from several threads at once
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _call(self, node, method, *args):
+        """method on the node, or None while it is marked down or when it fails."""
+        if time.monotonic() < self._down_until.get(node, 0):
+            return None
+        try:
+            return getattr(self.nodes[node], method)(*args)
+        except (OSError, CacheNodeError) as e:
+            log.warning("Cache node %s failed (%s), skipping it for %.0fs", node, e, self.retry_after)
+            self._count('node_errors')
+            self._down_until[node] = time.monotonic() + self.retry_after
+            return None
+
+    def fetch(self, key, output_path):
+        """Copy a cached render to output_path and return its metadata, or None."""
+        self._count('lookups')
+        if self.front:
+            meta = self.front.fetch(key, output_path)
+            if meta:
+                self._count('front_hits')
+                return meta
+
+        node = self.ring.node_for(key)
+        entry = self._call(node, 'get', key)
+        if entry is None:
+            self._count('misses')
+            return None
+        audio, meta = entry
+        directory = os.path.dirname(os.path.abspath(output_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cache-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, output_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        if self.front:
+            # The host's other workers find it locally from now on
+            self.front.store_bytes(key, audio, meta)
+        with self._lock:
+            self.node_hits[node] += 1
+        log.debug("Cache hit on node %s: %s", node, output_path)
+        return meta
+
+    def store(self, key, source_path, meta):
+        """Add a render to the front tier and to its owner node."""
+        meta = dict(meta, created=time.time())
+        if self.front:
+            self.front.store(key, source_path, meta)
+        self._call(self.ring.node_for(key), 'put', key, Path(source_path).read_bytes(), meta)
+        self._count('stores')
+
+    def stats(self, hit):
+        """Counters reported in the result JSON, with hit rates per tier."""
+        with self._lock:
+            node_hits = dict(self.node_hits)
+            lookups = self.lookups
+        cross_node = sum(count for node, count in node_hits.items() if node != self.local_node)
+        hits = self.front_hits + sum(node_hits.values())
+        return {
+            'hit': hit,
+            'hits': hits,
+            'misses': self.misses,
+            'front_hits': self.front_hits,
+            'node_hits': node_hits,
+            'cross_node_hits': cross_node,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'cross_node_hit_rate': round(cross_node / lookups, 4) if lookups else 0.0,
+            'node_errors': self.node_errors
+        }
+
+    def add_metrics(self, metrics):
+        """Expose the per-tier hit counts on a tts_metrics.TTSMetrics."""
+        metrics.add_gauge('cache_front_hits_total', "Cache hits in the host's shared front tier",
+                          lambda: self.front_hits, kind='counter')
+        metrics.add_gauge('cache_node_hits_total', "Cache hits on a cache node",
+                          lambda: sum(self.node_hits.values()), kind='counter')
+        metrics.add_gauge('cache_cross_node_hit_ratio', "Share of cache lookups served by another host's node",
+                          lambda: self.stats(hit=False)['cross_node_hit_rate'])
+        metrics.add_gauge('cache_node_errors_total', "Failed cache node requests",
+                          lambda: self.node_errors, kind='counter')
+
+
+def node_stats(cache):
+    """Entry count and size of an AudioCache directory, with its hit counters."""
+    entries, size = cache.usage()
+    counters = cache.stats(hit=False)
+    return {"hits": counters["hits"], "misses": counters["misses"], "entries": entries, "bytes": size}
+
+
+def serve_node(cache, host='127.0.0.1', port=8765):
+    """
+    Serve an AudioCache as a cache node
+
+    GET /entries/<key> returns the audio with its metadata in the
+    X-Cache-Meta header (404 on a miss), PUT /entries/<key> stores one and
+    GET /stats reports the node's counters.
+
+    Returns:
+        The ThreadingHTTPServer, not yet serving
+    """
+    class CacheNodeHandler(BaseHTTPRequestHandler):
+        def _key(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            if len(parts) == 2 and parts[0] == 'entries' and KEY_PATTERN.match(parts[1]):
+                return parts[1]
+            self.send_error(404)
+            return None
+
+        def _reply(self, code, body=b'', content_type='application/octet-stream', meta=None):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if meta is not None:
+                self.send_header('X-Cache-Meta', json.dumps(meta))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.split('?')[0] == '/stats':
+                self._reply(200, json.dumps(node_stats(cache)).encode('utf-8'), 'application/json')
+                return
+            key = self._key()
+            if key is None:
+                return
+            entry = cache.read(key)
+            if entry is None:
+                self._reply(404)
+                return
+            audio, meta = entry
+            self._reply(200, audio, meta=meta)
+
+        def do_PUT(self):
+            key = self._key()
+            if key is None:
+                return
+            try:
+                meta = json.loads(self.headers.get('X-Cache-Meta') or '{}')
+                audio = self.rfile.read(int(self.headers['Content-Length']))
+            except (KeyError, ValueError):
+                self.send_error(400)
+                return
+            cache.store_bytes(key, audio, meta)
+            self._reply(204)
+
+        def log_message(self, format, *args):
+            log.debug("cache node %s", format % args)
+
+    server = ThreadingHTTPServer((host, port), CacheNodeHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='March 7th TTS cache node')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (0: any free port)')
+    parser.add_argument('--cache-dir', required=True, help='Directory holding this node\'s entries')
+    parser.add_argument('--cache-max-mb', type=float, default=2048, help='Maximum size in megabytes')
+    parser.add_argument('--cache-max-age-hours', type=float, default=24 * 7,
+                        help='Maximum age of an entry in hours')
+    add_logging_arguments(parser)
+    args = parser.parse_args(argv)
+    logging_from_args(args)
+
+    cache = AudioCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024), args.cache_max_age_hours * 3600)
+    server = serve_node(cache, args.host, args.port)
+    host, port = server.server_address[:2]
+    log.info("Cache node on http://%s:%d serving %s", host, port, args.cache_dir)
+    # One line for whoever started the node (e.g. a test harness picking a free port)
+    print(json.dumps({"ready": True, "url": f"http://{host}:{port}"}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
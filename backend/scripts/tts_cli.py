@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the March 7th TTS engines
+Picks an engine from the registry and hands the remaining arguments to its
+main(), so only that engine's dependencies are ever imported
+
+    python tts_cli.py --engine edge_enhanced --text "Hi!" --output hi.wav
+    python tts_cli.py --list-engines
+"""
+
+import argparse
+import json
+import sys
+
+from tts_engines import ENGINES, describe_engines, load_module, load_plugins
+
+
+def main(argv=None):
+    load_plugins()
+    # --help is forwarded to the engine when one is chosen
+    parser = argparse.ArgumentParser(
+        description='March 7th Text-to-Speech', add_help=False,
+        epilog='All other arguments are passed to the selected engine (see --engine NAME --help)'
+    )
+    parser.add_argument('--engine', choices=sorted(ENGINES),
+                        help='TTS engine to run (default: edge_enhanced)')
+    parser.add_argument('--list-engines', action='store_true',
+                        help='List registered engines and whether their dependencies are installed')
+    args, engine_argv = parser.parse_known_args(argv)
+
+    if args.engine is None and {'-h', '--help'} & set(engine_argv):
+        parser.print_help()
+        return 0
+
+    if args.list_engines:
+        print(json.dumps(describe_engines(), indent=2))
+        return 0
+
+    try:
+        module = load_module(args.engine or 'edge_enhanced')
+    except ImportError as e:
+        print(json.dumps({"success": False, "error": str(e), "output_path": None}))
+        return 1
+    return module.main(engine_argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Concurrent Edge-TTS base speech fetching
+Caps the number of upstream requests in flight and coalesces concurrent
+requests for the same (text, voice, prosody) into a single upstream call,
+which is cancelled once every request waiting for it has been cancelled
+"""
+
+import asyncio
+
+
+class EdgeSpeechFetcher:
+    def __init__(self, communicate_factory=None, max_concurrency=4):
+        """
+        Initialize the fetcher
+
+        Args:
+            communicate_factory: Callable (text, voice, rate=, pitch=, volume=)
+                -> object with an async stream() method, defaults to
+                edge_tts.Communicate
+            max_concurrency: Maximum number of upstream fetches in flight
+        """
+        self.communicate_factory = communicate_factory
+        self.max_concurrency = max_concurrency
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self._loop = None
+        self._semaphore = None
+        self._in_flight = {}
+        self._waiters = {}
+
+    def _bind_loop(self):
+        # asyncio primitives belong to one loop; rebuild them if the caller
+        # moved to a new one (e.g. repeated asyncio.run in a batch job)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._in_flight = {}
+            self._waiters = {}
+
+    async def fetch(self, text, voice, **prosody):
+        """
+        Return the encoded audio bytes for plain text spoken by voice
+
+        prosody holds edge_tts.Communicate's rate/pitch/volume offsets; only
+        requests with the same prosody share an upstream call.
+        """
+        self._bind_loop()
+        key = (text, voice, tuple(sorted(prosody.items())))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_upstream(text, voice, prosody))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # Shield so one cancelled waiter does not cancel the shared fetch
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                # Nobody else wants this audio; stop downloading it
+                task.cancel()
+                self.cancelled += 1
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    async def _fetch_upstream(self, text, voice, prosody):
+        async with self._semaphore:
+            self.upstream_calls += 1
+            if self.communicate_factory is None:
+                # Imported on first use so workers that never fetch skip it
+                import edge_tts
+                self.communicate_factory = edge_tts.Communicate
+            communicate = self.communicate_factory(text, voice, **prosody)
+            chunks = []
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    chunks.append(chunk["data"])
+        if not chunks:
+            raise RuntimeError("Edge-TTS returned no audio")
+        return b"".join(chunks)
+
+    def stats(self):
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._in_flight),
+            "max_concurrency": self.max_concurrency
+        }
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Registry of the March 7th TTS engines
+Maps engine names to the module and class implementing them without
+importing anything, so a CLI can list engines, check their dependencies and
+load only the one a request actually uses
+"""
+
+import importlib
+import importlib.util
+import os
+
+# Extra engines as "name=module:Class" pairs separated by commas
+PLUGINS_ENV = 'MARCH7TH_TTS_ENGINES'
+
+ENGINES = {}
+
+
+def register_engine(name, module, class_name, requires=(), optional=(), description=''):
+    """
+    Register an engine by module path; nothing is imported until it is loaded
+
+    Args:
+        name: Engine name used on the command line
+        module: Importable module providing the engine and a main(argv) entry
+        class_name: Engine class inside module
+        requires: Top-level packages the engine cannot run without
+        optional: Packages the engine uses when present (e.g. torch for CUDA)
+        description: One-line summary for --list-engines
+    """
+    ENGINES[name] = {
+        "module": module,
+        "class": class_name,
+        "requires": tuple(requires),
+        "optional": tuple(optional),
+        "description": description
+    }
+
+
+register_engine(
+    'sapi', 'march7th_tts', 'March7thTTS',
+    description='Windows SAPI voice with March 7th prosody settings'
+)
+register_engine(
+    'edge_enhanced', 'march7th_enhanced_tts', 'March7thEnhancedTTS',
+    requires=('edge_tts', 'numpy', 'scipy', 'librosa', 'soundfile'),
+    description='Edge-TTS neural voice with March 7th voice effects'
+)
+register_engine(
+    'rvc', 'march7th_rvc_tts', 'March7thRVCTTS',
+    requires=('numpy', 'scipy', 'librosa', 'soundfile'),
+    optional=('torch',),
+    description='SAPI base speech converted with the March 7th RVC model'
+)
+
+
+def load_plugins(spec=None):
+    """Register engines named in MARCH7TH_TTS_ENGINES (or spec)."""
+    spec = os.environ.get(PLUGINS_ENV, '') if spec is None else spec
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            name, target = entry.split('=', 1)
+            module, class_name = target.split(':', 1)
+        except ValueError:
+            raise ValueError(f"Bad {PLUGINS_ENV} entry '{entry}', expected name=module:Class")
+        register_engine(name.strip(), module.strip(), class_name.strip(),
+                        description=f"Plugin engine from {module.strip()}")
+
+
+def get_engine(name):
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown engine '{name}'. Available: {', '.join(sorted(ENGINES))}")
+
+
+def missing_dependencies(name):
+    """Required packages of an engine that are not installed (checked without importing)."""
+    return [package for package in get_engine(name)["requires"]
+            if importlib.util.find_spec(package) is None]
+
+
+def load_module(name):
+    """Import the engine's module, raising ImportError with the missing packages."""
+    missing = missing_dependencies(name)
+    if missing:
+        raise ImportError(f"Engine '{name}' needs missing packages: {', '.join(missing)}")
+    return importlib.import_module(get_engine(name)["module"])
+
+
+def load_engine_class(name):
+    return getattr(load_module(name), get_engine(name)["class"])
+
+
+def describe_engines():
+    """Name, description and availability of every registered engine."""
+    return [
+        {
+            "name": name,
+            "description": engine["description"],
+            "available": not missing_dependencies(name),
+            "missing": missing_dependencies(name),
+            "optional_missing": [package for package in engine["optional"]
+                                 if importlib.util.find_spec(package) is None]
+        }
+        for name, engine in ENGINES.items()
+    ]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Structured logging for the TTS engines
+Progress and diagnostics go to stderr through the logging module, as plain
+text or one JSON object per line, so stdout only ever carries the result
+JSON, the serve protocol or streamed audio
+"""
+
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL_ENV = 'MARCH7TH_LOG_LEVEL'
+LOG_FORMAT_ENV = 'MARCH7TH_LOG_FORMAT'
+
+# Every engine logs below this name, e.g. march7th.enhanced
+ROOT_LOGGER = 'march7th'
+
+# LogRecord attributes that are not extra= fields
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def add_logging_arguments(parser):
+    """Register the shared logging options on an engine's argument parser."""
+    parser.add_argument('--log-level', type=str.upper, default=os.environ.get(LOG_LEVEL_ENV, 'INFO').upper(),
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Minimum level logged to stderr (default: $MARCH7TH_LOG_LEVEL or INFO)')
+    parser.add_argument('--log-format', choices=['text', 'json'],
+                        default=os.environ.get(LOG_FORMAT_ENV, 'text'),
+                        help='stderr log lines as text or one JSON object each (default: text)')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; extra= fields become keys of their own."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level='INFO', log_format='text'):
+    """Send the engines' logs to stderr; safe to call again (e.g. in a pool worker)."""
+    logger = logging.getLogger(ROOT_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def logging_from_args(args):
+    return setup_logging(args.log_level, args.log_format)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics for a TTS worker
+Counts requests and cache lookups, keeps per-engine request, per-stage and
+real-time factor histograms, samples queue depth and RSS, and exposes them
+in the Prometheus text format on an HTTP endpoint or in a file rewritten
+after every request
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tts_profiling import HISTOGRAM_BUCKETS, peak_rss_mb, rss_mb
+
+log = logging.getLogger('march7th.metrics')
+
+METRICS_PREFIX = 'march7th_tts'
+
+# Synthesis wall time per second of audio produced; below 1 is faster than real time
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+
+def add_metrics_arguments(parser):
+    """Register the shared metrics options on an engine's argument parser."""
+    parser.add_argument('--metrics-file', default=os.environ.get('MARCH7TH_METRICS_FILE'),
+                        help='Rewrite Prometheus text metrics to this file after every request '
+                             '(one file per worker, e.g. for the node exporter textfile collector)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus text metrics on http://HOST:PORT/metrics')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='Interface for --metrics-port (default: 127.0.0.1)')
+
+
+def metrics_from_args(args, engine):
+    """TTSMetrics for an engine as requested by the parsed arguments, or None."""
+    if not args.metrics_file and args.metrics_port is None:
+        return None
+    metrics = TTSMetrics(engine, args.metrics_file)
+    if args.metrics_port is not None:
+        metrics.serve_http(args.metrics_host, args.metrics_port)
+    return metrics
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.series = {}
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.series[key] = self.series.get(key, 0) + value
+
+    def total(self, **labels):
+        """Sum over every series whose labels include the given ones."""
+        return sum(value for key, value in self.series.items() if set(labels.items()) <= set(key))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, bounds):
+        self.name = name
+        self.help = help_text
+        self.bounds = bounds
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.setdefault(key, {"buckets": [0] * len(self.bounds), "sum": 0.0, "count": 0})
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                series["buckets"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            # Buckets are cumulative, as the text format expects
+            for bound, count in zip(self.bounds, series["buckets"]):
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', _number(float(bound))),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(round(series['sum'], 6))}")
+            lines.append(f"{self.name}_count{_labels(key)} {series['count']}")
+        return lines
+
+
+class TTSMetrics:
+    def __init__(self, engine, path=None):
+        """
+        Metrics for one worker process
+
+        Results are folded in with observe(); gauges registered with
+        add_gauge are sampled whenever the metrics are rendered.
+
+        Args:
+            engine: Engine label on every series (e.g. edge_enhanced)
+            path: Optional file rewritten atomically after each observe()
+        """
+        self.engine = engine
+        self.path = path
+        self._lock = threading.Lock()
+        self._server = None
+        self.requests = Counter(f"{METRICS_PREFIX}_requests_total", "Finished synthesis requests")
+        self.tiers = Counter(f"{METRICS_PREFIX}_tier_total", "Requests by the scheduler tier that produced them")
+        self.cache_lookups = Counter(f"{METRICS_PREFIX}_cache_lookups_total", "Audio cache lookups by outcome")
+        self.audio_seconds = Counter(f"{METRICS_PREFIX}_audio_seconds_total", "Seconds of audio synthesized")
+        self.request_seconds = Histogram(f"{METRICS_PREFIX}_request_seconds",
+                                         "End-to-end request latency", HISTOGRAM_BUCKETS)
+        self.stage_seconds = Histogram(f"{METRICS_PREFIX}_stage_seconds",
+                                       "Pipeline stage latency", HISTOGRAM_BUCKETS)
+        self.real_time_factor = Histogram(f"{METRICS_PREFIX}_real_time_factor",
+                                          "Synthesis wall time per second of audio (cache misses)", RTF_BUCKETS)
+        self.gauges = {}
+        self.add_gauge('cache_hit_ratio', "Share of cache lookups served from the cache", self.cache_hit_ratio)
+        self.add_gauge('resident_memory_bytes', "Current resident set size",
+                       lambda: int((rss_mb() or 0) * 1024 * 1024))
+        self.add_gauge('peak_resident_memory_bytes', "Peak resident set size",
+                       lambda: int((peak_rss_mb() or 0) * 1024 * 1024))
+        started = time.time()
+        self.add_gauge('start_time_seconds', "Worker start time since the Unix epoch", lambda: round(started, 3))
+
+    def add_gauge(self, name, help_text, sample, kind='gauge'):
+        """Expose sample() (e.g. a queue's depth) as METRICS_PREFIX_name."""
+        self.gauges[f"{METRICS_PREFIX}_{name}"] = (help_text, sample, kind)
+
+    def cache_hit_ratio(self):
+        lookups = self.cache_lookups.total(engine=self.engine)
+        return round(self.cache_lookups.total(engine=self.engine, outcome='hit') / lookups, 4) if lookups else 0.0
+
+    def observe(self, result):
+        """Fold in one result dict (a serve-mode batch response counts each reply)."""
+        with self._lock:
+            for item in result.get("results", [result]):
+                self._observe(item)
+        self.write()
+
+    def _observe(self, result):
+        engine = self.engine
+        self.requests.inc(engine=engine, status='ok' if result.get("success") else 'error')
+        if not result.get("success"):
+            return
+        cache = result.get("cache")
+        if cache:
+            self.cache_lookups.inc(engine=engine, outcome='hit' if cache["hit"] else 'miss')
+        tier = result.get("schedule", {}).get("tier")
+        if tier:
+            self.tiers.inc(engine=engine, tier=tier)
+
+        timings = result.get("timings") or {}
+        for stage, record in timings.items():
+            if stage != "total":
+                self.stage_seconds.observe(record["wall"], engine=engine, stage=stage)
+        wall = timings.get("total", {}).get("wall", result.get("synthesis_time"))
+        if wall is None:
+            return
+        self.request_seconds.observe(wall, engine=engine)
+        duration = result.get("duration") or 0
+        if duration > 0:
+            self.audio_seconds.inc(duration, engine=engine)
+            if not (cache and cache["hit"]):
+                self.real_time_factor.observe(wall / duration, engine=engine)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.tiers, self.cache_lookups, self.audio_seconds,
+                           self.request_seconds, self.stage_seconds, self.real_time_factor):
+                lines.extend(metric.render())
+            labels = _labels((('engine', self.engine),))
+            for name, (help_text, sample, kind) in self.gauges.items():
+                try:
+                    value = sample()
+                except Exception as e:
+                    log.debug("Gauge %s not sampled: %s", name, e)
+                    continue
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}",
+                              f"{name}{labels} {_number(value)}"])
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Metrics not written to %s: %s", self.path, e)
+
+    def serve_http(self, host, port):
+        """Serve GET /metrics from a daemon thread; returns the bound port."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug("metrics %s", format % args)
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True).start()
+        port = self._server.server_address[1]
+        log.info("Metrics on http://%s:%d/metrics", host, port)
+        return port
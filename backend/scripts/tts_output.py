@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Encoded audio output for the TTS engines
+Writes WAV, FLAC, Opus-in-Ogg or MP3 at a chosen bitrate to a file, to
+stdout ("-") or to a socket ("unix:PATH" / "tcp:HOST:PORT"), sending
+encoded pages as soon as the encoder emits them so the Node server can
+pipe them straight into an HTTP response
+"""
+
+import os
+import socket
+import sys
+
+import numpy as np
+
+OUTPUT_FORMATS = {
+    'wav': {'format': 'WAV', 'subtype': 'PCM_16', 'extensions': ('.wav',)},
+    'flac': {'format': 'FLAC', 'subtype': 'PCM_16', 'extensions': ('.flac',)},
+    # libsndfile's Opus encoder only runs at these rates
+    'opus': {'format': 'OGG', 'subtype': 'OPUS', 'extensions': ('.ogg', '.opus', '.oga'),
+             'rates': (8000, 12000, 16000, 24000, 48000)},
+    'mp3': {'format': 'MP3', 'subtype': 'MPEG_LAYER_III', 'extensions': ('.mp3',)}
+}
+
+# Formats used for stdout/socket targets and for paths without a known extension
+DEFAULT_STREAM_FORMAT = 'opus'
+DEFAULT_FILE_FORMAT = 'wav'
+
+# libsndfile maps compression_level to MP3 bitrate non-linearly; measured
+# for MPEG-1 rates (32 kHz and up), MPEG-2 rates use half these bitrates
+MP3_LEVELS = (0.0, 0.25, 0.5, 0.75, 0.9, 0.99)
+MP3_KBPS = (320, 256, 160, 96, 56, 32)
+
+
+def add_output_arguments(parser):
+    """Register the shared output encoding options on an engine's argument parser."""
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS),
+                        help='Output codec (default: from the file extension, opus for - and sockets)')
+    parser.add_argument('--bitrate', type=int,
+                        help='Target bitrate in kbps for opus/mp3 (default: codec default)')
+
+
+def is_stream_target(output):
+    output = str(output)
+    return output == '-' or output.startswith(('unix:', 'tcp:'))
+
+
+def resolve_format(fmt, output):
+    if fmt:
+        return fmt
+    if is_stream_target(output):
+        return DEFAULT_STREAM_FORMAT
+    extension = os.path.splitext(str(output))[1].lower()
+    for name, spec in OUTPUT_FORMATS.items():
+        if extension in spec['extensions']:
+            return name
+    return DEFAULT_FILE_FORMAT
+
+
+def compression_level(fmt, bitrate, sample_rate):
+    """libsndfile compression level giving roughly bitrate kbps (None for the default)."""
+    if not bitrate or fmt not in ('opus', 'mp3'):
+        return None
+    if fmt == 'opus':
+        # Linear from 256 kbps (0.0) down to 6 kbps (1.0)
+        return float(np.clip((256 - bitrate) / 250.0, 0.0, 1.0))
+    scale = 1.0 if sample_rate >= 32000 else 0.5
+    kbps = np.array(MP3_KBPS) * scale
+    return float(np.interp(-bitrate, -kbps, MP3_LEVELS))
+
+
+def open_sink(output):
+    """Binary stream for a stdout/socket target: (file object, closer)."""
+    output = str(output)
+    if output == '-':
+        # The real stdout, even while progress prints are redirected to stderr
+        stdout = sys.__stdout__.buffer
+        return stdout, stdout.flush
+    if output.startswith('unix:'):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(output[len('unix:'):])
+    else:
+        host, port = output[len('tcp:'):].rsplit(':', 1)
+        connection = socket.create_connection((host, int(port)))
+    stream = connection.makefile('wb')
+
+    def close():
+        stream.close()
+        connection.close()
+    return stream, close
+
+
+class ForwardOnlySink:
+    def __init__(self, raw, drop_header=False):
+        """
+        File object for libsndfile's virtual IO over a pipe or socket
+
+        Bytes are forwarded once, in order. Encoders that seek back to patch
+        a header on close get a consistent position, but rewrites of bytes
+        already sent are dropped.
+
+        Args:
+            raw: Binary stream the encoded bytes go to
+            drop_header: Swallow the first write. The MP3 encoder writes an
+                empty LAME tag frame first and fills it in on close; sent
+                unpatched it makes decoders stop early, left out the stream
+                is plain MP3 frames
+        """
+        self.raw = raw
+        self.drop_header = drop_header
+        self.position = 0
+        self.end = 0
+        self.sent = 0
+
+    def write(self, data):
+        data = bytes(data)
+        already_sent = max(0, self.end - self.position)
+        if already_sent < len(data):
+            if self.drop_header:
+                self.drop_header = False
+            else:
+                self.raw.write(data[already_sent:])
+                self.sent += len(data) - already_sent
+            self.end += len(data) - already_sent
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: self.end}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        return b''
+
+    def flush(self):
+        self.raw.flush()
+
+
+class AudioWriter:
+    def __init__(self, output, sample_rate, fmt=None, bitrate=None):
+        """
+        Open an encoder on a path or stream target
+
+        Args:
+            output: File path, "-" for stdout, "unix:PATH" or "tcp:HOST:PORT"
+            sample_rate: Rate of the float32 blocks passed to write()
+            fmt: Key of OUTPUT_FORMATS, or None to pick from the target
+            bitrate: Target kbps for opus/mp3
+        """
+        import soundfile as sf
+
+        self.output = str(output)
+        self.format = resolve_format(fmt, self.output)
+        spec = OUTPUT_FORMATS[self.format]
+        self.input_rate = sample_rate
+        self.sample_rate = sample_rate
+        rates = spec.get('rates')
+        if rates and sample_rate not in rates:
+            # Next supported rate up, e.g. 22.05 kHz -> 24 kHz for Opus
+            self.sample_rate = next((rate for rate in rates if rate >= sample_rate), rates[-1])
+        self._resampler = None
+        if self.sample_rate != sample_rate:
+            import soxr
+            self._resampler = soxr.ResampleStream(sample_rate, self.sample_rate, 1, dtype='float32')
+
+        self._sink = None
+        self._close_sink = None
+        target = self.output
+        if is_stream_target(self.output):
+            raw, self._close_sink = open_sink(self.output)
+            self._sink = target = ForwardOnlySink(raw, drop_header=self.format == 'mp3')
+
+        options = {}
+        level = compression_level(self.format, bitrate, self.sample_rate)
+        if level is not None:
+            options['compression_level'] = level
+            if self.format == 'mp3':
+                options['bitrate_mode'] = 'CONSTANT'
+        self._file = sf.SoundFile(target, 'w', samplerate=self.sample_rate, channels=1,
+                                  format=spec['format'], subtype=spec['subtype'], **options)
+        self.frames = 0
+
+    def write(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        self.frames += len(block)
+        if self._resampler:
+            block = self._resampler.resample_chunk(block)
+        self._file.write(block)
+
+    def flush(self):
+        """Push whatever the encoder has finished to the target."""
+        self._file.flush()
+        if self._sink:
+            self._sink.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self._resampler:
+                self._file.write(self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+            self._file.close()
+        finally:
+            if self._close_sink:
+                self._close_sink()
+
+    @property
+    def bytes_written(self):
+        return self._sink.sent if self._sink else os.path.getsize(self.output)
+
+    def summary(self):
+        """Duration, rate, codec and size of what was written."""
+        return {
+            "duration": self.frames / self.input_rate,
+            "sample_rate": self.sample_rate,
+            "format": self.format,
+            "bytes": self.bytes_written
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Precomputed audio for frequent character phrases
+An offline build renders each voice profile's most frequent reply sentences
+and configured catchphrases into one packed, memory-mapped PCM file with a
+JSON index. At synthesis time indexed sentences are reused as they are and
+only the novel parts of a reply go to Edge-TTS, joined with short
+crossfades
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from tts_text import split_sentences
+
+log = logging.getLogger('march7th.phrases')
+
+INDEX_FILE = 'phrases.json'
+# 2: phrases stored at the effects' level with a per-entry gain, not normalized
+INDEX_VERSION = 2
+
+# Equal-power crossfade at every seam between indexed and synthesized audio
+CROSSFADE_SECONDS = 0.02
+
+
+def add_phrase_arguments(parser):
+    """Register the shared phrase index options on an engine's argument parser."""
+    parser.add_argument('--phrase-index', default=os.environ.get('MARCH7TH_PHRASE_INDEX'),
+                        help='Precomputed phrase directory (default: $MARCH7TH_PHRASE_INDEX, disabled if unset)')
+
+
+def phrase_index_from_args(args):
+    """Open the PhraseIndex named by the parsed arguments, or None when unset."""
+    if not args.phrase_index:
+        return None
+    return PhraseIndex(args.phrase_index)
+
+
+def normalize_phrase(text):
+    """Lookup form of a sentence: case and spacing ignored, punctuation kept."""
+    return ' '.join(text.split()).casefold()
+
+
+def crossfade_concat(pieces, sr, fade_seconds=CROSSFADE_SECONDS):
+    """Join mono float32 buffers, overlapping each seam with an equal-power crossfade."""
+    return np.concatenate([np.zeros(0, dtype=np.float32), *crossfade_blocks(pieces, sr, fade_seconds)])
+
+
+def crossfade_blocks(pieces, sr, fade_seconds=CROSSFADE_SECONDS):
+    """
+    crossfade_concat as a generator, for pieces given as buffers or block iterables
+
+    Only the last fade of the output and the first fade of the next piece
+    are held back, so enhanced runs reach the encoder without being joined.
+    """
+    fade = int(fade_seconds * sr)
+    held = np.zeros(0, dtype=np.float32)
+
+    def push(chunk):
+        nonlocal held
+        joined = np.concatenate([held, chunk])
+        keep = min(fade, len(joined))
+        held = joined[len(joined) - keep:]
+        if len(joined) > keep:
+            yield joined[:len(joined) - keep]
+
+    for piece in pieces:
+        blocks = iter([piece] if isinstance(piece, np.ndarray) else piece)
+        # The piece's first fade of samples, or all of it if it is shorter
+        head = np.zeros(0, dtype=np.float32)
+        for block in blocks:
+            head = np.concatenate([head, np.asarray(block, dtype=np.float32)])
+            if len(head) >= max(fade, 1):
+                break
+        if not len(head):
+            continue
+        overlap = min(fade, len(held), len(head))
+        if overlap:
+            t = np.linspace(0.0, np.pi / 2, overlap, dtype=np.float32)
+            seam = held[-overlap:] * np.cos(t) + head[:overlap] * np.sin(t)
+            held = held[:-overlap]
+            yield from push(seam)
+        yield from push(head[overlap:])
+        for block in blocks:
+            yield from push(np.asarray(block, dtype=np.float32))
+    if len(held):
+        yield held
+
+
+def match_rate(audio, sr, target_sr):
+    """Resample a phrase rendered at another rate (e.g. built with the offline stub)."""
+    if sr == target_sr:
+        return audio
+    import soxr
+    return soxr.resample(audio, sr, target_sr).astype(np.float32)
+
+
+def phrase_report(indexed_frames, total_frames, indexed_segments, segments, sr):
+    """Share of a reply served from the phrase index, reported in the result JSON."""
+    return {
+        "segments": segments,
+        "indexed_segments": indexed_segments,
+        "indexed_seconds": round(indexed_frames / sr, 3),
+        "fraction": round(indexed_frames / total_frames, 3) if total_frames else 0.0
+    }
+
+
+class PhraseIndex:
+    def __init__(self, directory):
+        """
+        Read-only view of a built phrase store
+
+        The PCM file is memory-mapped, so workers share the pages and only
+        the phrases actually used are read. The index is reopened when a
+        rebuild replaces it; entries rendered with an older version of a
+        profile (different fingerprint) are ignored.
+        """
+        self.directory = Path(directory)
+        self.entries = {}
+        self.pcm = None
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        index_path = self.directory / INDEX_FILE
+        try:
+            self._mtime = index_path.stat().st_mtime_ns
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                raise ValueError(f"version {index.get('version')} store, rebuild it for version {INDEX_VERSION}")
+            pcm_path = self.directory / index['pcm']
+            pcm = np.memmap(pcm_path, dtype='<i2', mode='r') if pcm_path.stat().st_size else None
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Phrase index not loaded from %s: %s", self.directory, e)
+            return
+        self.pcm = pcm
+        self.entries = {(entry['profile'], entry['key']): entry for entry in index['entries']}
+        log.info("Phrase index: %d phrases from %s", len(self.entries), self.directory)
+
+    def check_reload(self):
+        try:
+            mtime = (self.directory / INDEX_FILE).stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def lookup(self, text, profile):
+        """
+        (audio, sample_rate) for a sentence rendered in profile's voice, or None
+
+        The audio is at the level the effects chain left it, not normalized,
+        so a reply made of several pieces can be normalized as a whole.
+        """
+        entry = self.entries.get((profile.name, normalize_phrase(text)))
+        if not entry or entry['fingerprint'] != profile.fingerprint or self.pcm is None:
+            return None
+        start = entry['offset']
+        audio = self.pcm[start:start + entry['frames']].astype(np.float32) * np.float32(entry['gain'] / 32768.0)
+        return audio, entry['sample_rate']
+
+    def plan(self, text, profile):
+        """
+        Split text into sentences and mark which ones the index covers
+
+        Returns:
+            List of (text, (audio, sr) or None) in reading order; consecutive
+            novel sentences are merged so they are synthesized in one request
+        """
+        self.check_reload()
+        plan = []
+        for sentence in split_sentences(text):
+            hit = self.lookup(sentence, profile)
+            if hit is None and plan and plan[-1][1] is None:
+                plan[-1] = (f"{plan[-1][0]} {sentence}", None)
+            else:
+                plan.append((sentence, hit))
+        return plan
+
+
+def count_phrases(corpus_path, resolve_profile):
+    """
+    Sentence frequencies per profile from a reply corpus (text lines or JSONL)
+
+    Args:
+        resolve_profile: Maps a record's voice_profile (None for plain text
+            lines) to a profile key
+
+    Returns:
+        {profile: Counter of normalized sentences}, and the first spelling
+        seen for each normalized sentence
+    """
+    counts = {}
+    spellings = {}
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            name = None
+            if line.startswith('{'):
+                record = json.loads(line)
+                line = record.get('text', '')
+                name = record.get('voice_profile')
+            profile = resolve_profile(name)
+            for sentence in split_sentences(line):
+                key = normalize_phrase(sentence)
+                counts.setdefault(profile, Counter())[key] += 1
+                spellings.setdefault(key, sentence)
+    return counts, spellings
+
+
+async def build_index(tts, directory, corpus_path=None, top=50, profile_names=None):
+    """
+    Render the top phrases of each profile through the engine into a new store
+
+    Args:
+        tts: March7thEnhancedTTS used for base speech and effects
+        directory: Output directory; the previous store is replaced atomically
+        corpus_path: Optional reply corpus to rank sentences by frequency
+        top: Phrases kept per profile from the corpus
+        profile_names: Profiles to build (default: every configured profile)
+
+    Returns:
+        Summary dict with phrase counts and PCM size
+    """
+    from tts_audio import decode_audio
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    profiles = [tts.profile(name) for name in (profile_names or tts.profiles.names())]
+    counts, spellings = ({}, {}) if not corpus_path else \
+        count_phrases(corpus_path, lambda name: tts.profile(name).name)
+
+    jobs = []
+    for profile in profiles:
+        phrases = {normalize_phrase(phrase): phrase for phrase in profile.phrases}
+        for key, _ in counts.get(profile.name, Counter()).most_common(top):
+            phrases.setdefault(key, spellings[key])
+        jobs.extend((profile, key, phrase) for key, phrase in phrases.items())
+
+    async def render(profile, key, phrase):
+        audio_bytes = await tts.generate_base_speech(phrase, profile)
+        if not audio_bytes:
+            raise RuntimeError(f"Base speech generation failed for: '{phrase}'")
+        audio, sr = decode_audio(audio_bytes)
+        return profile, key, phrase, profile.effects.process(audio, sr, normalize=False), sr
+
+    rendered = await asyncio.gather(*(render(*job) for job in jobs))
+
+    pcm_name = f"phrases-{int(time.time() * 1000)}.pcm"
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    entries = []
+    offset = 0
+    with os.fdopen(fd, 'wb') as f:
+        for profile, key, phrase, audio, sr in rendered:
+            # Full scale in the int16 store, with the gain that restores the chain's level
+            peak = float(np.max(np.abs(audio))) if len(audio) else 0.0
+            gain = peak if peak > 0 else 1.0
+            pcm = (np.clip(audio / gain, -1.0, 32767 / 32768) * 32768).astype('<i2')
+            f.write(pcm.tobytes())
+            entries.append({
+                "profile": profile.name,
+                "fingerprint": profile.fingerprint,
+                "key": key,
+                "text": phrase,
+                "offset": offset,
+                "frames": len(pcm),
+                "sample_rate": sr,
+                "gain": gain
+            })
+            offset += len(pcm)
+    os.replace(tmp_path, directory / pcm_name)
+
+    # The index names its PCM file, so swapping the index switches both at once
+    index = {"version": INDEX_VERSION, "created": time.time(), "pcm": pcm_name, "entries": entries}
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, directory / INDEX_FILE)
+
+    # Older stores may still be mapped by running workers; unlinking keeps their pages alive
+    for old in directory.glob('phrases-*.pcm'):
+        if old.name != pcm_name:
+            old.unlink()
+
+    return {
+        "success": True,
+        "index": str(directory / INDEX_FILE),
+        "phrases": len(entries),
+        "profiles": {profile.name: sum(entry['profile'] == profile.name for entry in entries)
+                     for profile in profiles},
+        "pcm_bytes": offset * 2
+    }
+
+
+def main(argv=None):
+    from march7th_enhanced_tts import March7thEnhancedTTS, fetcher_from_args
+    from tts_logging import add_logging_arguments, logging_from_args
+    from voice_effects import add_effects_arguments
+    from voice_profiles import add_profile_arguments, profiles_from_args
+
+    parser = argparse.ArgumentParser(description='Build the precomputed phrase index')
+    parser.add_argument('--phrase-index', required=True, help='Output directory')
+    parser.add_argument('--corpus', help='Reply corpus: one reply per line, or JSONL with text/voice_profile')
+    parser.add_argument('--top', type=int, default=50, help='Most frequent sentences kept per profile')
+    parser.add_argument('--profiles', nargs='+', help='Profiles to build (default: all)')
+    parser.add_argument('--max-fetches', type=int, default=4,
+                        help='Maximum concurrent Edge-TTS requests')
+    parser.add_argument('--edge-stub', action='store_true',
+                        help='Use the offline Edge-TTS stand-in (for local testing)')
+    add_profile_arguments(parser)
+    add_effects_arguments(parser)
+    add_logging_arguments(parser)
+    args = parser.parse_args(argv)
+    logging_from_args(args)
+
+    tts = March7thEnhancedTTS(fetcher=fetcher_from_args(args),
+                              profiles=profiles_from_args(args),
+                              voice_profile=args.voice_profile)
+    summary = asyncio.run(build_index(tts, args.phrase_index, args.corpus, args.top, args.profiles))
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Pipelined DSP offload for the async TTS engines
+Base speech is fetched on the event loop while a process pool runs the
+CPU-bound enhancement. Decoded audio crosses the process boundary in shared
+memory instead of being pickled, and only a bounded number of requests may
+sit between the two stages, so fetching pauses when the DSP stage falls
+behind. A shared cancel flag stops an abandoned job between blocks
+"""
+
+import asyncio
+import contextlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def add_pipeline_arguments(parser):
+    """Register the shared DSP pool options on an engine's argument parser."""
+    parser.add_argument('--dsp-workers', type=int,
+                        help='Worker processes for enhancement (default: 1 with --serve, '
+                             'none for a single request; --batch uses --workers)')
+    parser.add_argument('--dsp-queue', type=int,
+                        help='Requests allowed between fetching and DSP before fetching '
+                             'pauses (default: 2 per worker)')
+
+
+class SharedAudio:
+    def __init__(self, frames, name=None):
+        """
+        Mono float32 buffer in a shared memory segment
+
+        The creating side owns the segment and unlinks it on close; the other
+        side attaches by name (see attach) and only closes its mapping.
+
+        Args:
+            frames: Buffer length in samples
+            name: Existing segment to attach to, None to create one
+        """
+        from multiprocessing import shared_memory
+
+        self.owner = name is None
+        self.frames = frames
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(frames, 1) * 4)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray((frames,), dtype=np.float32, buffer=self._shm.buf)
+
+    @classmethod
+    def from_array(cls, audio):
+        shared = cls(len(audio))
+        shared.array[:] = audio
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        name, frames = spec
+        return cls(frames, name)
+
+    @property
+    def spec(self):
+        """Picklable (name, frames) handed to the other process."""
+        return self._shm.name, self.frames
+
+    def write(self, audio, offset=0):
+        """Overwrite the buffer from offset with audio (truncated to fit); returns the frames written."""
+        frames = max(0, min(len(audio), self.frames - offset))
+        self.array[offset:offset + frames] = audio[:frames]
+        return frames
+
+    def write_blocks(self, blocks):
+        """write() blocks one after another, so they are never joined; returns the frames written."""
+        frames = 0
+        for block in blocks:
+            frames += self.write(block, frames)
+        return frames
+
+    def read(self, frames=None):
+        """Copy of the first frames samples, usable after close()."""
+        return self.array[:frames].copy()
+
+    def close(self):
+        # Views into the segment must be gone before the mapping can close
+        self.array = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CancelFlag:
+    def __init__(self, name=None):
+        """
+        One shared byte telling a worker to stop a job at its next stage or block
+
+        Passed to the worker by name, like SharedAudio; the worker hands the
+        attached flag to its BudgetTimer as the cancel flag.
+
+        Args:
+            name: Existing flag to attach to, None to create one
+        """
+        from multiprocessing import shared_memory
+
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=1)
+            self._shm.buf[0] = 0
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def set(self):
+        self._shm.buf[0] = 1
+
+    def is_set(self):
+        return self._shm.buf[0] == 1
+
+    def close(self):
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DSPPipeline:
+    def __init__(self, workers, initializer=None, initargs=(), max_pending=None):
+        """
+        Process pool for the enhancement stage with bounded admission
+
+        Args:
+            workers: Worker processes
+            initializer: Called once in each worker (e.g. to build the engine)
+            initargs: Arguments for initializer
+            max_pending: Requests allowed between fetching and DSP at once
+                (default: 2 per worker, so one can fetch while one is enhanced)
+        """
+        from multiprocessing import resource_tracker
+
+        # Workers must report attached segments to this process's tracker;
+        # one started later in a worker would unlink them when it exits
+        resource_tracker.ensure_running()
+        # Workers start on first use, possibly from the event loop thread while
+        # another thread blocks on stdin; a forked child would inherit that
+        # thread's stdin lock and hang closing stdin. Windows always spawns.
+        context = (multiprocessing.get_context('forkserver')
+                   if 'forkserver' in multiprocessing.get_all_start_methods() else None)
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                                            initargs=initargs, mp_context=context)
+        # Start every worker now rather than on the first requests
+        for _ in range(workers):
+            self.executor.submit(int)
+        self.pending = 0
+        self.peak_pending = 0
+        self.jobs = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self._loop = None
+        self._slots = None
+
+    def _bind_loop(self):
+        # Same rule as EdgeSpeechFetcher: asyncio primitives belong to one loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """
+        Hold one of max_pending places for a request's fetch and enhancement
+
+        Taken before the base speech fetch, so when the pool falls behind
+        new requests wait here instead of piling up decoded audio.
+        """
+        self._bind_loop()
+        if self._slots.locked():
+            self.throttled += 1
+        start = time.perf_counter()
+        async with self._slots:
+            self.wait_seconds += time.perf_counter() - start
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+            try:
+                yield
+            finally:
+                self.pending -= 1
+
+    async def run(self, func, *args):
+        """Run func(*args) in a worker without blocking the event loop."""
+        self.jobs += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "peak_pending": self.peak_pending,
+            "jobs": self.jobs,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 3)
+        }
+
+    def add_metrics(self, metrics):
+        """Expose the admission queue on a tts_metrics.TTSMetrics."""
+        metrics.add_gauge('dsp_queue_depth', "Requests between fetching and DSP", lambda: self.pending)
+        metrics.add_gauge('dsp_queue_limit', "Requests allowed between fetching and DSP", lambda: self.max_pending)
+        metrics.add_gauge('dsp_throttled_total', "Requests that waited for a DSP slot",
+                          lambda: self.throttled, kind='counter')
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency instrumentation for the TTS pipelines
+Records wall and CPU time for every pipeline stage and the peak RSS of each
+process a request ran in, keeps aggregate latency histograms, and wraps
+single runs in cProfile/tracemalloc
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: histogram updates are only serialized within one process
+    fcntl = None
+
+log = logging.getLogger('march7th.profiling')
+
+# Prometheus-style latency buckets in seconds
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    try:
+        import resource
+    except ImportError:
+        # Windows has no resource module; psutil is optional there
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def rss_mb():
+    """Current resident set size of this process in MB, falling back to the peak."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except ImportError:
+        return peak_rss_mb()
+
+
+class StageTimer:
+    def __init__(self):
+        """
+        Collect timings for the stages of one request
+
+        Peak RSS is reported per process, not per stage: ru_maxrss is the
+        high-water mark of the process's whole life, so a stage would only
+        ever show the peak of whatever ran before it.
+        """
+        self.stages = {}
+        # Peak RSS of the DSP pipeline workers that ran stages, from their as_dict()
+        self.worker_peak_rss_mb = None
+        # Stages may finish on the event loop and in offload threads at once
+        self._lock = threading.Lock()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    def progress(self, name, fraction):
+        """Hook called as a block-wise stage advances (see tts_budget.BudgetTimer)."""
+
+    def add(self, name, wall, cpu):
+        """Record a stage measured elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            record = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            record["wall"] += wall
+            record["cpu"] += cpu
+            record["calls"] += 1
+
+    def merge(self, stages):
+        """Fold in the as_dict() stages of another timer, keeping its process's peak RSS apart."""
+        for name, record in stages.items():
+            if name != "total":
+                self.add(name, record["wall"], record["cpu"])
+        peak = stages.get("total", {}).get("peak_rss_mb")
+        if peak is not None:
+            with self._lock:
+                self.worker_peak_rss_mb = max(peak, self.worker_peak_rss_mb or 0.0)
+
+    def as_dict(self):
+        result = {
+            name: {
+                "wall": round(record["wall"], 4),
+                "cpu": round(record["cpu"], 4),
+                "calls": record["calls"]
+            }
+            for name, record in self.stages.items()
+        }
+        result["total"] = {
+            "wall": round(time.perf_counter() - self._start_wall, 4),
+            "cpu": round(time.process_time() - self._start_cpu, 4),
+            # Lifetime peak of this process, not of this request
+            "peak_rss_mb": peak_rss_mb()
+        }
+        if self.worker_peak_rss_mb is not None:
+            result["total"]["worker_peak_rss_mb"] = self.worker_peak_rss_mb
+        return result
+
+
+# Held around every histogram update in this process (engines create a TimingHistogram per result)
+_histogram_lock = threading.Lock()
+
+
+class TimingHistogram:
+    def __init__(self, path):
+        """
+        Aggregate stage latencies across requests into a JSON histogram file
+
+        Updates are serialized across threads and, where fcntl exists, across
+        processes through an exclusive lock on a <path>.lock file next to it
+        (the histogram itself is replaced on every write, so it cannot hold
+        the lock).
+        """
+        self.path = path
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with _histogram_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _empty(self):
+        return {"buckets": [0] * (len(HISTOGRAM_BUCKETS) + 1), "count": 0, "sum": 0.0}
+
+    def record(self, timings):
+        """Add one result's timings and rewrite the file atomically."""
+        with self._locked():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {"bucket_bounds": list(HISTOGRAM_BUCKETS), "stages": {}}
+
+            for name, record in timings.items():
+                stage = data["stages"].setdefault(name, self._empty())
+                wall = record["wall"]
+                index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS) if wall <= bound),
+                             len(HISTOGRAM_BUCKETS))
+                stage["buckets"][index] += 1
+                stage["count"] += 1
+                stage["sum"] += wall
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.timings-')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+
+def add_profiling_arguments(parser):
+    """Register the shared instrumentation options on an engine's argument parser."""
+    parser.add_argument('--timings-file',
+                        help='Aggregate per-stage latency histograms into this JSON file')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Write a cProfile dump for this run to PATH (and a text summary to PATH.txt)')
+    parser.add_argument('--trace-malloc', metavar='PATH',
+                        help='Write a tracemalloc report of the top allocations to PATH')
+
+
+def record_timings(args, result, metrics=None):
+    """Append a result's stage timings to --timings-file and fold it into metrics, if requested."""
+    if getattr(args, 'timings_file', None) and result.get("timings"):
+        TimingHistogram(args.timings_file).record(result["timings"])
+    if metrics:
+        metrics.observe(result)
+
+
+def run_profiled(args, func):
+    """Call func() under cProfile and/or tracemalloc as requested by args."""
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    if args.trace_malloc:
+        import tracemalloc
+        tracemalloc.start(25)
+
+    if profiler:
+        profiler.enable()
+    try:
+        return func()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            import pstats
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+            with open(f"{args.profile}.txt", 'w', encoding='utf-8') as f:
+                f.write(summary.getvalue())
+            log.info("cProfile written to %s", args.profile)
+        if args.trace_malloc:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(args.trace_malloc, 'w', encoding='utf-8') as f:
+                f.write(f"current: {current / 1e6:.1f} MB, peak: {peak / 1e6:.1f} MB\n\n")
+                for stat in snapshot.statistics('lineno')[:40]:
+                    f.write(f"{stat}\n")
+            log.info("tracemalloc report written to %s", args.trace_malloc)
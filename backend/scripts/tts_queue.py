@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Priority request queue with admission control for a TTS worker
+Interactive replies are served before pre-render batches. A request is
+rejected when the queue is full of equal or higher priority work, or when
+its predicted wait is already past the limit; queued batch work is shed to
+make room for interactive requests, and requests that waited too long are
+dropped rather than synthesized for nobody
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+log = logging.getLogger('march7th.queue')
+
+# Highest priority first
+PRIORITIES = ('interactive', 'batch')
+
+DROP_REASONS = ('rejected', 'shed', 'expired', 'cancelled')
+
+
+def add_queue_arguments(parser):
+    """Register the shared request queue options on an engine's argument parser."""
+    parser.add_argument('--max-active', type=int, default=1,
+                        help='Serve-mode requests synthesized at once (default: 1)')
+    parser.add_argument('--max-queue', type=int, default=32,
+                        help='Serve-mode requests allowed to wait; beyond it batch work is shed '
+                             'and new requests are rejected (default: 32)')
+    parser.add_argument('--max-queue-wait-ms', type=float,
+                        help='Drop requests that waited longer, and reject those predicted to')
+
+
+def queue_from_args(args):
+    return RequestQueue(args.max_queue, args.max_queue_wait_ms, args.max_active)
+
+
+class QueueRejected(Exception):
+    pass
+
+
+class RequestQueue:
+    def __init__(self, max_depth=32, max_wait_ms=None, workers=1, alpha=0.3):
+        """
+        Requests waiting for one of a worker's synthesis slots
+
+        Items leave by priority, then arrival. The service time of finished
+        requests is tracked as a moving average to predict how long a new
+        request would wait.
+
+        Args:
+            max_depth: Requests allowed to wait at once
+            max_wait_ms: Longest acceptable wait, None for no limit
+            workers: Requests served at once (the worker's dispatch threads)
+            alpha: Weight of the newest service time in the average
+        """
+        self.max_depth = max_depth
+        self.max_wait = None if max_wait_ms is None else max_wait_ms / 1000.0
+        self.workers = workers
+        self.alpha = alpha
+        self.service_seconds = None
+        self._heap = []
+        self._entries = {}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self.closed = False
+        self.active = 0
+        self.peak_depth = 0
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.completed = 0
+        self.dropped = dict.fromkeys(DROP_REASONS, 0)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.dequeued = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def depth(self, priority=None):
+        with self._cond:
+            return sum(1 for entry in self._entries.values()
+                       if priority is None or entry[0] == PRIORITIES.index(priority))
+
+    def predicted_wait(self, rank):
+        """Seconds a request of this priority rank would wait right now, None before any estimate."""
+        if self.service_seconds is None:
+            return None
+        ahead = sum(1 for entry in self._entries.values() if entry[0] <= rank)
+        return max(ahead + self.active - self.workers + 1, 0) / self.workers * self.service_seconds
+
+    def put(self, item, priority='interactive', key=None):
+        """
+        Admit item, or raise QueueRejected
+
+        Args:
+            item: Anything; handed back by get()
+            priority: One of PRIORITIES
+            key: Optional id for cancel()
+
+        Returns:
+            Items shed to make room, each of which still needs an answer
+        """
+        rank = PRIORITIES.index(priority)
+        shed = []
+        with self._cond:
+            if self.closed:
+                raise QueueRejected("Worker is shutting down")
+            predicted = self.predicted_wait(rank)
+            if self.max_wait is not None and predicted is not None and predicted > self.max_wait:
+                self.dropped['rejected'] += 1
+                raise QueueRejected(f"Overloaded: predicted wait {predicted * 1000:.0f} ms exceeds "
+                                    f"{self.max_wait * 1000:.0f} ms")
+            if len(self._entries) >= self.max_depth:
+                # Make room by dropping the newest request of the lowest priority below this one
+                victim = max((entry for entry in self._entries.values() if entry[0] > rank), default=None)
+                if victim is None:
+                    self.dropped['rejected'] += 1
+                    raise QueueRejected(f"Overloaded: {len(self._entries)} requests already waiting")
+                shed.append(victim[3])
+                self._remove(victim)
+                self.dropped['shed'] += 1
+                log.warning("Shed a queued %s request for an %s one", PRIORITIES[victim[0]], priority)
+            entry = [rank, next(self._order), time.perf_counter(), item, key]
+            heapq.heappush(self._heap, entry)
+            self._entries[key if key is not None else id(entry)] = entry
+            self.admitted[priority] += 1
+            self.peak_depth = max(self.peak_depth, len(self._entries))
+            self._cond.notify()
+        return shed
+
+    def _remove(self, entry):
+        self._entries.pop(entry[4] if entry[4] is not None else id(entry))
+        # Lazily deleted from the heap
+        entry[3] = None
+
+    def get(self):
+        """
+        Next item by priority, then arrival, as (item, seconds waited)
+
+        Blocks while the queue is empty; returns None once it is closed and
+        drained. The caller reports the outcome with finish().
+        """
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][3] is None:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    entry = heapq.heappop(self._heap)
+                    self._entries.pop(entry[4] if entry[4] is not None else id(entry))
+                    waited = time.perf_counter() - entry[2]
+                    self.active += 1
+                    self.dequeued += 1
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+                    return entry[3], waited
+                if self.closed:
+                    return None
+                self._cond.wait()
+
+    def expired(self, waited):
+        """Whether a request that waited this long is too late to be worth synthesizing."""
+        return self.max_wait is not None and waited > self.max_wait
+
+    def finish(self, service_seconds=None, dropped=None):
+        """Record the end of an item returned by get(): served in service_seconds, or dropped."""
+        with self._cond:
+            self.active -= 1
+            if dropped:
+                self.dropped[dropped] += 1
+            else:
+                self.completed += 1
+                if service_seconds is not None:
+                    previous = self.service_seconds
+                    self.service_seconds = (service_seconds if previous is None
+                                            else previous + self.alpha * (service_seconds - previous))
+            self._cond.notify_all()
+
+    def cancel(self, key):
+        """Remove a waiting item by key; returns it, or None if it is not waiting."""
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            item = entry[3]
+            self._remove(entry)
+            self.dropped['cancelled'] += 1
+            return item
+
+    def join(self):
+        """Wait until nothing is queued or being served."""
+        with self._cond:
+            while self._entries or self.active:
+                self._cond.wait()
+
+    def close(self):
+        """Refuse new items; get() returns None once the rest are served."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            depth = dict.fromkeys(PRIORITIES, 0)
+            for entry in self._entries.values():
+                depth[PRIORITIES[entry[0]]] += 1
+            return {
+                "depth": len(self._entries),
+                "depth_by_priority": depth,
+                "peak_depth": self.peak_depth,
+                "active": self.active,
+                "max_active": self.workers,
+                "max_depth": self.max_depth,
+                "max_wait_ms": None if self.max_wait is None else round(self.max_wait * 1000, 1),
+                "admitted": dict(self.admitted),
+                "completed": self.completed,
+                "dropped": dict(self.dropped),
+                "mean_wait_ms": round(self.wait_total / self.dequeued * 1000, 1) if self.dequeued else 0.0,
+                "max_wait_seen_ms": round(self.wait_max * 1000, 1),
+                "service_ms": None if self.service_seconds is None else round(self.service_seconds * 1000, 1)
+            }
+
+    def add_metrics(self, metrics):
+        """Expose depth and drop counts on a tts_metrics.TTSMetrics."""
+        metrics.add_gauge('queue_depth', "Requests waiting in the worker queue", lambda: len(self._entries))
+        metrics.add_gauge('queue_active', "Requests being synthesized", lambda: self.active)
+        for reason in DROP_REASONS:
+            metrics.add_gauge(f'queue_{reason}_total', f"Requests dropped from the queue ({reason})",
+                              lambda reason=reason: self.dropped[reason], kind='counter')
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Persistent TTS worker loop
+Reads JSON-line requests from stdin or a Unix socket and answers each one with
+the same result dict the one-shot CLI prints, keeping the engine resident.
+Streamed requests may also take their text incrementally, as later "text"
+lines, while earlier sentences are already being synthesized. Requests wait
+in a priority queue with admission control (see tts_queue) and can be
+cancelled by id while queued or running
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from tts_queue import PRIORITIES, QueueRejected, RequestQueue
+
+log = logging.getLogger('march7th.server')
+
+
+def _error_result(message):
+    return {
+        "success": False,
+        "error": message,
+        "output_path": None
+    }
+
+
+def _dropped_result(reason, message):
+    return dict(_error_result(message), dropped=reason)
+
+
+class Job:
+    def __init__(self, request, priority):
+        """A queued or running request and the flag that cancels it."""
+        self.request = request
+        self.priority = priority
+        self.id = request.get("id")
+        self.cancel = threading.Event()
+        # Set once the result has been sent, not merely computed
+        self.answered = threading.Event()
+        self.future = None
+        self._lock = threading.Lock()
+
+    def run_on(self, coroutine, loop):
+        """Run the handler's coroutine on loop; returns its concurrent future."""
+        with self._lock:
+            self.future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+            if self.cancel.is_set():
+                self.future.cancel()
+        return self.future
+
+    def stop(self):
+        """Cancel the running request: its stages see the flag, its coroutine is cancelled."""
+        with self._lock:
+            self.cancel.set()
+            if self.future is not None:
+                self.future.cancel()
+
+
+class TextDeltas:
+    def __init__(self, loop):
+        """
+        Text of an incremental request, fed from the protocol thread
+
+        Iterated with async for on the worker loop; push() and end() may be
+        called from any thread.
+        """
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.ended = False
+
+    def push(self, text):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+    def end(self):
+        if not self.ended:
+            self.ended = True
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        text = await self.queue.get()
+        if text is None:
+            raise StopAsyncIteration
+        return text
+
+
+class TTSWorker:
+    def __init__(self, make_handler, queue=None):
+        """
+        Build the engine once and keep it warm between requests
+
+        Coroutine handlers run on an event loop in a background thread, so
+        incremental requests keep synthesizing while further lines are read.
+        Synthesis requests are queued and answered by queue.workers dispatch
+        threads as slots free up, interactive before batch work; every
+        request is answered by one result line carrying its id.
+
+        Args:
+            make_handler: Callable returning a request handler. The handler takes
+                a request dict and an emit callback for intermediate events, and
+                returns a result dict (or a coroutine of one). Incremental
+                requests carry their TextDeltas under "deltas" instead of "text";
+                every request carries a threading.Event under "cancel".
+            queue: RequestQueue for admission control (default: one slot, 32 waiting)
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='tts-loop', daemon=True)
+        self._thread.start()
+        self.handler = make_handler()
+        self.queue = queue if queue is not None else RequestQueue()
+        self.running = True
+        self.writer = None
+        self._send_lock = threading.Lock()
+        # Incremental requests still taking text, by request id
+        self.inputs = {}
+        self._open = {}
+        # Queued and running jobs not yet answered, by request id
+        self.jobs = {}
+        self._dispatchers = [threading.Thread(target=self.dispatch, name=f'tts-dispatch-{index}', daemon=True)
+                             for index in range(self.queue.workers)]
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
+
+    def close(self):
+        self.queue.close()
+        for dispatcher in self._dispatchers:
+            dispatcher.join()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def handle_line(self, line):
+        """Process one request line and return the immediate response dict, or None."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return _error_result(f"Invalid JSON request: {e}")
+
+        if not isinstance(request, dict):
+            return _error_result("Request must be a JSON object")
+
+        op = request.get("op", "synthesize")
+        if op == "ping":
+            result = {"success": True, "op": "pong"}
+        elif op == "shutdown":
+            self.running = False
+            result = {"success": True, "op": "shutdown"}
+        elif op == "synthesize" and request.get("incremental"):
+            result = self.open_incremental(request)
+        elif op == "synthesize":
+            result = self.synthesize(request)
+        elif op == "text":
+            result = self.append_text(request)
+        elif op == "batch":
+            result = self.synthesize_batch(request)
+        elif op == "cancel":
+            result = self.cancel(request)
+        elif op == "stats":
+            result = {"success": True, "op": "stats", "queue": self.queue.stats()}
+        else:
+            result = _error_result(f"Unknown op: {op}")
+
+        if result is not None and "id" in request:
+            result = dict(result, id=request["id"])
+        return result
+
+    def send(self, message):
+        # Incremental requests answer from the loop thread
+        with self._send_lock:
+            self.writer.write(json.dumps(message, ensure_ascii=False) + "\n")
+            self.writer.flush()
+
+    @staticmethod
+    def validate(request):
+        """Error message for a malformed synthesis request, or None."""
+        if not isinstance(request, dict) or not request.get("text") or not request.get("output"):
+            return "Request requires 'text' and 'output'"
+        if request["output"] == "-":
+            # stdout carries the JSON-line protocol (or nothing, in socket mode)
+            return "Serve mode cannot stream audio to stdout, use a unix: or tcp: output"
+        return None
+
+    def synthesize(self, request):
+        error = self.validate(request)
+        if error:
+            return _error_result(error)
+        return self.submit(request)
+
+    def synthesize_batch(self, request):
+        """Several requests answered together, e.g. the replies of a group chat."""
+        items = request.get("requests")
+        if not isinstance(items, list) or not items:
+            return _error_result("Batch request requires a non-empty 'requests' list")
+        for item in items:
+            error = self.validate(item)
+            if error:
+                return _error_result(error)
+        return self.submit(request)
+
+    def emitter(self, request):
+        def emit(event):
+            """Send an intermediate event (e.g. a streamed segment) ahead of the result."""
+            if "id" in request:
+                event = dict(event, id=request["id"])
+            self.send(event)
+        return emit
+
+    def answer(self, job, result):
+        if job.id is not None:
+            result = dict(result, id=job.id)
+            self.jobs.pop(job.id, None)
+        try:
+            self.send(result)
+        except (OSError, ValueError) as e:
+            # The client went away; later requests may still come from the next one
+            log.warning("Could not send the result of request %s: %s", job.id, e)
+        finally:
+            job.answered.set()
+
+    def submit(self, request):
+        """
+        Queue a synthesis request; it is answered once a dispatcher has run it
+
+        "priority" is "interactive" (the default) or "batch". A request the
+        queue turns away is answered at once with "dropped": "rejected".
+        """
+        priority = request.get("priority", PRIORITIES[0])
+        if priority not in PRIORITIES:
+            return _error_result(f"Unknown priority: {priority}")
+        request_id = request.get("id")
+        if request_id is not None and request_id in self.jobs:
+            return _error_result("A request with this 'id' is already queued or running")
+        job = Job(request, priority)
+        if request_id is not None:
+            # Registered first: a dispatcher may answer the job as soon as it is queued
+            self.jobs[request_id] = job
+        try:
+            shed = self.queue.put(job, priority, request_id)
+        except QueueRejected as e:
+            self.jobs.pop(request_id, None)
+            return _dropped_result("rejected", str(e))
+        for victim in shed:
+            self.answer(victim, _dropped_result("shed", "Dropped to make room for a higher priority request"))
+        return None
+
+    def dispatch(self):
+        """Dispatcher thread: run queued jobs until the queue is closed and drained."""
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            job, waited = entry
+            if self.queue.expired(waited):
+                self.queue.finish(dropped="expired")
+                self.answer(job, _dropped_result("expired", f"Waited {waited * 1000:.0f} ms in the queue"))
+                continue
+            if job.cancel.is_set():
+                # Cancelled between leaving the queue and starting
+                self.queue.finish(dropped="cancelled")
+                self.answer(job, _dropped_result("cancelled", "Request cancelled"))
+                continue
+            start = time.perf_counter()
+            result = self.run_handler(job)
+            if job.cancel.is_set() and not result.get("success"):
+                # Engines report the stage they stopped at as an error
+                self.queue.finish(dropped="cancelled")
+                result = _dropped_result("cancelled", result.get("error") or "Request cancelled")
+            else:
+                self.queue.finish(time.perf_counter() - start)
+            result = dict(result, queue={"priority": job.priority, "wait_ms": round(waited * 1000, 1)})
+            self.answer(job, result)
+
+    def run_handler(self, job):
+        try:
+            result = self.handler(dict(job.request, cancel=job.cancel), self.emitter(job.request))
+            if asyncio.iscoroutine(result):
+                result = job.run_on(result, self.loop).result()
+            return result
+        except concurrent.futures.CancelledError:
+            return _dropped_result("cancelled", "Request cancelled")
+        except Exception as e:
+            return _error_result(str(e))
+
+    def cancel(self, request):
+        """
+        Cancel a request by id
+
+        A queued request is answered at once with "dropped": "cancelled"; a
+        running one stops at its next stage and is answered the same way
+        (engines that cannot interrupt a stage still finish it).
+        """
+        request_id = request.get("id")
+        job = self.queue.cancel(request_id) if request_id is not None else None
+        if job is not None:
+            self.answer(job, _dropped_result("cancelled", "Request cancelled while queued"))
+            return {"success": True, "op": "cancel", "state": "queued"}
+        job = self.jobs.get(request_id)
+        if job is None:
+            return _error_result("No queued or running request with this 'id'")
+        job.stop()
+        return {"success": True, "op": "cancel", "state": "running"}
+
+    def open_incremental(self, request):
+        """
+        Start a streamed request whose text follows in "text" lines
+
+        Nothing is answered now: segment events go out as sentences complete
+        and the result once the request's text has ended.
+        """
+        request_id = request.get("id")
+        if request_id is None or request_id in self.jobs:
+            return _error_result("Incremental request requires a new 'id'")
+        if not request.get("output"):
+            return _error_result("Request requires 'output'")
+        if request["output"] == "-":
+            return _error_result("Serve mode cannot stream audio to stdout, use a unix: or tcp: output")
+
+        if not asyncio.iscoroutinefunction(self.handler):
+            return _error_result("This engine does not accept incremental text")
+
+        # The reply is being written as it is generated: it bypasses the queue
+        job = Job(request, PRIORITIES[0])
+        deltas = TextDeltas(self.loop)
+        if request.get("text"):
+            deltas.push(request["text"])
+        if request.get("end"):
+            deltas.end()
+        coroutine = self.handler(dict(request, stream=True, deltas=deltas, cancel=job.cancel),
+                                 self.emitter(request))
+        self.inputs[request_id] = deltas
+        self._open[request_id] = self.jobs[request_id] = job
+
+        def finished(future):
+            try:
+                result = future.result()
+                if job.cancel.is_set() and not result.get("success"):
+                    result = _dropped_result("cancelled", result.get("error") or "Request cancelled")
+            except concurrent.futures.CancelledError:
+                result = _dropped_result("cancelled", "Request cancelled")
+            except Exception as e:
+                result = _error_result(str(e))
+            self.answer(job, result)
+            self.inputs.pop(request_id, None)
+            self._open.pop(request_id, None)
+
+        job.run_on(coroutine, self.loop).add_done_callback(finished)
+        return None
+
+    def append_text(self, request):
+        """Next piece of an incremental request's text; "end": true closes it."""
+        deltas = self.inputs.get(request.get("id"))
+        if deltas is None or deltas.ended:
+            return _error_result("No incremental request with this 'id' is taking text")
+        if request.get("text"):
+            deltas.push(request["text"])
+        if request.get("end"):
+            deltas.end()
+        return None
+
+    def finish_incremental(self):
+        """End the text of every open incremental request and wait for their results."""
+        for deltas in list(self.inputs.values()):
+            deltas.end()
+        for job in list(self._open.values()):
+            job.answered.wait()
+
+    def serve_stream(self, reader, writer):
+        """Answer requests from a line-oriented reader until EOF or shutdown, then drain the queue."""
+        self.writer = writer
+        try:
+            for line in reader:
+                if not line.strip():
+                    continue
+                response = self.handle_line(line)
+                if response is not None:
+                    self.send(response)
+                if not self.running:
+                    break
+        finally:
+            self.finish_incremental()
+            self.queue.join()
+
+    def serve_socket(self, socket_path):
+        """Accept connections on a Unix socket, one client at a time."""
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Unix sockets are not supported on this platform, use stdin mode")
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(socket_path)
+            server.listen()
+            log.info("TTS worker listening on %s", socket_path)
+            while self.running:
+                conn, _ = server.accept()
+                with conn, conn.makefile("r", encoding="utf-8") as reader, \
+                        conn.makefile("w", encoding="utf-8") as writer:
+                    self.serve_stream(reader, writer)
+        finally:
+            server.close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def serve(make_handler, socket_path=None, queue=None):
+    """Run a resident TTS worker on stdin/stdout or on a Unix socket."""
+    # Engines print progress from several threads; stdout belongs to the protocol
+    protocol, sys.stdout = sys.stdout, sys.stderr
+    try:
+        worker = TTSWorker(make_handler, queue)
+        log.info("TTS worker ready")
+        try:
+            if socket_path:
+                worker.serve_socket(socket_path)
+            else:
+                worker.serve_stream(sys.stdin, protocol)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.close()
+    finally:
+        sys.stdout = protocol
+    return 0
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Persistent base speech sessions
+Starts the external synthesizer (Windows SAPI through PowerShell) once and
+keeps it running, sending it one utterance per JSON line over a pipe instead
+of launching PowerShell, loading System.Speech and picking a voice for every
+request. Crashed or hung sessions are restarted, and a pool of sessions
+serves concurrent requests
+"""
+
+import base64
+import json
+import logging
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+log = logging.getLogger('march7th.speech')
+
+STUB_SCRIPT = Path(__file__).resolve().parent / 'speech_session_stub.py'
+
+# Runs for the life of the session. Replies go to stdout one JSON line each,
+# so nothing else may be written there; {voices} is filled in by sapi_command
+SAPI_HOST_SCRIPT = r'''
+$ErrorActionPreference = 'Stop'
+$utf8 = New-Object System.Text.UTF8Encoding $false
+[Console]::InputEncoding = $utf8
+[Console]::OutputEncoding = $utf8
+Add-Type -AssemblyName System.Speech
+$synth = New-Object System.Speech.Synthesis.SpeechSynthesizer
+$synth.Volume = 100
+
+# Pick the voice once: preferred names in order, then any female voice
+$installed = $synth.GetInstalledVoices() | ForEach-Object { $_.VoiceInfo }
+$selected = $null
+foreach ($preferred in @({voices})) {
+    $selected = $installed | Where-Object { $_.Name -eq $preferred } | Select-Object -First 1
+    if ($selected) { break }
+}
+if (-not $selected) {
+    $selected = $installed | Where-Object { $_.Gender -eq 'Female' } | Select-Object -First 1
+}
+if ($selected) { $synth.SelectVoice($selected.Name) }
+[Console]::Out.WriteLine((@{ ready = $true; voice = $synth.Voice.Name } | ConvertTo-Json -Compress))
+
+while ($true) {
+    $line = [Console]::In.ReadLine()
+    if ($line -eq $null) { break }
+    try {
+        $request = $line | ConvertFrom-Json
+        $stream = New-Object System.IO.MemoryStream
+        $synth.SetOutputToWaveStream($stream)
+        $synth.Rate = [Math]::Max(-10, [Math]::Min(10, [int]$request.rate))
+        $synth.Speak([string]$request.text)
+        $synth.SetOutputToNull()
+        $reply = @{ ok = $true; audio = [Convert]::ToBase64String($stream.ToArray()) }
+        $stream.Dispose()
+    } catch {
+        $reply = @{ ok = $false; error = $_.Exception.Message }
+    }
+    [Console]::Out.WriteLine(($reply | ConvertTo-Json -Compress))
+}
+$synth.Dispose()
+'''
+
+
+def add_speech_arguments(parser):
+    """Register the shared base speech session options on an engine's argument parser."""
+    parser.add_argument('--speech-sessions', type=int,
+                        help='Resident SAPI sessions for concurrent requests (default: 1, '
+                             '--batch uses --workers)')
+    parser.add_argument('--speech-timeout', type=float, default=60.0,
+                        help='Seconds to wait for one utterance before the session is restarted')
+    parser.add_argument('--speech-stub', action='store_true',
+                        help='Use the local SAPI stand-in instead of PowerShell (for testing off Windows)')
+    parser.add_argument('--speech-command',
+                        help='Run this command as the session instead of PowerShell (same JSON-line protocol)')
+
+
+def sapi_command(voices=()):
+    """PowerShell command line for a SAPI session preferring the named voices."""
+    names = ', '.join("'" + name.replace("'", "''") + "'" for name in voices)
+    script = SAPI_HOST_SCRIPT.replace('{voices}', names)
+    # -EncodedCommand takes UTF-16LE base64, so the script needs no quoting
+    encoded = base64.b64encode(script.encode('utf-16-le')).decode('ascii')
+    return ['powershell.exe', '-NoProfile', '-NonInteractive', '-ExecutionPolicy', 'Bypass',
+            '-EncodedCommand', encoded]
+
+
+def speech_options_from_args(args, voices=(), sessions=None):
+    """Picklable SpeechSessionPool keyword arguments, e.g. for a worker initializer."""
+    if args.speech_command:
+        command = shlex.split(args.speech_command)
+    elif args.speech_stub:
+        command = [sys.executable, str(STUB_SCRIPT)]
+    else:
+        command = sapi_command(voices)
+    return {
+        "command": command,
+        "size": sessions or args.speech_sessions or 1,
+        "timeout": args.speech_timeout
+    }
+
+
+class SpeechSessionError(RuntimeError):
+    """The session process died, hung or broke the protocol."""
+
+
+class SpeechSession:
+    def __init__(self, command, timeout=60.0, startup_timeout=30.0):
+        """
+        One resident synthesizer process
+
+        The process is started on first use. speak() writes a request line
+        ({"text", "rate"}) and reads one reply line ({"ok", "audio"} with the
+        WAV base64-encoded, or {"ok": false, "error"}).
+
+        Args:
+            command: Argument list starting the session (see sapi_command)
+            timeout: Seconds to wait for one utterance
+            startup_timeout: Seconds to wait for the ready line
+        """
+        self.command = command
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.voice = None
+        self.starts = 0
+        self.utterances = 0
+        self._process = None
+        self._replies = None
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        self.stop()
+        start = time.perf_counter()
+        self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE, text=True, encoding='utf-8', bufsize=1)
+        self.starts += 1
+        # Reader threads keep either pipe from filling up and let reads time out
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read_replies, args=(self._process.stdout, self._replies),
+                         daemon=True).start()
+        threading.Thread(target=self._read_diagnostics, args=(self._process.stderr,), daemon=True).start()
+        ready = self._reply(self.startup_timeout)
+        if not ready.get("ready"):
+            raise SpeechSessionError(f"Speech session did not start: {ready}")
+        self.voice = ready.get("voice")
+        log.info("Speech session %d started in %.2fs (voice: %s)", self._process.pid,
+                 time.perf_counter() - start, self.voice)
+
+    def stop(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            # Closing stdin ends the request loop; kill if it does not exit
+            process.stdin.close()
+            process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+    @staticmethod
+    def _read_replies(stream, replies):
+        for line in stream:
+            if line.startswith('{'):
+                replies.put(line)
+        replies.put(None)
+
+    @staticmethod
+    def _read_diagnostics(stream):
+        for line in stream:
+            log.debug("speech session: %s", line.rstrip())
+
+    def _reply(self, timeout):
+        try:
+            line = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            raise SpeechSessionError(f"Speech session gave no reply within {timeout:.0f}s") from None
+        if line is None:
+            raise SpeechSessionError(f"Speech session exited (code {self._process.wait()})")
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            raise SpeechSessionError(f"Unreadable speech session reply: {e}") from None
+
+    def speak(self, text, rate=0, retries=1):
+        """
+        Synthesize text with the resident voice
+
+        A session that died or stopped answering is restarted and the
+        utterance retried; an utterance the synthesizer itself rejects is not.
+
+        Args:
+            text: Text to speak
+            rate: SAPI speaking rate, -10 to 10
+            retries: Restarts allowed for this utterance
+
+        Returns:
+            WAV bytes
+        """
+        request = json.dumps({"text": text, "rate": max(-10, min(10, int(rate)))}, ensure_ascii=False)
+        for attempt in range(retries + 1):
+            try:
+                if not self.alive:
+                    if self._process is not None:
+                        log.warning("Speech session exited (code %s), restarting", self._process.returncode)
+                    self.start()
+                self._process.stdin.write(request + '\n')
+                self._process.stdin.flush()
+                reply = self._reply(self.timeout)
+            except (OSError, SpeechSessionError) as e:
+                self.stop()
+                if attempt == retries:
+                    raise SpeechSessionError(f"Base speech failed: {e}") from None
+                log.warning("Speech session failed (%s), restarting", e)
+                continue
+            if not reply.get("ok"):
+                raise RuntimeError(f"SAPI TTS failed: {reply.get('error')}")
+            self.utterances += 1
+            wav_bytes = base64.b64decode(reply["audio"])
+            if not wav_bytes.startswith(b'RIFF'):
+                raise RuntimeError("Base speech was not returned by SAPI")
+            return wav_bytes
+
+    def close(self):
+        self.stop()
+
+
+class SpeechSessionPool:
+    def __init__(self, command, size=1, timeout=60.0):
+        """
+        Fixed set of sessions shared by concurrent callers
+
+        speak() borrows an idle session and blocks while all of them are
+        busy; sessions start on first use.
+
+        Args:
+            command: Argument list starting one session
+            size: Number of sessions
+            timeout: Per-utterance timeout (see SpeechSession)
+        """
+        self.sessions = [SpeechSession(command, timeout) for _ in range(size)]
+        self._idle = queue.Queue()
+        for session in self.sessions:
+            self._idle.put(session)
+        self.waits = 0
+
+    def speak(self, text, rate=0):
+        """WAV bytes for text from the next idle session (see SpeechSession.speak)."""
+        if self._idle.empty():
+            self.waits += 1
+        session = self._idle.get()
+        try:
+            return session.speak(text, rate)
+        finally:
+            self._idle.put(session)
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "running": sum(session.alive for session in self.sessions),
+            # Starts beyond each session's first are restarts after a crash or hang
+            "restarts": sum(max(session.starts - 1, 0) for session in self.sessions),
+            "utterances": sum(session.utterances for session in self.sessions),
+            "waits": self.waits
+        }
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
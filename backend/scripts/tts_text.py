@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Text segmentation helpers for chunked synthesis
+Splits replies into sentences, and over-long sentences into clauses, so
+each piece can be synthesized and played as soon as it is ready, also while
+the reply is still arriving in pieces
+"""
+
+import re
+
+SENTENCE_END = re.compile(r'(?:(?<=[.!?…。！？])|(?<=[.!?…。！？]["\')\]]))\s+')
+CLAUSE_END = re.compile(r'(?<=[,;:—，；])\s+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def _split_long(sentence, max_chars):
+    """Break a sentence at clause punctuation, then at spaces, to fit max_chars."""
+    pieces = []
+    current = ''
+    for clause in CLAUSE_END.split(sentence):
+        candidate = f"{current} {clause}".strip()
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        # A single clause can still be too long; fall back to word boundaries
+        while len(clause) > max_chars:
+            cut = clause.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        current = clause
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_sentences(text, max_chars=200):
+    """
+    Split text into speakable segments
+
+    Args:
+        text: Full reply text
+        max_chars: Longest segment sent to the synthesizer in one piece
+
+    Returns:
+        List of non-empty segments in reading order
+    """
+    segments = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = ' '.join(sentence.split())
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+        else:
+            segments.extend(_split_long(sentence, max_chars))
+    return segments
+
+
+class SentenceBuffer:
+    def __init__(self, max_chars=200):
+        """
+        split_sentences for text that arrives as deltas (e.g. a streamed LLM reply)
+
+        feed() only returns segments later text cannot change: sentences whose
+        end punctuation is already followed by whitespace, and the leading
+        pieces of a sentence that has grown past max_chars. flush() returns
+        the rest once the text is complete. All returned segments together
+        equal split_sentences() of the whole text, however it was cut up.
+
+        Args:
+            max_chars: Longest segment, as for split_sentences
+        """
+        self.max_chars = max_chars
+        self.pending = ''
+
+    def feed(self, delta):
+        """Add a piece of text; returns the segments completed by it."""
+        # Runs of whitespace never change where text splits, and one space
+        # keeps the offsets of _split_long's pieces easy to follow
+        self.pending = WHITESPACE.sub(' ', self.pending + delta)
+        segments = []
+        boundary = None
+        for boundary in SENTENCE_END.finditer(self.pending):
+            pass
+        if boundary:
+            segments = split_sentences(self.pending[:boundary.start()], self.max_chars)
+            self.pending = self.pending[boundary.end():]
+
+        # The word after the last space may still grow, so it is left out
+        cut = self.pending.rfind(' ')
+        stable = self.pending[:cut].strip() if cut > 0 else ''
+        if len(stable) > self.max_chars:
+            pieces = _split_long(stable, self.max_chars)
+            # The last piece can still take more words; keep it pending
+            segments.extend(pieces[:-1])
+            start = self.pending.index(stable) + len(stable) - len(pieces[-1])
+            self.pending = self.pending[start:]
+        return segments
+
+    def flush(self):
+        """Segments left once the text is complete."""
+        segments = split_sentences(self.pending, self.max_chars)
+        self.pending = ''
+        return segments
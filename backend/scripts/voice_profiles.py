@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Per-character voice profiles for the Edge-TTS engine
+Loads Edge-TTS prosody and effects-chain settings for every character from
+backend/config/voice_profiles.json, compiles each chain's filters, tremolo
+tables and delay lines once, and picks up edits to the file without a
+worker restart
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+log = logging.getLogger('march7th.profiles')
+
+PROFILES_PATH = Path(os.environ.get(
+    'MARCH7TH_VOICE_PROFILES',
+    Path(__file__).resolve().parent.parent / 'config' / 'voice_profiles.json'
+))
+DEFAULT_PROFILE = 'march7th'
+
+# Edge-TTS streams 24 kHz audio; the offline stub produces 22.05 kHz
+DEFAULT_SAMPLE_RATES = (24000, 22050)
+
+# Edge-TTS takes pitch offsets in Hz; percentages in the config are taken
+# relative to this typical speaking pitch of its neural voices
+EDGE_REFERENCE_PITCH_HZ = 200.0
+
+# Used when the config file is missing: the original March 7th voice
+BUILTIN_PROFILES = {
+    DEFAULT_PROFILE: {
+        "character": "March 7th",
+        "edge": {"voice": "en-US-JennyNeural", "rate": 1.15, "pitch": "+15%", "volume": 95},
+        "preset": "march7th_enhanced"
+    }
+}
+
+
+def add_profile_arguments(parser):
+    """Register the shared voice profile options on an engine's argument parser."""
+    parser.add_argument('--voice-profile',
+                        help='Voice profile (key or character name) from the profiles config')
+    parser.add_argument('--voice-profiles', default=str(PROFILES_PATH),
+                        help='Voice profiles JSON (default: $MARCH7TH_VOICE_PROFILES or backend/config)')
+
+
+def profiles_from_args(args):
+    """VoiceProfileRegistry for the parsed --voice-profiles and --pitch-backend options."""
+    return VoiceProfileRegistry(args.voice_profiles, pitch_backend=args.pitch_backend)
+
+
+class VoiceProfile:
+    def __init__(self, name, config, sample_rates=DEFAULT_SAMPLE_RATES, pitch_backend=None):
+        """
+        Build one character's voice and compile its effects chains
+
+        Args:
+            name: Profile key
+            config: Dict with "character", "edge" prosody, either "effects"
+                (VoiceEffectsChain arguments) or a voice_effects "preset", and
+                optional catchphrases under "phrases"
+            sample_rates: Rates to compile the chains for up front
+            pitch_backend: Optional voice_effects pitch backend overriding the
+                profile's own (e.g. from --pitch-backend)
+        """
+        from voice_effects import PRESETS, VoiceEffectsChain
+
+        self.name = name
+        self.config = config
+        self.character = config.get("character", name)
+        edge = config.get("edge", {})
+        self.voice = edge.get("voice", "en-US-JennyNeural")
+        self.rate = edge.get("rate", 1.0)
+        self.pitch = edge.get("pitch", "+0%")
+        self.volume = edge.get("volume", 100)
+        # Keyword arguments for edge_tts.Communicate
+        self.prosody = edge_prosody(self.rate, self.pitch, self.volume)
+        # Catchphrases always precomputed into the phrase index (see tts_phrases)
+        self.phrases = list(config.get("phrases", []))
+
+        effects = dict(PRESETS[config["preset"]]) if "preset" in config else {}
+        effects.update(config.get("effects", {}))
+        if pitch_backend:
+            effects["pitch_backend"] = pitch_backend
+        self.effects = VoiceEffectsChain(**effects).compile(sample_rates)
+        # Reduced scheduler tier: no pitch shift or brightness, so the STFT pass is skipped
+        self.reduced_effects = VoiceEffectsChain(**dict(effects, n_steps=0, brightness=0.0)).compile(sample_rates)
+        # Cache keys and phrase renders change whenever the voice is edited
+        voice = {key: value for key, value in config.items() if key != "phrases"}
+        if pitch_backend:
+            voice["pitch_backend"] = pitch_backend
+        self.fingerprint = hashlib.sha256(
+            json.dumps(voice, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _signed(value, unit):
+    return f"{int(round(value)):+d}{unit}"
+
+
+def edge_prosody(rate=1.0, pitch="+0%", volume=100):
+    """
+    edge_tts.Communicate rate/pitch/volume arguments for a profile's prosody
+
+    Edge-TTS escapes the text it is given, so prosody cannot be sent as SSML;
+    it only accepts relative offsets ("+15%", "+30Hz").
+
+    Args:
+        rate: Speaking rate multiplier (1.15 is 15% faster) or an offset string
+        pitch: Offset string in % (of EDGE_REFERENCE_PITCH_HZ) or Hz; a bare
+            number is taken as a percentage (15 is "+15%")
+        volume: Loudness in percent of full scale (95 is 5% quieter) or an offset string
+
+    Raises:
+        ValueError: pitch is neither a number nor a "%" / "Hz" offset string
+    """
+    if not isinstance(rate, str):
+        rate = _signed((rate - 1.0) * 100.0, '%')
+    if not isinstance(volume, str):
+        volume = _signed(volume - 100.0, '%')
+    if isinstance(pitch, (int, float)) and not isinstance(pitch, bool):
+        pitch = f"{pitch}%"
+    if not isinstance(pitch, str) or not pitch.endswith(('%', 'Hz')):
+        raise ValueError(f"Pitch must be a number or an offset in % or Hz, got {pitch!r}")
+    if pitch.endswith('%'):
+        pitch = _signed(float(pitch[:-1]) / 100.0 * EDGE_REFERENCE_PITCH_HZ, 'Hz')
+    return {"rate": rate, "pitch": pitch, "volume": volume}
+
+
+class VoiceProfileRegistry:
+    def __init__(self, path=PROFILES_PATH, pitch_backend=None):
+        """
+        Load the profiles config and compile every profile
+
+        The file's mtime is checked on each lookup; when it changes the config
+        is reloaded, recompiling only profiles whose settings changed. A file
+        that fails to parse leaves the previous profiles in place.
+
+        Args:
+            pitch_backend: Optional pitch backend applied to every profile
+        """
+        self.path = Path(path)
+        self.pitch_backend = pitch_backend
+        self.profiles = {}
+        self.default = DEFAULT_PROFILE
+        self.sample_rates = DEFAULT_SAMPLE_RATES
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        try:
+            # Recorded before parsing so a broken file is reported once, not per request
+            self._mtime = self.path.stat().st_mtime_ns
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if not self.profiles:
+                log.warning("Voice profiles not found at %s, using the built-in March 7th voice", self.path)
+                self.profiles = {name: VoiceProfile(name, config, self.sample_rates, self.pitch_backend)
+                                 for name, config in BUILTIN_PROFILES.items()}
+            return
+        except (OSError, ValueError) as e:
+            log.error("Voice profiles not reloaded, keeping the previous ones: %s", e)
+            return
+
+        sample_rates = tuple(data.get("sample_rates", DEFAULT_SAMPLE_RATES))
+        profiles = {}
+        for name, config in data.get("profiles", {}).items():
+            current = self.profiles.get(name)
+            if current and current.config == config and sample_rates == self.sample_rates:
+                profiles[name] = current
+                continue
+            try:
+                profiles[name] = VoiceProfile(name, config, sample_rates, self.pitch_backend)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                log.error("Skipping voice profile '%s': %s", name, e)
+                if current:
+                    profiles[name] = current
+        self.sample_rates = sample_rates
+        self.profiles = profiles
+        self.default = data.get("default", DEFAULT_PROFILE)
+        log.info("Loaded %d voice profiles from %s", len(profiles), self.path)
+
+    def check_reload(self):
+        """Reload if the config file changed since it was last read."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def get(self, name=None):
+        """Profile by key or character name (case-insensitive); None gives the default."""
+        self.check_reload()
+        key = (name or self.default).lower()
+        for profile in self.profiles.values():
+            if key in (profile.name.lower(), profile.character.lower()):
+                return profile
+        raise ValueError(f"Unknown voice profile: {name}")
+
+    def names(self):
+        return sorted(self.profiles)